@@ -0,0 +1,179 @@
+"""
+Exporta 'filmes', 'usuarios' e 'avaliacoes' do PostgreSQL apontado por
+DATABASE_URL para arquivos colunares (Parquet ou Arrow IPC), para análises
+pesadas que não devem rodar no banco da API.
+
+    python analytics/exportar.py --destino exportacao --formato parquet
+
+Estrutura gerada em --destino:
+
+- filmes/genero=.../ano=.../   um diretório por gênero e ano (partições Hive);
+- avaliacoes/genero=.../ano=.../   cada avaliação na partição do seu filme;
+- usuarios/   sem partições, e sem a coluna 'senha';
+- exportacao.json   formato, data do banco, versões das tabelas e linhas.
+
+As três tabelas são lidas na mesma transação (REPEATABLE READ), então
+formam um retrato consistente mesmo com a API gravando. As linhas chegam
+do banco por um cursor no servidor e são gravadas em lotes, sem carregar
+nenhuma tabela inteira na memória.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+
+import psycopg2
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+
+TAMANHO_LOTE = 100000
+
+# Partições de filmes e avaliações
+PARTICOES = pa.schema([('genero', pa.string()), ('ano', pa.int32())])
+
+ESQUEMAS = {
+    'filmes': pa.schema([
+        ('id', pa.int32()),
+        ('titulo', pa.string()),
+        # Posição do título na ordenação (collation) do banco, para que o
+        # motor de relatórios ordene os títulos exatamente como o SQL
+        ('ordem_titulo', pa.int32()),
+        ('genero', pa.string()),
+        ('ano', pa.int32()),
+    ]),
+    'usuarios': pa.schema([
+        ('id', pa.int32()),
+        ('nome_de_usuario', pa.string()),
+        ('nome', pa.string()),
+        ('pais', pa.string()),
+        ('data_de_nascimento', pa.date32()),
+        ('faixa_etaria', pa.string()),
+    ]),
+    'avaliacoes': pa.schema([
+        ('id', pa.int32()),
+        ('usuario_id', pa.int32()),
+        ('filme_id', pa.int32()),
+        ('nota', pa.decimal128(3, 1)),
+        ('genero', pa.string()),
+        ('ano', pa.int32()),
+    ]),
+}
+
+CONSULTAS = {
+    'filmes': """
+        SELECT id, titulo, ROW_NUMBER() OVER (ORDER BY titulo)::int, genero, ano
+        FROM filmes
+    """,
+    'usuarios': """
+        SELECT id, nome_de_usuario, nome, pais, data_de_nascimento, faixa_etaria
+        FROM usuarios
+    """,
+    'avaliacoes': """
+        SELECT a.id, a.usuario_id, a.filme_id, a.nota, f.genero, f.ano
+        FROM avaliacoes AS a
+        LEFT JOIN filmes AS f ON f.id = a.filme_id
+        ORDER BY f.genero, f.ano
+    """,
+}
+
+EXTENSOES = {'parquet': 'parquet', 'ipc': 'arrow'}
+
+
+def lotes_da_consulta(conn, tabela):
+    """Lê a consulta da tabela por um cursor no servidor, em RecordBatches de TAMANHO_LOTE linhas."""
+    esquema = ESQUEMAS[tabela]
+    with conn.cursor(name=f"exportar_{tabela}") as cur:
+        cur.itersize = TAMANHO_LOTE
+        cur.execute(CONSULTAS[tabela])
+        while True:
+            linhas = cur.fetchmany(TAMANHO_LOTE)
+            if not linhas:
+                break
+            colunas = list(zip(*linhas))
+            yield pa.RecordBatch.from_arrays(
+                [pa.array(valores, type=campo.type) for valores, campo in zip(colunas, esquema)],
+                schema=esquema,
+            )
+
+
+def exportar_tabela(conn, tabela, destino, formato):
+    diretorio = os.path.join(destino, tabela)
+    # Partições antigas que não existem mais não podem sobrar no diretório
+    shutil.rmtree(diretorio, ignore_errors=True)
+    contador = {'linhas': 0}
+
+    def contar(lotes):
+        for lote in lotes:
+            contador['linhas'] += lote.num_rows
+            yield lote
+
+    ds.write_dataset(
+        contar(lotes_da_consulta(conn, tabela)),
+        diretorio,
+        schema=ESQUEMAS[tabela],
+        format=formato,
+        partitioning=None if tabela == 'usuarios' else ds.partitioning(PARTICOES, flavor='hive'),
+        basename_template=f"parte-{{i}}.{EXTENSOES[formato]}",
+        existing_data_behavior='overwrite_or_ignore',
+    )
+    return contador['linhas']
+
+
+def exportar(db_url, destino, formato):
+    conn = psycopg2.connect(db_url)
+    try:
+        with conn.cursor() as cur:
+            # Mesma atualização que a API faz antes do relatório por faixa etária
+            cur.execute("SELECT atualizar_faixas_etarias();")
+        conn.commit()
+
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        with conn.cursor() as cur:
+            cur.execute("SELECT CURRENT_DATE;")
+            data_do_banco = cur.fetchone()[0]
+            cur.execute("SELECT tabela, versao FROM versoes_tabelas;")
+            versoes = dict(cur.fetchall())
+
+        os.makedirs(destino, exist_ok=True)
+        linhas = {}
+        for tabela in ESQUEMAS:
+            inicio = time.perf_counter()
+            linhas[tabela] = exportar_tabela(conn, tabela, destino, formato)
+            print(f"✅ {linhas[tabela]} linhas de '{tabela}' em {time.perf_counter() - inicio:.2f}s.")
+        conn.commit()
+    finally:
+        conn.close()
+
+    metadados = {
+        'formato': formato,
+        'exportada_em': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'data_do_banco': data_do_banco.isoformat(),
+        'versoes': versoes,
+        'linhas': linhas,
+    }
+    with open(os.path.join(destino, 'exportacao.json'), 'w', encoding='utf-8') as f:
+        json.dump(metadados, f, ensure_ascii=False, indent=2)
+    return metadados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--destino', default='exportacao', help="Diretório da exportação (padrão: exportacao).")
+    parser.add_argument('--formato', choices=sorted(EXTENSOES), default='parquet',
+                        help="'parquet' (comprimido) ou 'ipc' (Arrow, lido direto do disco mapeado em memória).")
+    args = parser.parse_args()
+
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        sys.exit("A variável de ambiente DATABASE_URL não foi definida.")
+    print(f"Exportando para '{args.destino}' no formato {args.formato}...")
+    exportar(db_url, args.destino, args.formato)
+    print("🎉 Exportação concluída.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,393 @@
+"""
+Motor de relatórios sobre uma exportação colunar (analytics/exportar.py).
+Calcula os cinco relatórios da API a partir dos arquivos, sem consultar o
+PostgreSQL, e devolve o mesmo JSON que as rotas /api/<relatório>.
+
+    python analytics/relatorios.py exportacao                  # todos os relatórios
+    python analytics/relatorios.py exportacao --relatorio cinco-populares
+    python analytics/relatorios.py exportacao --comparar       # confere com o SQL da API
+
+Como funciona:
+
+- As avaliações são lidas em lotes de colunas, com os arquivos mapeados em
+  memória; o tamanho dos dados pode passar da RAM, porque só os
+  acumuladores (um por filme, por filme e faixa etária e por usuário) ficam
+  na memória.
+- Cada lote é agregado com NumPy (np.bincount pelos IDs), sem laços em
+  Python por avaliação.
+- As notas são somadas como inteiros em décimos e as médias são
+  arredondadas com aritmética inteira, como o NUMERIC do PostgreSQL
+  (ROUND arredonda metade para longe do zero), então os valores coincidem
+  com os do SQL, e não apenas se aproximam deles.
+
+Empates na ordenação (mesma média ou mesma contagem) não têm ordem
+definida no SQL; aqui são desempatados pelo ID do filme ou pelo nome.
+"""
+import os
+import sys
+import json
+import argparse
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api'))
+import consultas  # noqa: E402
+import serializacao  # noqa: E402
+
+from exportar import PARTICOES  # noqa: E402
+
+
+TAMANHO_LOTE = 1 << 20
+
+# Faixas na ordem das colunas da view notas_medias_por_filme_por_idade;
+# 'sem_usuario' reúne as avaliações sem usuário (entram em '50_mais' por filme)
+FAIXAS = ['criancas', 'adolescentes', 'jovens_adultos', 'adultos', '50_mais', 'sem_usuario']
+SEM_USUARIO = FAIXAS.index('sem_usuario')
+COLUNAS_FAIXA_ETARIA = [
+    'titulo', 'media_criancas_ate_12', 'media_adolescentes_13_a_17', 'media_jovens_adultos_18_a_29',
+    'media_adultos_30_a_49', 'media_50_mais', 'media_geral',
+]
+DEZ = pa.scalar(10, pa.decimal128(2, 0))
+
+
+# --- LEITURA ---
+
+class Exportacao:
+    """Os arquivos de uma exportação, abertos com mapeamento em memória."""
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        with open(os.path.join(diretorio, 'exportacao.json'), encoding='utf-8') as f:
+            self.metadados = json.load(f)
+        self._sistema = fs.LocalFileSystem(use_mmap=True)
+
+    def dataset(self, tabela):
+        particoes = None if tabela == 'usuarios' else ds.partitioning(PARTICOES, flavor='hive')
+        return ds.dataset(
+            os.path.join(self.diretorio, tabela), format=self.metadados['formato'],
+            partitioning=particoes, filesystem=self._sistema,
+        )
+
+    def tabela(self, tabela, colunas):
+        """Tabela pequena (filmes, usuários) inteira na memória."""
+        return self.dataset(tabela).to_table(columns=colunas)
+
+    def lotes(self, tabela, colunas):
+        return self.dataset(tabela).to_batches(columns=colunas, batch_size=TAMANHO_LOTE)
+
+
+def _ids(coluna):
+    """IDs como int64, com -1 no lugar de nulos."""
+    return np.asarray(pc.fill_null(coluna, -1).to_numpy(zero_copy_only=False), dtype=np.int64)
+
+
+def _por_id(ids, valores, tamanho, padrao):
+    """Array indexado pelo ID: valores[i] na posição ids[i], 'padrao' nas demais."""
+    resultado = np.full(tamanho, padrao, dtype=np.asarray(valores).dtype if len(valores) else np.int64)
+    resultado[ids] = valores
+    return resultado
+
+
+# --- AGREGAÇÃO ---
+
+class Acumuladores:
+    """
+    Os mesmos resumos que os gatilhos mantêm no banco (resumo_filmes,
+    resumo_filmes_faixas e resumo_paises), calculados a partir das
+    avaliações exportadas. Somas de notas em décimos (inteiros).
+    """
+
+    def __init__(self, exportacao):
+        filmes = exportacao.tabela('filmes', ['id', 'titulo', 'ordem_titulo', 'genero', 'ano'])
+        usuarios = exportacao.tabela('usuarios', ['id', 'pais', 'faixa_etaria'])
+        self.filmes = {coluna: filmes[coluna].to_pylist() for coluna in filmes.column_names}
+        self.filme_ids = _ids(filmes['id'])
+        usuario_ids = _ids(usuarios['id'])
+
+        self.n_filmes = int(self.filme_ids.max(initial=-1)) + 1
+        self.n_usuarios = int(usuario_ids.max(initial=-1)) + 1
+        self.filme_existe = _por_id(self.filme_ids, np.ones(len(self.filme_ids), dtype=bool), self.n_filmes, False)
+        self.usuario_existe = _por_id(usuario_ids, np.ones(len(usuario_ids), dtype=bool), self.n_usuarios, False)
+        # Faixa nula equivale a 'sem_usuario', como no COALESCE dos gatilhos
+        codigos_faixa = np.array(
+            [FAIXAS.index(f) if f in FAIXAS else SEM_USUARIO for f in usuarios['faixa_etaria'].to_pylist()],
+            dtype=np.int64,
+        )
+        self.faixa_do_usuario = _por_id(usuario_ids, codigos_faixa, self.n_usuarios, SEM_USUARIO)
+        self.pais_do_usuario = usuarios['pais'].to_pylist()
+        self.usuario_ids = usuario_ids
+
+        self.quantidade_avaliacoes = np.zeros(self.n_filmes, dtype=np.int64)
+        self.quantidade_notas = np.zeros(self.n_filmes, dtype=np.int64)
+        self.soma_notas = np.zeros(self.n_filmes, dtype=np.int64)
+        self.quantidade_faixas = np.zeros(self.n_filmes * len(FAIXAS), dtype=np.int64)
+        self.soma_faixas = np.zeros(self.n_filmes * len(FAIXAS), dtype=np.int64)
+        self.avaliacoes_usuario = np.zeros(self.n_usuarios, dtype=np.int64)
+
+    def _contar(self, indices, tamanho, pesos=None):
+        # As somas são de inteiros (décimos), exatas em float64 até 2**53
+        contagem = np.bincount(indices, weights=pesos, minlength=tamanho)
+        return np.rint(contagem).astype(np.int64) if pesos is not None else contagem
+
+    def adicionar(self, lote):
+        usuario = _ids(lote.column('usuario_id'))
+        filme = _ids(lote.column('filme_id'))
+        nota = lote.column('nota')
+        tem_nota = np.asarray(nota.is_valid().to_numpy(zero_copy_only=False))
+        decimos = np.asarray(
+            pc.fill_null(pc.cast(pc.multiply(nota, DEZ), pa.int64()), 0).to_numpy(zero_copy_only=False),
+            dtype=np.int64,
+        )
+
+        # Avaliações de filmes que não existem mais ficam fora dos resumos
+        com_filme = (filme >= 0) & (filme < self.n_filmes)
+        com_filme[com_filme] = self.filme_existe[filme[com_filme]]
+        self.quantidade_avaliacoes += self._contar(filme[com_filme], self.n_filmes)
+
+        com_nota = com_filme & tem_nota
+        self.quantidade_notas += self._contar(filme[com_nota], self.n_filmes)
+        self.soma_notas += self._contar(filme[com_nota], self.n_filmes, decimos[com_nota])
+
+        com_usuario = (usuario >= 0) & (usuario < self.n_usuarios)
+        com_usuario[com_usuario] = self.usuario_existe[usuario[com_usuario]]
+        faixa = np.full(len(usuario), SEM_USUARIO, dtype=np.int64)
+        faixa[com_usuario] = self.faixa_do_usuario[usuario[com_usuario]]
+        indice_faixa = filme[com_nota] * len(FAIXAS) + faixa[com_nota]
+        self.quantidade_faixas += self._contar(indice_faixa, len(self.quantidade_faixas))
+        self.soma_faixas += self._contar(indice_faixa, len(self.soma_faixas), decimos[com_nota])
+
+        self.avaliacoes_usuario += self._contar(usuario[com_usuario], self.n_usuarios)
+
+
+def agregar(exportacao):
+    acumuladores = Acumuladores(exportacao)
+    for lote in exportacao.lotes('avaliacoes', ['usuario_id', 'filme_id', 'nota']):
+        acumuladores.adicionar(lote)
+    return acumuladores
+
+
+def medias(soma_decimos, quantidade, casas):
+    """
+    ROUND((soma_decimos / 10) / quantidade, casas) do PostgreSQL para
+    arrays, em aritmética inteira: metade arredonda para longe do zero.
+    Devolve uma lista de floats (como a API lê o NUMERIC), com None onde a
+    quantidade é zero (o NULLIF das views).
+    """
+    soma_decimos = np.asarray(soma_decimos, dtype=np.int64)
+    quantidade = np.asarray(quantidade, dtype=np.int64)
+    numerador = soma_decimos * 10 ** casas
+    divisor = 10 * np.maximum(quantidade, 1)
+    inteiro = np.sign(numerador) * ((2 * np.abs(numerador) + divisor) // (2 * divisor))
+    valores = (inteiro / 10 ** casas).tolist()
+    return [None if q == 0 else v for v, q in zip(valores, quantidade.tolist())]
+
+
+def _codigos(valores):
+    """
+    Código de cada valor na ordem alfabética dos valores distintos (nulos
+    por último), para agrupar e desempatar com NumPy. Devolve (códigos, distintos).
+    """
+    distintos = sorted(set(valores), key=lambda v: (v is None, v or ''))
+    posicao = {valor: i for i, valor in enumerate(distintos)}
+    return np.array([posicao[v] for v in valores], dtype=np.int64), distintos
+
+
+def _posicao_no_grupo(grupos_ordenados):
+    """1, 2, 3... dentro de cada sequência de códigos iguais de um array ordenado."""
+    indices = np.arange(len(grupos_ordenados))
+    inicio = np.r_[True, grupos_ordenados[1:] != grupos_ordenados[:-1]] if len(indices) else np.zeros(0, dtype=bool)
+    return indices - np.maximum.accumulate(np.where(inicio, indices, 0)) + 1
+
+
+# --- RELATÓRIOS ---
+# Cada função recebe os acumuladores e devolve (colunas, linhas) como o
+# cursor da API, para que a formatação de consultas.RELATORIOS produza o
+# mesmo JSON. Os arrays por filme seguem a ordem de 'filme_ids'.
+
+def _por_filme(a, array):
+    return array[a.filme_ids]
+
+
+def top_filmes_genero(a):
+    quantidade, soma = _por_filme(a, a.quantidade_notas), _por_filme(a, a.soma_notas)
+    generos, nomes_generos = _codigos(a.filmes['genero'])
+    com_nota = np.flatnonzero(quantidade > 0)
+    # Gênero, média exata (decrescente) e ID do filme, como o ROW_NUMBER do SQL
+    media = soma[com_nota] / quantidade[com_nota]
+    ordem = com_nota[np.lexsort((a.filme_ids[com_nota], -media, generos[com_nota]))]
+    ranking = _posicao_no_grupo(generos[ordem])
+    ordem, ranking = ordem[ranking <= 10], ranking[ranking <= 10]
+    notas = medias(soma[ordem], quantidade[ordem], 1)
+    linhas = [
+        (nomes_generos[generos[i]], a.filmes['titulo'][i], nota, int(posicao))
+        for i, nota, posicao in zip(ordem.tolist(), notas, ranking.tolist())
+    ]
+    return ['genero', 'titulo', 'nota_media', 'ranking'], linhas
+
+
+def cinco_populares(a):
+    quantidade = _por_filme(a, a.quantidade_avaliacoes)
+    avaliados = np.flatnonzero(quantidade > 0)
+    ordem = avaliados[np.lexsort((a.filme_ids[avaliados], -quantidade[avaliados]))][:5]
+    linhas = [
+        (a.filmes['titulo'][i], a.filmes['genero'][i], a.filmes['ano'][i], int(quantidade[i]))
+        for i in ordem.tolist()
+    ]
+    return ['titulo', 'genero', 'ano', 'quantidade_avaliacoes'], linhas
+
+
+def avaliacoes_pais(a):
+    paises, nomes_paises = _codigos(a.pais_do_usuario)
+    total = np.rint(np.bincount(
+        paises, weights=a.avaliacoes_usuario[a.usuario_ids], minlength=len(nomes_paises),
+    )).astype(np.int64)
+    com_avaliacoes = np.flatnonzero(total > 0)
+    ordem = com_avaliacoes[np.lexsort((com_avaliacoes, -total[com_avaliacoes]))]
+    return ['pais', 'total_avaliacoes'], [(nomes_paises[i], int(total[i])) for i in ordem.tolist()]
+
+
+def notas_medias_faixa_etaria(a):
+    quantidade = a.quantidade_faixas.reshape(-1, len(FAIXAS))[a.filme_ids]
+    soma = a.soma_faixas.reshape(-1, len(FAIXAS))[a.filme_ids]
+    colunas_de_medias = [
+        medias(soma[:, i], quantidade[:, i], 2) for i in range(FAIXAS.index('50_mais'))
+    ] + [
+        # '50_mais' por filme inclui as avaliações sem usuário
+        medias(soma[:, 4:].sum(axis=1), quantidade[:, 4:].sum(axis=1), 2),
+        medias(soma.sum(axis=1), quantidade.sum(axis=1), 2),
+    ]
+    ordem = np.argsort(np.array(a.filmes['ordem_titulo'], dtype=np.int64), kind='stable')
+    linhas = [(a.filmes['titulo'][i], *(coluna[i] for coluna in colunas_de_medias)) for i in ordem.tolist()]
+    return COLUNAS_FAIXA_ETARIA, linhas
+
+
+def generos_melhor_avaliacao(a):
+    quantidade, soma = _por_filme(a, a.quantidade_notas), _por_filme(a, a.soma_notas)
+    generos, nomes_generos = _codigos(a.filmes['genero'])
+    com_nota = quantidade > 0
+    quantidade_genero = np.bincount(generos[com_nota], weights=quantidade[com_nota], minlength=len(nomes_generos))
+    soma_genero = np.bincount(generos[com_nota], weights=soma[com_nota], minlength=len(nomes_generos))
+    quantidade_genero = np.rint(quantidade_genero).astype(np.int64)
+    soma_genero = np.rint(soma_genero).astype(np.int64)
+
+    presentes = np.flatnonzero(quantidade_genero > 0)
+    notas = medias(soma_genero[presentes], quantidade_genero[presentes], 2)
+    # Ordena pela média já arredondada, como o ORDER BY do SQL
+    ordem = np.lexsort((presentes, -np.array(notas, dtype=float)))
+    return ['genero', 'nota_media'], [(nomes_generos[presentes[i]], notas[i]) for i in ordem.tolist()]
+
+
+RELATORIOS = {
+    'top-filmes-genero': top_filmes_genero,
+    'cinco-populares': cinco_populares,
+    'avaliacoes-pais': avaliacoes_pais,
+    'notas-medias-faixa-etaria': notas_medias_faixa_etaria,
+    'generos-melhor-avaliacao': generos_melhor_avaliacao,
+}
+
+
+def calcular(exportacao, nomes=None):
+    """Os relatórios pedidos (todos, por padrão) no formato JSON das rotas da API."""
+    acumuladores = agregar(exportacao)
+    resultados = {}
+    for nome in nomes or RELATORIOS:
+        colunas, linhas = RELATORIOS[nome](acumuladores)
+        resultados[nome] = consultas.RELATORIOS[nome][2](colunas, linhas)
+    return resultados
+
+
+# --- COMPARAÇÃO COM O SQL ---
+
+# Campo pelo qual cada lista é ordenada no SQL e, se houver, o campo de
+# posição; dentro de um empate a ordem (e a posição) não é definida
+ORDENACAO = {
+    'top-filmes-genero': ('nota_media', 'posicao_no_genero'),
+    'cinco-populares': (None, None),
+    'avaliacoes-pais': ('total_avaliacoes', None),
+    'notas-medias-faixa-etaria': (None, None),
+    'generos-melhor-avaliacao': ('nota_media', None),
+}
+
+
+def _empates(itens, chave, posicao):
+    """Agrupa itens consecutivos com a mesma chave: [(chave, itens sem a posição, posições)]."""
+    grupos = []
+    for item in itens:
+        valor = item.get(chave)
+        if not grupos or grupos[-1][0] != valor:
+            grupos.append((valor, [], []))
+        grupos[-1][1].append(serializacao.dumps({k: v for k, v in item.items() if k != posicao}))
+        grupos[-1][2].append(item.get(posicao))
+    return [(valor, sorted(itens), sorted(posicoes, key=str)) for valor, itens, posicoes in grupos]
+
+
+def equivalentes(nome, esperado, obtido):
+    """True se os resultados são iguais, a menos da ordem dentro de empates."""
+    chave, posicao = ORDENACAO[nome]
+    if chave is None:
+        return esperado == obtido
+    if isinstance(esperado, dict):
+        return esperado.keys() == obtido.keys() and all(
+            _empates(esperado[k], chave, posicao) == _empates(obtido[k], chave, posicao) for k in esperado
+        )
+    return _empates(esperado, chave, posicao) == _empates(obtido, chave, posicao)
+
+
+def resultados_do_banco(db_url, nomes):
+    """Os mesmos relatórios executados no PostgreSQL com o SQL e a formatação da API."""
+    import psycopg2
+    conn = psycopg2.connect(db_url)
+    serializacao.registrar_tipos(conn)
+    try:
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        with conn.cursor() as cur:
+            cur.execute("SELECT tabela, versao FROM versoes_tabelas;")
+            versoes = dict(cur.fetchall())
+            resultados = {}
+            for nome in nomes:
+                consulta, parametros, formatar = consultas.RELATORIOS[nome]
+                cur.execute(consulta, parametros)
+                colunas = [d[0] for d in cur.description]
+                resultados[nome] = formatar(colunas, cur.fetchall())
+        conn.commit()
+    finally:
+        conn.close()
+    return versoes, resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('diretorio', help="Diretório gerado por analytics/exportar.py.")
+    parser.add_argument('--relatorio', action='append', choices=list(RELATORIOS),
+                        help="Relatório a calcular (pode repetir); padrão: todos.")
+    parser.add_argument('--comparar', action='store_true',
+                        help="Executa também o SQL da API no banco de DATABASE_URL e compara os resultados.")
+    args = parser.parse_args()
+    nomes = args.relatorio or list(RELATORIOS)
+
+    exportacao = Exportacao(args.diretorio)
+    resultados = calcular(exportacao, nomes)
+
+    if not args.comparar:
+        print(serializacao.dumps(resultados[nomes[0]] if len(nomes) == 1 else resultados))
+        return
+
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        sys.exit("A variável de ambiente DATABASE_URL não foi definida.")
+    versoes, do_banco = resultados_do_banco(db_url, nomes)
+    if versoes != exportacao.metadados['versoes']:
+        print("⚠️ O banco mudou desde a exportação; diferenças são esperadas.")
+    diferentes = [nome for nome in nomes if not equivalentes(nome, do_banco[nome], resultados[nome])]
+    for nome in nomes:
+        print(f"{nome}: {'DIFERENTE' if nome in diferentes else 'IGUAL'}")
+    if diferentes:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
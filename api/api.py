@@ -1,19 +1,93 @@
 import os
-import decimal
+import logging
 import psycopg2
 from psycopg2 import sql
-from flask import Flask, jsonify, request
+from psycopg2.errors import QueryCanceled
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 
 
-from database import get_db_connection
+import consultas
+import cache_http
+import serializacao
+import particoes
+import recomendacoes
+import aproximados
+from database import conexao, estatisticas_pool
+import preparadas
+from preparadas import Preparada
+from cache import cache
 from filmes_logic import registrar_filme
 from usuarios_logic import registrar_usuario
-from avaliacoes_logic import registrar_avaliacao
+from avaliacoes_logic import registrar_avaliacao, registrar_avaliacoes_em_lote, validar_avaliacao
+from fila_avaliacoes import FilaCheia, criar_fila_do_ambiente
+from metricas import instrumentar, registro as registro_metricas
 
 
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
+)
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 CORS(app) 
+instrumentar(app)
+cache_http.configurar(app)
+
+# As chaves do cache incluem as versões das tabelas no banco, comuns a todos os workers
+cache.versoes_externas = cache_http.versoes_de
+cache.data_externa = cache_http.data_do_banco
+
+# Fila local de avaliações (opcional, FILA_AVALIACOES=1)
+fila_avaliacoes = criar_fila_do_ambiente()
+
+# Recomendações em memória (opcional, RECOMENDACOES=1; carregadas em segundo plano)
+recomendacoes.recomendador = recomendacoes.criar_recomendador_do_ambiente()
+
+# Esboços das avaliações para ?aprox=1 (opcional, AGREGADOS_APROXIMADOS=1; carregados em segundo plano)
+aproximados.agregados = aproximados.criar_agregados_do_ambiente()
+
+# Partições mensais de 'avaliacoes' criadas antes de cada mês começar
+manutencao_particoes = particoes.criar_manutencao_do_ambiente()
+
+
+# --- TEMPO LIMITE DAS CONSULTAS ---
+
+# statement_timeout de cada rota, em ms: um comando que passa disso é
+# cancelado pelo banco e a rota responde 503, em vez de prender o worker.
+# Nas respostas em fluxo, o limite vale para cada lote lido do cursor.
+TEMPOS_LIMITE_MS = {
+    '/api/top-filmes-genero': 2000,
+    '/api/cinco-populares': 2000,
+    '/api/avaliacoes-pais': 2000,
+    '/api/notas-medias-faixa-etaria': 5000,
+    '/api/generos-melhor-avaliacao': 2000,
+    '/api/dashboard': 5000,
+    '/api/filmes/em-alta': 3000,
+    '/api/usuarios/buscar': 2000,
+    '/api/filmes/buscar': 2000,
+    '/api/usuarios/<int:usuario_id>/recomendacoes': 1000,
+    '/api/cadastrar-filme': 1000,
+    '/api/cadastrar-usuario': 1000,
+    '/api/cadastrar-avaliacao': 1000,
+    '/api/avaliacoes/batch': 10000,
+}
+TEMPO_LIMITE_HABILITADO = os.environ.get("SQL_TEMPO_LIMITE", "1") == "1"
+
+
+def _conexao(replica=None):
+    """conexao() com o tempo limite da rota atual (TEMPOS_LIMITE_MS)."""
+    regra = request.url_rule.rule if request.url_rule else None
+    return conexao(replica, tempo_limite_ms=TEMPOS_LIMITE_MS.get(regra) if TEMPO_LIMITE_HABILITADO else None)
+
+
+@app.errorhandler(QueryCanceled)
+def consulta_cancelada(e):
+    logger.warning("Comando cancelado em %s: %s", request.path, str(e).strip())
+    resposta = jsonify({"error": "O banco de dados demorou demais para responder. Tente novamente."})
+    resposta.headers['Retry-After'] = '5'
+    return resposta, 503
 
 
 # --- NOVA ROTA DE HEALTH CHECK ---
@@ -26,247 +100,549 @@ def health_check():
     return jsonify({"status": "ok"}), 200
 
 
+@app.route('/api/health/pool', methods=['GET'])
+def health_pool():
+    """Estatísticas do pool de conexões deste processo."""
+    return jsonify(estatisticas_pool()), 200
+
+
+@app.route('/api/health/cache', methods=['GET'])
+def health_cache():
+    """Estatísticas do cache de respostas deste processo."""
+    return jsonify(cache.estatisticas()), 200
+
+
+@app.route('/api/health/fila', methods=['GET'])
+def health_fila():
+    """Profundidade e latência de descarga da fila de avaliações."""
+    if fila_avaliacoes is None:
+        return jsonify({'habilitada': False}), 200
+    return jsonify({'habilitada': True, **fila_avaliacoes.metricas()}), 200
+
+
+@app.route('/api/health/recomendacoes', methods=['GET'])
+def health_recomendacoes():
+    """Tamanho e memória da matriz de recomendações deste processo."""
+    if recomendacoes.recomendador is None:
+        return jsonify({'habilitadas': False}), 200
+    return jsonify({'habilitadas': True, **recomendacoes.recomendador.estatisticas()}), 200
+
+
+@app.route('/api/health/agregados', methods=['GET'])
+def health_agregados():
+    """Tamanho, memória e limites de erro dos agregados aproximados deste processo."""
+    if aproximados.agregados is None:
+        return jsonify({'habilitados': False}), 200
+    return jsonify({'habilitados': True, **aproximados.agregados.estatisticas()}), 200
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Métricas deste processo no formato de exposição do Prometheus."""
+    pool = estatisticas_pool()
+    estatisticas_cache = cache.estatisticas()
+    extras = [
+        ('movieflix_pool_conexoes_em_uso', 'gauge', 'Conexões do pool emprestadas.', pool.get('em_uso', 0)),
+        ('movieflix_pool_conexoes_livres', 'gauge', 'Conexões do pool livres.', pool.get('livres', 0)),
+        ('movieflix_pool_timeouts_total', 'counter', 'Pedidos de conexão que esgotaram o tempo de espera.', pool.get('total_timeouts', 0)),
+        ('movieflix_cache_acertos_total', 'counter', 'Respostas servidas pelo cache.', estatisticas_cache['acertos']),
+        ('movieflix_cache_falhas_total', 'counter', 'Respostas que não estavam no cache.', estatisticas_cache['falhas']),
+    ]
+    if fila_avaliacoes is not None:
+        extras.append(('movieflix_fila_profundidade', 'gauge', 'Avaliações pendentes na fila local.', fila_avaliacoes.profundidade()))
+    return Response(registro_metricas.exportar(extras), mimetype='text/plain; version=0.0.4')
+
+
 # --- ROTAS DE CADASTRO (POST) ---
 
 @app.route('/api/cadastrar-filme', methods=['POST'])
 def rota_cadastrar_filme():
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
-    try:
+    with _conexao() as conn:
+        if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
         response, status = registrar_filme(conn, request.get_json())
         return jsonify(response), status
-    finally:
-        if conn: conn.close()
 
 @app.route('/api/cadastrar-usuario', methods=['POST'])
 def rota_cadastrar_usuario():
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
-    try:
+    with _conexao() as conn:
+        if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
         response, status = registrar_usuario(conn, request.get_json())
         return jsonify(response), status
-    finally:
-        if conn: conn.close()
 
 @app.route('/api/cadastrar-avaliacao', methods=['POST'])
 def rota_cadastrar_avaliacao():
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
-    try:
+    if fila_avaliacoes is not None:
+        return enfileirar_avaliacao(request.get_json(silent=True))
+
+    with _conexao() as conn:
+        if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
         response, status = registrar_avaliacao(conn, request.get_json())
         return jsonify(response), status
-    finally:
-        if conn: conn.close()
+
+def enfileirar_avaliacao(dados):
+    """Grava a avaliação na fila local e responde sem esperar o banco."""
+    erro = validar_avaliacao(dados)
+    if erro:
+        return jsonify({'message': f'Erro: {erro}'}), 400
+    try:
+        id_fila = fila_avaliacoes.enfileirar(dados['usuario_id'], dados['filme_id'], dados['nota'])
+    except FilaCheia as e:
+        resposta = jsonify({'message': str(e)})
+        resposta.headers['Retry-After'] = '1'
+        return resposta, 503
+    return jsonify({'message': 'Avaliação recebida e será registrada em instantes.', 'id_fila': id_fila}), 202
+
+@app.route('/api/avaliacoes/batch', methods=['POST'])
+def rota_cadastrar_avaliacoes_em_lote():
+    """
+    Recebe várias avaliações de uma vez: uma lista JSON, um objeto
+    {"avaliacoes": [...]} ou NDJSON (Content-Type application/x-ndjson,
+    um objeto por linha).
+    """
+    if request.mimetype == 'application/x-ndjson':
+        registros = []
+        for linha in request.get_data(as_text=True).splitlines():
+            if not linha.strip():
+                continue
+            try:
+                registros.append(serializacao.loads(linha))
+            except ValueError:
+                # Linha ilegível vira um registro inválido na mesma posição
+                registros.append(None)
+    else:
+        registros = request.get_json(silent=True)
+        if isinstance(registros, dict):
+            registros = registros.get('avaliacoes')
+
+    with _conexao() as conn:
+        if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
+        response, status = registrar_avaliacoes_em_lote(conn, registros)
+        return jsonify(response), status
+
+
+# --- RESPOSTAS EM FLUXO ---
+
+TAMANHO_LOTE_CURSOR = 1000
+
+
+def _array_json_do_cursor(conn, query, params, linha_para_dict):
+    """
+    Executa a consulta em um cursor nomeado (do lado do servidor) e gera o
+    array JSON aos pedaços, lendo TAMANHO_LOTE_CURSOR linhas por vez. O
+    primeiro lote é lido antes do primeiro pedaço, então erros da consulta
+    aparecem antes de qualquer byte da resposta ser enviado.
+    """
+    if isinstance(query, Preparada):
+        # EXECUTE não cabe em um cursor nomeado: as linhas (poucas, como as
+        # das buscas) chegam de uma vez e o JSON continua sendo gerado aos lotes
+        cur = conn.cursor()
+        query.executar(cur, params)
+    else:
+        cur = conn.cursor(name='resposta_em_fluxo')
+        cur.execute(query, params)
+    linhas = cur.fetchmany(TAMANHO_LOTE_CURSOR)
+    colunas = [desc[0] for desc in cur.description]
+
+    yield b'['
+    separador = b''
+    while linhas:
+        yield separador + app.json.itens_de_array([linha_para_dict(colunas, linha) for linha in linhas])
+        separador = b','
+        linhas = cur.fetchmany(TAMANHO_LOTE_CURSOR)
+    yield b']\n'
+    cur.close()
+
+
+def _fluxo_com_conexao(query, params, linha_para_dict):
+    with _conexao(cache_http.replica_da_requisicao()) as conn:
+        if conn is None:
+            raise ConnectionError("Falha na conexão com o banco.")
+        yield from _array_json_do_cursor(conn, query, params, linha_para_dict)
+
+
+def _resposta_em_fluxo(query, params, linha_para_dict):
+    """
+    Devolve uma Response que transmite o resultado da consulta como array
+    JSON. A conexão fica emprestada até o último pedaço ser enviado.
+    """
+    fluxo = _fluxo_com_conexao(query, params, linha_para_dict)
+    primeiro = next(fluxo)
+
+    def pedacos():
+        try:
+            yield primeiro
+            yield from fluxo
+        finally:
+            fluxo.close()
+
+    return Response(pedacos(), mimetype='application/json')
 
 
 # --- ROTAS DE CONSULTA (GET) ---
 
+# O SQL e a formatação de cada relatório ficam em consultas.py, junto com a
+# API assíncrona (api_async.py), para que as duas respondam o mesmo JSON.
+# Relatórios, dashboard e buscas leem de uma réplica, se houver
+# (DATABASE_READ_URLS); cadastros e a atualização das faixas etárias
+# gravam no primário.
+
+def _relatorio(consulta, formatar, params=None):
+    with _conexao(cache_http.replica_da_requisicao()) as conn:
+        if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
+
+        try:
+            cur = conn.cursor()
+            consulta.executar(cur, params)
+            # É preciso pegar os nomes das colunas para criar o dicionário depois
+            column_names = [desc[0] for desc in cur.description]
+            data = cur.fetchall()
+            cur.close()
+            return jsonify(formatar(column_names, data))
+        except QueryCanceled:
+            raise
+        except Exception as e:
+            logger.exception("Erro em %s", request.path)
+            return jsonify({"error": str(e)}), 500
+
 @app.route('/api/top-filmes-genero', methods=['GET'])
+@cache_http.condicional(('filmes', 'avaliacoes'), cache_http.CACHE_CONTROL_RELATORIOS)
+@cache.rota(ttl=60, tabelas=('filmes', 'avaliacoes'))
 def top_filmes_por_genero():
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
-    
-    try:
-        cur = conn.cursor()
-        query = """
-            WITH FilmesRanqueados AS (
-                SELECT
-                    f.genero,
-                    f.titulo,
-                    ROUND(AVG(a.nota), 1) as nota_media,
-                    ROW_NUMBER() OVER (PARTITION BY f.genero ORDER BY AVG(a.nota) DESC) as ranking
-                FROM
-                    filmes AS f
-                JOIN
-                    avaliacoes AS a ON f.id = a.filme_id
-                GROUP BY
-                    f.genero, f.titulo
-            )
-            SELECT genero, titulo, nota_media, ranking
-            FROM FilmesRanqueados
-            WHERE ranking <= 10
-            ORDER BY genero, nota_media DESC;
-        """
-        cur.execute(query)
-        data = cur.fetchall()
-        cur.close()
-
-        result = {}
-        for genero, titulo, nota, ranking in data:
-            if genero not in result:
-                result[genero] = []
-            result[genero].append({'titulo': titulo, 'nota_media': float(nota), 'posicao_no_genero': int(ranking)})
-        
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn: conn.close()
+    # Lê os resumos por filme mantidos pelos gatilhos de 'avaliacoes'
+    return _relatorio(preparadas.RELATORIOS['top-filmes-genero'], consultas.formatar_top_filmes_genero)
 
 @app.route('/api/cinco-populares', methods=['GET'])
 def cinco_populares():
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
+    if _usar_aproximados():
+        return _cinco_populares_aproximado()
+    return _cinco_populares_exato()
 
-    try:
-        cur = conn.cursor()
-        query = """
-            SELECT
-                f.titulo, f.genero, f.ano, COUNT(a.filme_id) AS quantidade_avaliacoes
-            FROM
-                filmes AS f
-            JOIN
-                avaliacoes AS a ON f.id = a.filme_id
-            GROUP BY
-                f.id, f.titulo, f.genero, f.ano
-            ORDER BY
-                quantidade_avaliacoes DESC
-            LIMIT 5;
-        """
-        cur.execute(query)
-        # É preciso pegar os nomes das colunas para criar o dicionário depois
-        column_names = [desc[0] for desc in cur.description]
-        data = cur.fetchall()
-        cur.close()
-
-        result = [
-            {'indice': indice, **dict(zip(column_names, row))} 
-            for indice, row in enumerate(data, start=1)
-        ]
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn: conn.close()
+
+@cache_http.condicional(('filmes', 'avaliacoes'), cache_http.CACHE_CONTROL_RELATORIOS)
+@cache.rota(ttl=60, tabelas=('filmes', 'avaliacoes'))
+def _cinco_populares_exato():
+    return _relatorio(preparadas.RELATORIOS['cinco-populares'], consultas.formatar_cinco_populares)
 
 
 @app.route('/api/avaliacoes-pais', methods=['GET'])
 def avaliacoes_por_pais():
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
+    if _usar_aproximados():
+        return _avaliacoes_por_pais_aproximado()
+    return _avaliacoes_por_pais_exato()
 
-    try:
+
+@cache_http.condicional(('usuarios', 'avaliacoes'), cache_http.CACHE_CONTROL_RELATORIOS)
+@cache.rota(ttl=60, tabelas=('usuarios', 'avaliacoes'))
+def _avaliacoes_por_pais_exato():
+    return _relatorio(preparadas.RELATORIOS['avaliacoes-pais'], consultas.formatar_avaliacoes_pais)
+
+
+# --- AGREGADOS APROXIMADOS ---
+# Com ?aprox=1, as contagens vêm dos esboços em memória (aproximados.py), sem
+# ler as avaliações no banco, e cada item traz também os avaliadores
+# distintos. Os esboços são de cada worker, e cada um sincroniza no seu
+# ritmo, então essas respostas não usam a ETag das versões das tabelas nem o
+# cache da API: a ETag é fraca e calculada do próprio corpo. Com os esboços
+# desligados (AGREGADOS_APROXIMADOS=0), ?aprox=1 recebe a resposta exata.
+
+def _usar_aproximados():
+    pedido = request.args.get('aprox', '0').lower() in ('1', 'true', 'sim')
+    return pedido and aproximados.agregados is not None
+
+
+def _agregados_prontos():
+    agregados = aproximados.agregados
+    return agregados if agregados is not None and agregados.pronto else None
+
+
+def _agregados_indisponiveis():
+    resposta = jsonify({"error": "Agregados aproximados indisponíveis no momento."})
+    resposta.headers['Retry-After'] = '5'
+    return resposta, 503
+
+
+@cache_http.por_conteudo(cache_http.CACHE_CONTROL_RELATORIOS)
+def _avaliacoes_por_pais_aproximado():
+    agregados = _agregados_prontos()
+    if agregados is None:
+        return _agregados_indisponiveis()
+    return jsonify([
+        {'pais': pais, 'total_avaliacoes': total, 'avaliadores_distintos': avaliadores}
+        for pais, total, avaliadores in agregados.por_pais()
+    ])
+
+
+@cache_http.por_conteudo(cache_http.CACHE_CONTROL_RELATORIOS)
+def _cinco_populares_aproximado():
+    agregados = _agregados_prontos()
+    if agregados is None:
+        return _agregados_indisponiveis()
+    # Alguns candidatos a mais, caso um filme tenha sido apagado desde a última recarga
+    populares = agregados.mais_avaliados(10)
+    with _conexao(cache_http.replica_da_requisicao()) as conn:
+        if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
         cur = conn.cursor()
-        query = """
-            SELECT u.pais, COUNT(a.id) AS total_avaliacoes
-            FROM avaliacoes AS a
-            JOIN usuarios AS u ON a.usuario_id = u.id
-            GROUP BY u.pais
-            ORDER BY total_avaliacoes DESC;
-        """
-        cur.execute(query)
-        data = cur.fetchall()
-        cur.close()
-        
-        result = [{'pais': pais, 'total_avaliacoes': count} for pais, count in data]
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn: conn.close()
+        try:
+            cur.execute("SELECT id, titulo, genero, ano FROM filmes WHERE id = ANY(%s)", ([f for f, _, _ in populares],))
+            filmes = {linha[0]: linha for linha in cur.fetchall()}
+            conn.commit()
+        except QueryCanceled:
+            raise
+        except Exception as e:
+            logger.exception("Erro em %s", request.path)
+            conn.rollback()
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cur.close()
+
+    populares = [p for p in populares if p[0] in filmes][:5]
+    return jsonify([
+        {'indice': indice, 'titulo': filmes[f][1], 'genero': filmes[f][2], 'ano': filmes[f][3],
+         'quantidade_avaliacoes': quantidade, 'avaliadores_distintos': avaliadores}
+        for indice, (f, quantidade, avaliadores) in enumerate(populares, start=1)
+    ])
 
 
 @app.route('/api/notas-medias-faixa-etaria', methods=['GET'])
+@cache_http.condicional(('filmes', 'usuarios', 'avaliacoes'), cache_http.CACHE_CONTROL_FAIXA_ETARIA, por_data=True)
+@cache.rota(ttl=300, tabelas=('filmes', 'usuarios', 'avaliacoes'), por_data=True)
 def notas_medias_faixa_etaria():
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
+    """
+    Notas médias de cada filme por faixa etária, em ordem de título.
+    Aceita paginação por chave: 'after' (o último título recebido) e 'limit'.
+    Sem 'limit', devolve o catálogo inteiro em fluxo.
+    """
+    after = request.args.get('after')
+    try:
+        limite = consultas.limite_opcional(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with _conexao() as conn:
+        if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
+        try:
+            cur = conn.cursor()
+            preparadas.ATUALIZAR_FAIXAS_ETARIAS.executar(cur)
+            conn.commit()
+            cur.close()
+        except QueryCanceled:
+            raise
+        except Exception as e:
+            logger.exception("Erro em %s", request.path)
+            return jsonify({"error": str(e)}), 500
 
     try:
-        cur = conn.cursor()
-        query = "SELECT * FROM public.notas_medias_por_filme_por_idade ORDER BY titulo"
-        cur.execute(query)
-        
-        column_names = [desc[0] for desc in cur.description]
-        data = cur.fetchall()
-        cur.close()
-        
-        result_list = []
-        for row in data:
-            movie_dict = dict(zip(column_names, row))
-            for key, value in movie_dict.items():
-                if isinstance(value, decimal.Decimal):
-                    movie_dict[key] = float(value)
-            result_list.append(movie_dict)
-            
-        return jsonify(result_list)
+        return _resposta_em_fluxo(consultas.NOTAS_MEDIAS_FAIXA_ETARIA, {'after': after, 'limite': limite},
+                                  consultas.formatar_linha_faixa_etaria)
+    except ConnectionError:
+        logger.error("Falha na conexão com o banco em %s", request.path)
+        return jsonify({"error": "Falha na conexão com o banco."}), 500
+    except QueryCanceled:
+        raise
     except Exception as e:
+        logger.exception("Erro em %s", request.path)
         return jsonify({"error": str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 
 @app.route('/api/generos-melhor-avaliacao', methods=['GET'])
+@cache_http.condicional(('filmes', 'avaliacoes'), cache_http.CACHE_CONTROL_RELATORIOS)
+@cache.rota(ttl=60, tabelas=('filmes', 'avaliacoes'))
 def generos_melhor_avaliacao():
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
-
+    return _relatorio(preparadas.RELATORIOS['generos-melhor-avaliacao'], consultas.formatar_generos_melhor_avaliacao)
+
+
+# --- DASHBOARD ---
+
+# A data entra na chave porque o dashboard pode incluir as faixas etárias
+@cache.rota(ttl=60, tabelas=('filmes', 'usuarios', 'avaliacoes'), por_data=True)
+def _montar_dashboard(secoes):
+    if 'notas-medias-faixa-etaria' in secoes:
+        with _conexao() as conn:
+            if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
+            try:
+                cur = conn.cursor()
+                preparadas.ATUALIZAR_FAIXAS_ETARIAS.executar(cur)
+                conn.commit()
+                cur.close()
+            except QueryCanceled:
+                raise
+            except Exception as e:
+                logger.exception("Erro em %s", request.path)
+                return jsonify({"error": str(e)}), 500
+
+    with _conexao(cache_http.replica_da_requisicao()) as conn:
+        if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
+
+        try:
+            cur = conn.cursor()
+            # Todas as seções leem o mesmo instantâneo do banco
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            result = {}
+            for nome in secoes:
+                _, params, formatar = consultas.RELATORIOS[nome]
+                preparadas.RELATORIOS[nome].executar(cur, params)
+                column_names = [desc[0] for desc in cur.description]
+                result[nome] = formatar(column_names, cur.fetchall())
+            conn.commit()
+            cur.close()
+            return jsonify(result)
+        except QueryCanceled:
+            raise
+        except Exception as e:
+            logger.exception("Erro em %s", request.path)
+            return jsonify({"error": str(e)}), 500
+
+@app.route('/api/dashboard', methods=['GET'])
+def dashboard():
+    """
+    Os cinco relatórios em uma resposta, {nome: resultado}, lidos em uma
+    única conexão. '?secoes=' (nomes separados por vírgula) escolhe quais
+    relatórios incluir. Com If-None-Match igual à ETag atual, responde 304
+    sem executar os relatórios.
+    """
     try:
-        cur = conn.cursor()
-        query = """
-            SELECT fi.genero, AVG(av.nota)::numeric(10,2) AS nota_media 
-            FROM filmes AS fi JOIN avaliacoes AS av 
-            ON fi.id = av.filme_id 
-            GROUP BY fi.genero 
-            ORDER BY nota_media DESC;
-        """
-        cur.execute(query)
-        data = cur.fetchall()
-        cur.close()
-
-        result = [{'genero': g, 'nota_media': float(n)} for g, n in data]
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn: conn.close()
+        secoes = consultas.secoes_do_dashboard(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    tabelas = {t for nome in secoes for t in consultas.TABELAS_DOS_RELATORIOS[nome]}
+    etag = cache_http.etag_de(tabelas, por_data='notas-medias-faixa-etaria' in secoes)
+    if cache_http.nao_modificado(etag):
+        resposta = cache_http.resposta_304()
+    else:
+        resposta = app.make_response(_montar_dashboard(secoes))
+    return cache_http.validar(resposta, etag, cache_http.CACHE_CONTROL_RELATORIOS)
+
 
 # --- ROTAS DE BUSCA (GET com parâmetros) ---
 
+def _consulta_de_busca(tabela, sem_acento, limite):
+    """
+    A busca preparada, para páginas (com 'limit' ou 'after'). Sem limite, o
+    SQL da mesma busca, lido em fluxo por um cursor do lado do servidor,
+    porque o EXECUTE traria todas as linhas de uma vez.
+    """
+    busca = preparadas.BUSCAS[(tabela, sem_acento)]
+    return busca if limite is not None else busca.sql
+
+
 @app.route('/api/usuarios/buscar', methods=['GET'])
+@cache_http.condicional(('usuarios',), cache_http.CACHE_CONTROL_BUSCAS)
 def buscar_usuario():
     nome_query = request.args.get('nome')
     if not nome_query:
         return jsonify({"error": "Parâmetro 'nome' é obrigatório."}), 400
-
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
-    
     try:
-        cur = conn.cursor()
-        query = "SELECT id, nome_de_usuario, nome FROM usuarios WHERE nome_de_usuario ILIKE %s"
-        cur.execute(query, (f'%{nome_query}%',))
-        usuarios = cur.fetchall()
-        cur.close()
-
-        resultado = [{'id': u[0], 'nome_de_usuario': u[1], 'nome': u[2]} for u in usuarios]
-        return jsonify(resultado)
+        limite, deslocamento, sem_acento = consultas.parametros_de_busca(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    query = _consulta_de_busca('usuarios', sem_acento, limite)
+    params = {
+        'termo': nome_query, 'padrao': consultas.padrao_de_substring(nome_query),
+        'after': request.args.get('after'), 'limite': limite, 'deslocamento': deslocamento,
+    }
+    try:
+        return _resposta_em_fluxo(query, params, consultas.formatar_usuario_encontrado)
+    except ConnectionError:
+        logger.error("Falha na conexão com o banco em %s", request.path)
+        return jsonify({"error": "Falha na conexão com o banco."}), 500
+    except QueryCanceled:
+        raise
     except Exception as e:
+        logger.exception("Erro em %s", request.path)
         return jsonify({"error": "Erro interno ao buscar usuários."}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/api/filmes/buscar', methods=['GET'])
+@cache_http.condicional(('filmes',), cache_http.CACHE_CONTROL_BUSCAS)
 def buscar_filme():
     titulo_query = request.args.get('titulo')
     if not titulo_query:
         return jsonify({"error": "Parâmetro 'titulo' é obrigatório."}), 400
-
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
-    
     try:
-        cur = conn.cursor()
-        query = "SELECT id, titulo, ano FROM filmes WHERE titulo ILIKE %s"
-        cur.execute(query, (f'%{titulo_query}%',))
-        filmes = cur.fetchall()
-        cur.close()
-
-        resultado = [{'id': f[0], 'titulo': f[1], 'ano': f[2]} for f in filmes]
-        return jsonify(resultado)
+        limite, deslocamento, sem_acento = consultas.parametros_de_busca(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    query = _consulta_de_busca('filmes', sem_acento, limite)
+    params = {
+        'termo': titulo_query, 'padrao': consultas.padrao_de_substring(titulo_query),
+        'after': request.args.get('after'), 'limite': limite, 'deslocamento': deslocamento,
+    }
+    try:
+        return _resposta_em_fluxo(query, params, consultas.formatar_filme_encontrado)
+    except ConnectionError:
+        logger.error("Falha na conexão com o banco em %s", request.path)
+        return jsonify({"error": "Falha na conexão com o banco."}), 500
+    except QueryCanceled:
+        raise
     except Exception as e:
+        logger.exception("Erro em %s", request.path)
         return jsonify({"error": "Erro interno ao buscar filmes."}), 500
-    finally:
-        if conn: conn.close()
+
+@app.route('/api/filmes/em-alta', methods=['GET'])
+@cache_http.apenas_cache_control(cache_http.CACHE_CONTROL_EM_ALTA)
+@cache.rota(ttl=60, tabelas=('filmes', 'avaliacoes'))
+def filmes_em_alta():
+    """
+    Filmes com mais avaliações na janela recente ('janela', como '24h' ou
+    '7d'; padrão 7d) e a nota média delas. Só as partições mensais de
+    'avaliacoes' que cobrem a janela são lidas.
+    """
+    try:
+        janela, limite = consultas.parametros_em_alta(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return _relatorio(preparadas.EM_ALTA, consultas.formatar_em_alta, {'janela': janela, 'limite': limite})
+
+# --- RECOMENDAÇÕES ---
+
+@app.route('/api/usuarios/<int:usuario_id>/recomendacoes', methods=['GET'])
+def recomendacoes_do_usuario(usuario_id):
+    """
+    Filmes que o usuário ainda não avaliou, pela nota prevista a partir dos
+    filmes parecidos com os que ele avaliou. Sem avaliações, os mais avaliados.
+    """
+    try:
+        limite = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({"error": "Parâmetro 'limit' deve ser um número inteiro."}), 400
+    if not 1 <= limite <= 100:
+        return jsonify({"error": "Parâmetro 'limit' deve estar entre 1 e 100."}), 400
+
+    recomendador = recomendacoes.recomendador
+    if recomendador is None or not recomendador.pronto:
+        resposta = jsonify({"error": "Recomendações indisponíveis no momento."})
+        resposta.headers['Retry-After'] = '5'
+        return resposta, 503
+
+    origem, escolhidos = recomendador.recomendar(usuario_id, limite)
+    with _conexao() as conn:
+        if conn is None: return jsonify({"error": "Falha na conexão com o banco."}), 500
+        cur = conn.cursor()
+        try:
+            if origem == 'populares':
+                # Usuário sem avaliações: pode simplesmente não existir
+                cur.execute("SELECT 1 FROM usuarios WHERE id = %s", (usuario_id,))
+                if cur.fetchone() is None:
+                    return jsonify({"error": "Usuário não encontrado."}), 404
+            cur.execute("SELECT id, titulo, genero, ano FROM filmes WHERE id = ANY(%s)", ([f for f, _ in escolhidos],))
+            filmes = {linha[0]: linha for linha in cur.fetchall()}
+            conn.commit()
+        except QueryCanceled:
+            raise
+        except Exception as e:
+            logger.exception("Erro em %s", request.path)
+            conn.rollback()
+            return jsonify({"error": "Erro interno ao buscar recomendações."}), 500
+        finally:
+            cur.close()
+
+    itens = [
+        {'filme_id': f, 'titulo': filmes[f][1], 'genero': filmes[f][2], 'ano': filmes[f][3], 'nota_prevista': nota}
+        for f, nota in escolhidos if f in filmes
+    ]
+    return jsonify({'usuario_id': usuario_id, 'origem': origem, 'recomendacoes': itens}), 200
 
 # --- EXECUÇÃO DA APLICAÇÃO ---
 
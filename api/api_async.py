@@ -0,0 +1,445 @@
+"""
+Versão assíncrona da API, com Starlette (uvicorn) e o pool assíncrono do
+psycopg 3. Serve os cadastros, os cinco relatórios, o dashboard e as
+buscas com o mesmo JSON de api.py, mas um único processo atende muitas
+requisições ao mesmo tempo enquanto elas esperam o banco, e /api/dashboard
+executa os cinco relatórios em paralelo, cada um em uma conexão do pool.
+
+    cd api && uvicorn api_async:app --host 0.0.0.0 --port 5000
+
+Existem só na API síncrona (api.py): o cache de respostas, as ETags, a fila
+local de avaliações, as réplicas de leitura, o tempo limite por rota (503),
+/api/metrics, /api/filmes/em-alta, /api/usuarios/<id>/recomendacoes, o
+modo ?aprox=1 dos relatórios (e /api/health/recomendacoes e
+/api/health/agregados) e a manutenção das partições de 'avaliacoes'.
+"""
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from psycopg_pool import AsyncConnectionPool
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+import consultas
+import serializacao
+from avaliacoes_logic import LOTE_MAXIMO, validar_avaliacao
+
+
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+TAMANHO_LOTE_CURSOR = 1000
+
+
+# --- JSON ---
+# A mesma serialização da API síncrona, que também termina as respostas
+# com '\n', para que as duas respondam exatamente os mesmos bytes.
+
+def jsonify(obj, status=200):
+    return Response(serializacao.dumps_bytes(obj) + b'\n', status_code=status, media_type='application/json')
+
+
+def _erro_de_conexao():
+    return jsonify({"error": "Falha na conexão com o banco."}, 500)
+
+
+# --- POOL DE CONEXÕES ---
+
+def criar_pool():
+    """
+    Pool assíncrono configurado pelas mesmas variáveis da API síncrona:
+    DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX e DB_POOL_TIMEOUT.
+    """
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        raise ValueError("A variável de ambiente DATABASE_URL não foi definida.")
+    return AsyncConnectionPool(
+        db_url,
+        min_size=int(os.environ.get("DB_POOL_MIN", "1")),
+        max_size=int(os.environ.get("DB_POOL_MAX", "10")),
+        timeout=float(os.environ.get("DB_POOL_TIMEOUT", "5")),
+        # Leituras não precisam de transação; quem escreve abre a sua
+        kwargs={'autocommit': True},
+        # NUMERIC chega como float, como no pool síncrono
+        configure=serializacao.registrar_tipos_async,
+        check=AsyncConnectionPool.check_connection,
+        open=False,
+    )
+
+
+@asynccontextmanager
+async def conexao(pool):
+    """
+    Empresta uma conexão do pool durante o bloco 'async with'. Se não for
+    possível obter uma conexão, entrega None, como database.conexao().
+    """
+    try:
+        conn = await pool.getconn()
+    except Exception as e:
+        logger.error("Não foi possível conectar ao banco de dados: %s", e)
+        yield None
+        return
+    try:
+        yield conn
+    finally:
+        await pool.putconn(conn)
+
+
+def estatisticas_pool(pool):
+    """Estatísticas do pool, com os mesmos nomes de database.estatisticas_pool()."""
+    stats = pool.get_stats()
+    checkouts = stats.get('requests_num', 0)
+    return {
+        'minimo': pool.min_size,
+        'maximo': pool.max_size,
+        'em_uso': stats.get('pool_size', 0) - stats.get('pool_available', 0),
+        'livres': stats.get('pool_available', 0),
+        'total_checkouts': checkouts,
+        'total_esperas': stats.get('requests_queued', 0),
+        'total_timeouts': stats.get('requests_errors', 0),
+        'total_descartadas': stats.get('returns_bad', 0) + stats.get('connections_lost', 0),
+        'espera_media_ms': round(stats.get('requests_wait_ms', 0) / checkouts, 3) if checkouts else 0.0,
+    }
+
+
+# --- ROTAS DE HEALTH CHECK ---
+
+async def health_check(request):
+    return jsonify({"status": "ok"})
+
+
+async def health_pool(request):
+    return jsonify(estatisticas_pool(request.app.state.pool))
+
+
+async def health_cache(request):
+    return jsonify({'habilitado': False})
+
+
+async def health_fila(request):
+    return jsonify({'habilitada': False})
+
+
+# --- ROTAS DE CADASTRO (POST) ---
+
+async def _corpo_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def _inserir(request, query, valores, sucesso, erro_interno):
+    async with conexao(request.app.state.pool) as conn:
+        if conn is None: return _erro_de_conexao()
+        try:
+            await conn.execute(query, valores)
+            return jsonify({'message': sucesso}, 201)
+        except Exception:
+            logger.exception("Erro em %s", request.url.path)
+            return jsonify({'message': erro_interno}, 500)
+
+
+async def rota_cadastrar_filme(request):
+    dados = await _corpo_json(request)
+    if not dados or not 'titulo' in dados or not 'genero' in dados or not 'ano' in dados:
+        return jsonify({'message': 'Erro: Dados incompletos para o filme.'}, 400)
+    return await _inserir(
+        request, "INSERT INTO filmes (titulo, genero, ano) VALUES (%s, %s, %s)",
+        (dados['titulo'], dados['genero'], dados['ano']),
+        'Filme cadastrado com sucesso!', 'Erro interno no servidor ao cadastrar o filme.',
+    )
+
+
+async def rota_cadastrar_usuario(request):
+    dados = await _corpo_json(request)
+    campos = ['nome_de_usuario', 'nome', 'senha', 'pais', 'data_de_nascimento']
+    if not dados or not all(campo in dados for campo in campos):
+        return jsonify({'message': 'Erro: Dados incompletos para o usuário.'}, 400)
+    return await _inserir(
+        request,
+        "INSERT INTO usuarios (nome_de_usuario, nome, senha, pais, data_de_nascimento) VALUES (%s, %s, %s, %s, %s)",
+        tuple(dados[campo] for campo in campos),
+        'Usuário cadastrado com sucesso!', 'Erro interno no servidor ao cadastrar o usuário.',
+    )
+
+
+async def rota_cadastrar_avaliacao(request):
+    dados = await _corpo_json(request)
+    if not dados or not 'usuario_id' in dados or not 'filme_id' in dados or not 'nota' in dados:
+        return jsonify({'message': 'Erro: Dados incompletos para a avaliação.'}, 400)
+    return await _inserir(
+        request, "INSERT INTO avaliacoes (usuario_id, filme_id, nota) VALUES (%s, %s, %s)",
+        (dados['usuario_id'], dados['filme_id'], dados['nota']),
+        'Avaliação registrada com sucesso!', 'Erro interno no servidor ao registrar a avaliação.',
+    )
+
+
+async def rota_cadastrar_avaliacoes_em_lote(request):
+    """
+    Mesmo contrato de api.py: lista JSON, {"avaliacoes": [...]} ou NDJSON.
+    A validação é a de avaliacoes_logic; a gravação usa executemany(), que
+    no psycopg 3 envia todas as linhas em modo pipeline.
+    """
+    if request.headers.get('content-type', '').split(';')[0].strip() == 'application/x-ndjson':
+        registros = []
+        for linha in (await request.body()).decode().splitlines():
+            if not linha.strip():
+                continue
+            try:
+                registros.append(serializacao.loads(linha))
+            except ValueError:
+                registros.append(None)
+    else:
+        registros = await _corpo_json(request)
+        if isinstance(registros, dict):
+            registros = registros.get('avaliacoes')
+
+    if not isinstance(registros, list) or not registros:
+        return jsonify({'message': 'Erro: envie uma lista não vazia de avaliações.'}, 400)
+    if len(registros) > LOTE_MAXIMO:
+        return jsonify({'message': f'Erro: o lote excede o máximo de {LOTE_MAXIMO} avaliações.'}, 413)
+
+    erros = {}
+    for posicao, registro in enumerate(registros):
+        erro = validar_avaliacao(registro)
+        if erro:
+            erros[posicao] = erro
+
+    async with conexao(request.app.state.pool) as conn:
+        if conn is None: return _erro_de_conexao()
+        try:
+            async with conn.transaction():
+                cur = conn.cursor()
+                candidatos = [(p, r) for p, r in enumerate(registros) if p not in erros]
+
+                usuario_ids = list({r['usuario_id'] for _, r in candidatos})
+                filme_ids = list({r['filme_id'] for _, r in candidatos})
+                await cur.execute("SELECT id FROM usuarios WHERE id = ANY(%s)", (usuario_ids,))
+                usuarios_existentes = {row[0] for row in await cur.fetchall()}
+                await cur.execute("SELECT id FROM filmes WHERE id = ANY(%s)", (filme_ids,))
+                filmes_existentes = {row[0] for row in await cur.fetchall()}
+
+                valores = []
+                for posicao, registro in candidatos:
+                    if registro['usuario_id'] not in usuarios_existentes:
+                        erros[posicao] = f"Usuário {registro['usuario_id']} não encontrado."
+                    elif registro['filme_id'] not in filmes_existentes:
+                        erros[posicao] = f"Filme {registro['filme_id']} não encontrado."
+                    else:
+                        valores.append((registro['usuario_id'], registro['filme_id'], registro['nota']))
+
+                if valores:
+                    await cur.executemany("INSERT INTO avaliacoes (usuario_id, filme_id, nota) VALUES (%s, %s, %s)", valores)
+        except Exception:
+            logger.exception("Erro em %s", request.url.path)
+            return jsonify({'message': 'Erro interno no servidor ao registrar o lote de avaliações.'}, 500)
+
+    resposta = {
+        'inseridas': len(valores),
+        'rejeitadas': len(erros),
+        'erros': [{'posicao': p, 'erro': erros[p]} for p in sorted(erros)],
+    }
+    if not erros:
+        return jsonify(resposta, 201)
+    return jsonify(resposta, 207 if valores else 400)
+
+
+# --- RESPOSTAS EM FLUXO ---
+
+async def _array_json_do_cursor(pool, query, params, linha_para_dict):
+    """
+    Como em api.py: um cursor nomeado lê TAMANHO_LOTE_CURSOR linhas por vez
+    e o array JSON sai aos pedaços. O primeiro lote é lido antes do primeiro
+    pedaço, então erros da consulta aparecem antes da resposta começar.
+    """
+    async with conexao(pool) as conn:
+        if conn is None:
+            raise ConnectionError("Falha na conexão com o banco.")
+        # Cursores nomeados só existem dentro de uma transação
+        async with conn.transaction():
+            async with conn.cursor(name='resposta_em_fluxo') as cur:
+                await cur.execute(query, params)
+                linhas = await cur.fetchmany(TAMANHO_LOTE_CURSOR)
+                colunas = [desc.name for desc in cur.description]
+
+                yield b'['
+                separador = b''
+                while linhas:
+                    yield separador + serializacao.itens_de_array([linha_para_dict(colunas, linha) for linha in linhas])
+                    separador = b','
+                    linhas = await cur.fetchmany(TAMANHO_LOTE_CURSOR)
+                yield b']\n'
+
+
+async def _resposta_em_fluxo(pool, query, params, linha_para_dict):
+    """
+    Devolve uma StreamingResponse com o resultado da consulta como array
+    JSON. A conexão fica emprestada até o último pedaço ser enviado.
+    """
+    fluxo = _array_json_do_cursor(pool, query, params, linha_para_dict)
+    primeiro = await fluxo.__anext__()
+
+    async def pedacos():
+        try:
+            yield primeiro
+            async for pedaco in fluxo:
+                yield pedaco
+        finally:
+            await fluxo.aclose()
+
+    return StreamingResponse(pedacos(), media_type='application/json')
+
+
+# --- ROTAS DE CONSULTA (GET) ---
+
+async def executar_relatorio(pool, nome):
+    """Executa um dos relatórios de consultas.RELATORIOS e devolve o resultado formatado."""
+    query, params, formatar = consultas.RELATORIOS[nome]
+    async with conexao(pool) as conn:
+        if conn is None:
+            raise ConnectionError("Falha na conexão com o banco.")
+        async with conn.cursor() as cur:
+            if query is consultas.NOTAS_MEDIAS_FAIXA_ETARIA:
+                await cur.execute(consultas.ATUALIZAR_FAIXAS_ETARIAS)
+            await cur.execute(query, params)
+            colunas = [desc.name for desc in cur.description]
+            return formatar(colunas, await cur.fetchall())
+
+
+def _rota_relatorio(nome):
+    async def rota(request):
+        try:
+            return jsonify(await executar_relatorio(request.app.state.pool, nome))
+        except ConnectionError:
+            logger.error("Falha na conexão com o banco em %s", request.url.path)
+            return _erro_de_conexao()
+        except Exception as e:
+            logger.exception("Erro em %s", request.url.path)
+            return jsonify({"error": str(e)}, 500)
+    return rota
+
+
+async def notas_medias_faixa_etaria(request):
+    """Mesmo contrato de api.py: 'after' e 'limit' opcionais, resposta em fluxo."""
+    after = request.query_params.get('after')
+    try:
+        limite = consultas.limite_opcional(request.query_params)
+    except ValueError as e:
+        return jsonify({"error": str(e)}, 400)
+
+    pool = request.app.state.pool
+    try:
+        async with conexao(pool) as conn:
+            if conn is None: return _erro_de_conexao()
+            await conn.execute(consultas.ATUALIZAR_FAIXAS_ETARIAS)
+        return await _resposta_em_fluxo(pool, consultas.NOTAS_MEDIAS_FAIXA_ETARIA, {'after': after, 'limite': limite},
+                                        consultas.formatar_linha_faixa_etaria)
+    except ConnectionError:
+        logger.error("Falha na conexão com o banco em %s", request.url.path)
+        return _erro_de_conexao()
+    except Exception as e:
+        logger.exception("Erro em %s", request.url.path)
+        return jsonify({"error": str(e)}, 500)
+
+
+async def dashboard(request):
+    """
+    Os cinco relatórios em uma resposta, {nome: resultado}. As consultas
+    rodam ao mesmo tempo, cada uma em sua conexão, então a resposta demora
+    o tempo do relatório mais lento e não a soma de todos. '?secoes=' (nomes
+    separados por vírgula) escolhe quais relatórios incluir.
+    """
+    try:
+        secoes = consultas.secoes_do_dashboard(request.query_params)
+    except ValueError as e:
+        return jsonify({"error": str(e)}, 400)
+
+    pool = request.app.state.pool
+    try:
+        resultados = await asyncio.gather(*(executar_relatorio(pool, nome) for nome in secoes))
+    except ConnectionError:
+        logger.error("Falha na conexão com o banco em %s", request.url.path)
+        return _erro_de_conexao()
+    except Exception as e:
+        logger.exception("Erro em %s", request.url.path)
+        return jsonify({"error": str(e)}, 500)
+    return jsonify(dict(zip(secoes, resultados)))
+
+
+# --- ROTAS DE BUSCA (GET com parâmetros) ---
+
+def _rota_busca(parametro, colunas, tabela, coluna_busca, formatar, erro_interno):
+    async def rota(request):
+        termo = request.query_params.get(parametro)
+        if not termo:
+            return jsonify({"error": f"Parâmetro '{parametro}' é obrigatório."}, 400)
+        try:
+            limite, deslocamento, sem_acento = consultas.parametros_de_busca(request.query_params)
+        except ValueError as e:
+            return jsonify({"error": str(e)}, 400)
+
+        query = consultas.consulta_de_busca(colunas, tabela, coluna_busca, sem_acento)
+        params = {
+            'termo': termo, 'padrao': consultas.padrao_de_substring(termo),
+            'after': request.query_params.get('after'), 'limite': limite, 'deslocamento': deslocamento,
+        }
+        try:
+            return await _resposta_em_fluxo(request.app.state.pool, query, params, formatar)
+        except ConnectionError:
+            logger.error("Falha na conexão com o banco em %s", request.url.path)
+            return _erro_de_conexao()
+        except Exception:
+            logger.exception("Erro em %s", request.url.path)
+            return jsonify({"error": erro_interno}, 500)
+    return rota
+
+
+# --- APLICAÇÃO ---
+
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    app.state.pool = criar_pool()
+    await app.state.pool.open()
+    try:
+        yield
+    finally:
+        await app.state.pool.close()
+
+
+routes = [
+    Route('/api/health', health_check),
+    Route('/api/health/pool', health_pool),
+    Route('/api/health/cache', health_cache),
+    Route('/api/health/fila', health_fila),
+    Route('/api/cadastrar-filme', rota_cadastrar_filme, methods=['POST']),
+    Route('/api/cadastrar-usuario', rota_cadastrar_usuario, methods=['POST']),
+    Route('/api/cadastrar-avaliacao', rota_cadastrar_avaliacao, methods=['POST']),
+    Route('/api/avaliacoes/batch', rota_cadastrar_avaliacoes_em_lote, methods=['POST']),
+    Route('/api/top-filmes-genero', _rota_relatorio('top-filmes-genero')),
+    Route('/api/cinco-populares', _rota_relatorio('cinco-populares')),
+    Route('/api/avaliacoes-pais', _rota_relatorio('avaliacoes-pais')),
+    Route('/api/notas-medias-faixa-etaria', notas_medias_faixa_etaria),
+    Route('/api/generos-melhor-avaliacao', _rota_relatorio('generos-melhor-avaliacao')),
+    Route('/api/dashboard', dashboard),
+    Route('/api/usuarios/buscar', _rota_busca(
+        'nome', "id, nome_de_usuario, nome", "usuarios", "nome_de_usuario",
+        consultas.formatar_usuario_encontrado, "Erro interno ao buscar usuários.")),
+    Route('/api/filmes/buscar', _rota_busca(
+        'titulo', "id, titulo, ano", "filmes", "titulo",
+        consultas.formatar_filme_encontrado, "Erro interno ao buscar filmes.")),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=ciclo_de_vida,
+)
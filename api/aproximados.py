@@ -0,0 +1,531 @@
+"""
+Agregados aproximados das avaliações, para o modo ?aprox=1 de
+GET /api/avaliacoes-pais e GET /api/cinco-populares.
+
+Em vez de contar no banco, cada processo mantém em memória esboços
+(sketches) de tamanho fixo, em arrays do NumPy, independentes do número de
+avaliações:
+
+- ContagemMinima (count-min sketch): avaliações por filme e por país. A
+  estimativa nunca fica abaixo do valor real e, com largura w e
+  profundidade d, passa dele em no máximo (e / w) * N (N = total de
+  avaliações) com probabilidade de pelo menos 1 - e^-d;
+- HiperLogLogs: avaliadores distintos por filme e por país, com erro
+  relativo típico (desvio padrão) de 1,04 / sqrt(2^precisao);
+- MaisFrequentes: os filmes candidatos a mais avaliados (heavy hitters),
+  ordenados pela estimativa da ContagemMinima dos filmes.
+
+Os três se mesclam: esboços montados em partes (outros processos, outros
+trechos da tabela) somados com mesclar() dão o mesmo resultado que um
+esboço montado com tudo.
+
+As avaliações gravadas por este worker chegam por registrar(); as dos
+demais workers (e da fila de avaliações), por sincronizar(), que lê as
+avaliações com id acima de uma marca, como em recomendacoes.py. Contar a
+mesma avaliação duas vezes mudaria as contagens, então os ids acima da marca
+já aplicados ficam guardados até a marca passar deles. A thread também
+remonta os esboços a partir da tabela periodicamente, o que remove as
+avaliações apagadas (os esboços só somam).
+"""
+import os
+import math
+import time
+import hashlib
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+from database import conexao
+
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_LOTE_CARGA = 100000
+# Transações da API duram milissegundos; ids confirmados fora de ordem
+# aparecem bem antes disso
+JANELA_SINCRONIA = 10.0
+# Candidatos guardados pelos MaisFrequentes; a rota usa os 5 primeiros
+CANDIDATOS_MAIS_AVALIADOS = 64
+
+# Constantes fixas, para que esboços de processos diferentes usem as mesmas
+# funções de hash e possam ser mesclados
+_SEMENTE_CONTAGEM = 0x9E3779B97F4A7C15
+_SEMENTE_AVALIADORES = np.uint64(0xD6E8FEB86659FD93)
+_M1, _M2 = np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB)
+
+
+def _misturar(chaves, semente=np.uint64(0)):
+    """Hash de 64 bits (finalizador do splitmix64) de um array de inteiros."""
+    x = chaves.astype(np.uint64) + semente
+    x = (x ^ (x >> np.uint64(30))) * _M1
+    x = (x ^ (x >> np.uint64(27))) * _M2
+    return x ^ (x >> np.uint64(31))
+
+
+def _comprimento_em_bits(x):
+    """int.bit_length() de cada elemento de um array uint64."""
+    x = x.copy()
+    comprimento = np.zeros(x.shape, dtype=np.int64)
+    for passo in (32, 16, 8, 4, 2, 1):
+        maior = x >= np.uint64(1 << passo)
+        comprimento[maior] += passo
+        x[maior] >>= np.uint64(passo)
+    return comprimento + (x > 0)
+
+
+_CODIGOS_PAISES = {}
+
+
+def codigo_do_pais(pais):
+    """Chave inteira de um país (0 para usuários sem país)."""
+    codigo = _CODIGOS_PAISES.get(pais)
+    if codigo is None:
+        # 63 bits, para caber em um int64; nunca 0 nem -1
+        codigo = 0 if pais is None else int.from_bytes(
+            hashlib.blake2b(pais.encode(), digest_size=8).digest(), 'little') >> 1 | 1
+        _CODIGOS_PAISES[pais] = codigo
+    return codigo
+
+
+class ContagemMinima:
+    """
+    Count-min sketch: 'profundidade' linhas de 'largura' contadores. Cada
+    chave soma 1 em um contador por linha, escolhido por um hash próprio da
+    linha; a estimativa é o menor dos contadores da chave.
+    """
+
+    def __init__(self, largura=4096, profundidade=5):
+        if largura & (largura - 1) or largura < 2:
+            raise ValueError("A largura da contagem deve ser uma potência de 2.")
+        self.largura = largura
+        self.profundidade = profundidade
+        self._deslocamento = np.uint64(64 - int(math.log2(largura)))
+        self._sementes = [np.uint64(_SEMENTE_CONTAGEM * (2 * linha + 1) % 2 ** 64) for linha in range(profundidade)]
+        self.contadores = np.zeros((profundidade, largura), dtype=np.int64)
+        self.total = 0
+
+    def _colunas(self, chaves):
+        return [(_misturar(chaves, semente) >> self._deslocamento).astype(np.intp) for semente in self._sementes]
+
+    def adicionar(self, chaves):
+        for linha, colunas in enumerate(self._colunas(chaves)):
+            self.contadores[linha] += np.bincount(colunas, minlength=self.largura)
+        self.total += len(chaves)
+
+    def estimar(self, chaves):
+        colunas = self._colunas(chaves)
+        return np.min([self.contadores[linha, c] for linha, c in enumerate(colunas)], axis=0)
+
+    def mesclar(self, outra):
+        if (outra.largura, outra.profundidade) != (self.largura, self.profundidade):
+            raise ValueError("Só é possível mesclar contagens do mesmo tamanho.")
+        self.contadores += outra.contadores
+        self.total += outra.total
+
+    @property
+    def erro_maximo(self):
+        """Quanto a estimativa pode passar do valor real (exceto com probabilidade_de_falha)."""
+        return math.e / self.largura * self.total
+
+    @property
+    def probabilidade_de_falha(self):
+        return math.exp(-self.profundidade)
+
+
+class HiperLogLogs:
+    """
+    Um HyperLogLog por grupo (filme ou país), com 2^precisao registradores
+    de um byte cada, em uma matriz grupo x registrador.
+    """
+
+    def __init__(self, precisao=10):
+        if not 4 <= precisao <= 16:
+            raise ValueError("A precisão do HyperLogLog deve estar entre 4 e 16.")
+        self.precisao = precisao
+        self.m = 1 << precisao
+        self.registradores = np.zeros((0, self.m), dtype=np.uint8)
+        self._linhas = {}
+        self._alfa = 0.7213 / (1 + 1.079 / self.m)
+
+    def _linhas_dos_grupos(self, grupos):
+        unicos, inversos = np.unique(grupos, return_inverse=True)
+        linhas = np.empty(len(unicos), dtype=np.intp)
+        for i, grupo in enumerate(unicos.tolist()):
+            linha = self._linhas.get(grupo)
+            if linha is None:
+                linha = self._linhas[grupo] = len(self._linhas)
+            linhas[i] = linha
+        if len(self._linhas) > len(self.registradores):
+            # Cresce em dobro, para que a cópia aconteça poucas vezes
+            novos = np.zeros((max(len(self._linhas), 2 * len(self.registradores)), self.m), dtype=np.uint8)
+            novos[:len(self.registradores)] = self.registradores
+            self.registradores = novos
+        return linhas[inversos]
+
+    def adicionar(self, grupos, itens):
+        """Adiciona os itens (inteiros, como ids de usuário) aos grupos correspondentes."""
+        if not len(grupos):
+            return
+        linhas = self._linhas_dos_grupos(grupos)
+        h = _misturar(itens, _SEMENTE_AVALIADORES)
+        registrador = (h >> np.uint64(64 - self.precisao)).astype(np.intp)
+        # Posição do primeiro bit 1 depois dos bits do registrador (o bit extra limita o valor)
+        resto = (h << np.uint64(self.precisao)) | np.uint64(1 << (self.precisao - 1))
+        posicao = (65 - _comprimento_em_bits(resto)).astype(np.uint8)
+        np.maximum.at(self.registradores, (linhas, registrador), posicao)
+
+    def estimar(self, grupos):
+        """Cardinalidade estimada de cada grupo (0 para grupos desconhecidos)."""
+        linhas = [self._linhas.get(g) for g in grupos]
+        conhecidos = np.array([linha is not None for linha in linhas], dtype=bool)
+        estimativas = np.zeros(len(linhas))
+        if not conhecidos.any():
+            return estimativas
+        registradores = self.registradores[[linha for linha in linhas if linha is not None]]
+        bruta = self._alfa * self.m ** 2 / np.sum(np.ldexp(1.0, -registradores.astype(np.int64)), axis=1)
+        vazios = np.count_nonzero(registradores == 0, axis=1)
+        # Correção para cardinalidades pequenas: contagem linear dos registradores vazios
+        pequena = (bruta <= 2.5 * self.m) & (vazios > 0)
+        bruta[pequena] = self.m * np.log(self.m / vazios[pequena])
+        estimativas[conhecidos] = bruta
+        return estimativas
+
+    def mesclar(self, outro):
+        if outro.precisao != self.precisao:
+            raise ValueError("Só é possível mesclar HyperLogLogs da mesma precisão.")
+        grupos = list(outro._linhas)
+        if grupos:
+            linhas = self._linhas_dos_grupos(np.array(grupos))
+            np.maximum.at(self.registradores, linhas, outro.registradores[[outro._linhas[g] for g in grupos]])
+
+    @property
+    def erro_relativo(self):
+        return 1.04 / math.sqrt(self.m)
+
+    @property
+    def grupos(self):
+        return list(self._linhas)
+
+
+class MaisFrequentes:
+    """
+    Heavy hitters sobre uma ContagemMinima: a cada atualização, as chaves
+    recebidas disputam os 'capacidade' lugares com os candidatos atuais pela
+    estimativa da contagem. Uma chave com muitas ocorrências volta a disputar
+    a cada ocorrência, com a estimativa já incluindo todas elas.
+    """
+
+    def __init__(self, contagem, capacidade=CANDIDATOS_MAIS_AVALIADOS):
+        self.contagem = contagem
+        self.capacidade = capacidade
+        self.candidatos = np.zeros(0, dtype=np.int64)
+
+    def atualizar(self, chaves):
+        """Chamado depois de somar 'chaves' à contagem."""
+        disputa = np.union1d(self.candidatos, chaves)
+        if len(disputa) > self.capacidade:
+            estimativas = self.contagem.estimar(disputa)
+            disputa = disputa[np.lexsort((disputa, -estimativas))[:self.capacidade]]
+        self.candidatos = disputa
+
+    def mais_frequentes(self, quantidade):
+        """[(chave, contagem estimada)], da maior contagem para a menor; no empate, a menor chave."""
+        estimativas = self.contagem.estimar(self.candidatos)
+        ordem = np.lexsort((self.candidatos, -estimativas))[:quantidade]
+        return [(int(self.candidatos[i]), int(estimativas[i])) for i in ordem]
+
+    def mesclar(self, outro):
+        """Chamado depois de mesclar as contagens."""
+        self.atualizar(outro.candidatos)
+
+
+class Esbocos:
+    """
+    Os esboços de um conjunto de avaliações, com a mesma semântica dos
+    relatórios exatos: por filme, todas as avaliações de filmes; por país,
+    as avaliações de usuários existentes, agrupadas pelo país do usuário
+    (que pode ser nulo).
+    """
+
+    def __init__(self, largura=4096, profundidade=5, precisao=10):
+        self.avaliacoes_por_filme = ContagemMinima(largura, profundidade)
+        self.avaliacoes_por_pais = ContagemMinima(largura, profundidade)
+        self.avaliadores_por_filme = HiperLogLogs(precisao)
+        self.avaliadores_por_pais = HiperLogLogs(precisao)
+        self.mais_avaliados = MaisFrequentes(self.avaliacoes_por_filme)
+        # País de cada código; os países são poucos e cabem em um dicionário
+        self.paises = {}
+
+    def adicionar(self, filmes, usuarios, paises):
+        """
+        Colunas de avaliações: filmes e usuários como arrays de inteiros (-1
+        para nulo) e os países como uma lista, com False para avaliações
+        sem usuário (que não contam por país).
+        """
+        com_filme = filmes >= 0
+        if com_filme.any():
+            self.avaliacoes_por_filme.adicionar(filmes[com_filme])
+            self.mais_avaliados.atualizar(np.unique(filmes[com_filme]))
+            com_ambos = com_filme & (usuarios >= 0)
+            self.avaliadores_por_filme.adicionar(filmes[com_ambos], usuarios[com_ambos])
+
+        codigos = np.array([-1 if p is False else codigo_do_pais(p) for p in paises], dtype=np.int64)
+        com_usuario = codigos != -1
+        if com_usuario.any():
+            for pais in set(paises):
+                if pais is not False:
+                    self.paises[codigo_do_pais(pais)] = pais
+            self.avaliacoes_por_pais.adicionar(codigos[com_usuario])
+            self.avaliadores_por_pais.adicionar(codigos[com_usuario], usuarios[com_usuario])
+
+    def mesclar(self, outros):
+        self.avaliacoes_por_filme.mesclar(outros.avaliacoes_por_filme)
+        self.avaliacoes_por_pais.mesclar(outros.avaliacoes_por_pais)
+        self.avaliadores_por_filme.mesclar(outros.avaliadores_por_filme)
+        self.avaliadores_por_pais.mesclar(outros.avaliadores_por_pais)
+        self.mais_avaliados.mesclar(outros.mais_avaliados)
+        self.paises.update(outros.paises)
+
+    def por_pais(self):
+        """[(pais, avaliações estimadas, avaliadores distintos estimados)], do país com mais avaliações."""
+        codigos = np.array(list(self.paises), dtype=np.int64)
+        if not len(codigos):
+            return []
+        avaliacoes = self.avaliacoes_por_pais.estimar(codigos)
+        avaliadores = self.avaliadores_por_pais.estimar(codigos)
+        ordem = sorted(range(len(codigos)), key=lambda i: (-avaliacoes[i], self.paises[codigos[i]] or ''))
+        return [(self.paises[codigos[i]], int(avaliacoes[i]), round(avaliadores[i])) for i in ordem]
+
+    def mais_avaliados_com_avaliadores(self, quantidade):
+        """[(filme_id, avaliações estimadas, avaliadores distintos estimados)] dos filmes mais avaliados."""
+        filmes = self.mais_avaliados.mais_frequentes(quantidade)
+        avaliadores = self.avaliadores_por_filme.estimar([f for f, _ in filmes])
+        return [(f, avaliacoes, round(a)) for (f, avaliacoes), a in zip(filmes, avaliadores)]
+
+    @property
+    def nbytes(self):
+        return (self.avaliacoes_por_filme.contadores.nbytes + self.avaliacoes_por_pais.contadores.nbytes
+                + self.avaliadores_por_filme.registradores.nbytes + self.avaliadores_por_pais.registradores.nbytes)
+
+
+def _colunas(linhas):
+    """(ids, filmes, usuarios, paises) de linhas (id, filme_id, usuario_id, pais, usuario_existe)."""
+    ids = np.fromiter((linha[0] for linha in linhas), dtype=np.int64, count=len(linhas))
+    filmes = np.fromiter((-1 if linha[1] is None else linha[1] for linha in linhas), dtype=np.int64, count=len(linhas))
+    usuarios = np.fromiter((-1 if linha[2] is None else linha[2] for linha in linhas), dtype=np.int64, count=len(linhas))
+    paises = [linha[3] if linha[4] else False for linha in linhas]
+    return ids, filmes, usuarios, paises
+
+
+LEITURA_AVALIACOES = """
+    SELECT a.id, a.filme_id, a.usuario_id, u.pais, u.id IS NOT NULL
+    FROM avaliacoes AS a
+    LEFT JOIN usuarios AS u ON u.id = a.usuario_id
+"""
+
+
+class AgregadosAproximados:
+    """
+    Esboços das avaliações de um processo. As consultas usam os esboços
+    vigentes; recarregar() monta esboços novos a partir da tabela e os troca
+    de uma vez.
+    """
+
+    def __init__(self, largura=4096, profundidade=5, precisao=10, intervalo_recarga=3600.0, intervalo_sincronia=1.0):
+        self.largura = largura
+        self.profundidade = profundidade
+        self.precisao = precisao
+        self.intervalo_recarga = intervalo_recarga
+        self.intervalo_sincronia = intervalo_sincronia
+
+        self._lock = threading.Lock()
+        self._pronto = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+
+        self.esbocos = self._novos_esbocos()
+        # Ids acima da marca já somados aos esboços
+        self._aplicados = set()
+        self._marca = 0
+        self._leituras = deque()
+
+        self.recargas = 0
+        self.ultima_recarga_s = None
+
+    def _novos_esbocos(self):
+        return Esbocos(self.largura, self.profundidade, self.precisao)
+
+    # --- Carga ---
+
+    def recarregar(self):
+        """Remonta os esboços a partir da tabela 'avaliacoes'."""
+        inicio = time.perf_counter()
+        with self._lock:
+            marca = self._marca
+        lida_em = time.monotonic()
+        esbocos = self._novos_esbocos()
+        aplicados, ultimo_id = set(), 0
+        with conexao() as conn:
+            if conn is None:
+                raise ConnectionError("Falha na conexão com o banco.")
+            with conn.cursor(name='agregados_carga') as cur:
+                cur.itersize = TAMANHO_LOTE_CARGA
+                cur.execute(LEITURA_AVALIACOES)
+                while True:
+                    linhas = cur.fetchmany(TAMANHO_LOTE_CARGA)
+                    if not linhas:
+                        break
+                    ids, filmes, usuarios, paises = _colunas(linhas)
+                    esbocos.adicionar(filmes, usuarios, paises)
+                    ultimo_id = max(ultimo_id, int(ids.max()))
+                    if marca:
+                        aplicados.update(ids[ids > marca].tolist())
+            conn.commit()
+
+        with self._lock:
+            # Só esta thread move a marca. As avaliações registradas durante a
+            # leitura que ela não viu têm id acima da marca e voltam na sincronia.
+            self.esbocos = esbocos
+            self._aplicados = aplicados
+            if self._marca == 0:
+                self._marca = ultimo_id
+            self._leituras.append((lida_em, ultimo_id))
+        self.recargas += 1
+        self.ultima_recarga_s = round(time.perf_counter() - inicio, 3)
+        logger.info("Agregados aproximados recarregados: %d avaliações em %.2fs.",
+                    esbocos.avaliacoes_por_filme.total, self.ultima_recarga_s)
+
+    # --- Atualização incremental ---
+
+    def _aplicar(self, linhas):
+        ids, filmes, usuarios, paises = _colunas(linhas)
+        with self._lock:
+            novas = np.array([i > self._marca and i not in self._aplicados for i in ids.tolist()], dtype=bool)
+            if not novas.any():
+                return
+            self._aplicados.update(ids[novas].tolist())
+            self.esbocos.adicionar(filmes[novas], usuarios[novas], [p for p, n in zip(paises, novas) if n])
+
+    def registrar(self, avaliacao_id, usuario_id, filme_id, pais):
+        """Soma uma avaliação gravada por este worker (o usuário existe: a chave estrangeira garante)."""
+        self._aplicar([(int(avaliacao_id), None if filme_id is None else int(filme_id),
+                        None if usuario_id is None else int(usuario_id), pais, usuario_id is not None)])
+
+    def sincronizar(self):
+        """Soma as avaliações gravadas por outros workers desde a última marca."""
+        agora = time.monotonic()
+        with conexao() as conn:
+            if conn is None:
+                return
+            cur = conn.cursor()
+            cur.execute(LEITURA_AVALIACOES + " WHERE a.id > %s ORDER BY a.id", (self._marca,))
+            linhas = cur.fetchall()
+            conn.commit()
+            cur.close()
+        if linhas:
+            self._aplicar(linhas)
+        with self._lock:
+            self._leituras.append((agora, linhas[-1][0] if linhas else self._marca))
+            while self._leituras and agora - self._leituras[0][0] >= JANELA_SINCRONIA:
+                self._marca = max(self._marca, self._leituras.popleft()[1])
+            self._aplicados = {i for i in self._aplicados if i > self._marca}
+
+    # --- Consulta ---
+
+    def por_pais(self):
+        with self._lock:
+            return self.esbocos.por_pais()
+
+    def mais_avaliados(self, quantidade):
+        with self._lock:
+            return self.esbocos.mais_avaliados_com_avaliadores(quantidade)
+
+    @property
+    def pronto(self):
+        return self._pronto.is_set()
+
+    def estatisticas(self):
+        with self._lock:
+            esbocos = self.esbocos
+            contagem, avaliadores = esbocos.avaliacoes_por_filme, esbocos.avaliadores_por_filme
+            return {
+                'pronto': self.pronto,
+                'avaliacoes': contagem.total,
+                'filmes': len(avaliadores.grupos),
+                'paises': len(esbocos.paises),
+                'largura': contagem.largura,
+                'profundidade': contagem.profundidade,
+                'precisao_hll': avaliadores.precisao,
+                'erro_maximo_contagem': round(contagem.erro_maximo, 1),
+                'probabilidade_de_falha_contagem': round(contagem.probabilidade_de_falha, 4),
+                'erro_relativo_avaliadores': round(avaliadores.erro_relativo, 4),
+                'bytes': esbocos.nbytes,
+                'ids_pendentes': len(self._aplicados),
+                'recargas': self.recargas,
+                'ultima_recarga_s': self.ultima_recarga_s,
+            }
+
+    # --- Thread de recarga ---
+
+    def iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._executar, name='agregados', daemon=True)
+            self._thread.start()
+
+    def parar(self, timeout=5):
+        self._parar.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _executar(self):
+        while not self._parar.is_set() and not self.pronto:
+            try:
+                self.recarregar()
+                self._pronto.set()
+            except Exception:
+                logger.exception("Erro ao carregar os agregados aproximados")
+                self._parar.wait(5)
+
+        ultima_recarga = time.monotonic()
+        while not self._parar.wait(self.intervalo_sincronia):
+            try:
+                if time.monotonic() - ultima_recarga >= self.intervalo_recarga:
+                    ultima_recarga = time.monotonic()
+                    self.recarregar()
+                else:
+                    self.sincronizar()
+            except Exception:
+                logger.exception("Erro ao atualizar os agregados aproximados")
+
+
+def criar_agregados_do_ambiente():
+    """
+    Cria e inicia os agregados se AGREGADOS_APROXIMADOS=1. Ficam desligados
+    por padrão porque cada worker lê todas as avaliações para montar os
+    próprios esboços. A carga acontece em segundo plano; até terminar,
+    ?aprox=1 responde 503.
+    """
+    if os.environ.get("AGREGADOS_APROXIMADOS", "0") != "1":
+        return None
+    agregados = AgregadosAproximados(
+        largura=int(os.environ.get("AGREGADOS_LARGURA", "4096")),
+        profundidade=int(os.environ.get("AGREGADOS_PROFUNDIDADE", "5")),
+        precisao=int(os.environ.get("AGREGADOS_PRECISAO_HLL", "10")),
+        intervalo_recarga=float(os.environ.get("AGREGADOS_RECARGA_SEGUNDOS", "3600")),
+        intervalo_sincronia=float(os.environ.get("AGREGADOS_SINCRONIA_SEGUNDOS", "1")),
+    )
+    agregados.iniciar()
+    return agregados
+
+
+# Agregados deste processo, criados por api.py; None se desligados
+agregados = None
+
+
+def registrar(avaliacao_id, usuario_id, filme_id, pais):
+    """Avisa os agregados deste processo de uma avaliação gravada (se houver agregados)."""
+    if agregados is not None:
+        agregados.registrar(avaliacao_id, usuario_id, filme_id, pais)
@@ -1,3 +1,47 @@
+import os
+import logging
+import numbers
+
+from psycopg2.errors import QueryCanceled
+from psycopg2.extras import execute_values
+
+import aproximados
+import recomendacoes
+from cache import invalidar
+from preparadas import Preparada
+
+
+logger = logging.getLogger(__name__)
+
+# A data de criação decide a partição mensal da avaliação. O país do
+# usuário volta junto para os agregados aproximados (aproximados.py).
+PAIS_DO_USUARIO = "(SELECT u.pais FROM usuarios AS u WHERE u.id = avaliacoes.usuario_id)"
+INSERIR_AVALIACAO = Preparada(
+    'inserir_avaliacao',
+    "INSERT INTO avaliacoes (usuario_id, filme_id, nota, criado_em) VALUES (%s, %s, %s, now()) "
+    f"RETURNING id, usuario_id, filme_id, nota, {PAIS_DO_USUARIO}",
+)
+
+
+def _avisar_estruturas_em_memoria(avaliacoes):
+    """
+    Passa ao recomendador e aos agregados aproximados deste processo as
+    avaliações já confirmadas no banco. Uma falha aqui só vai para o log: a
+    rota não pode responder erro (nem desfazer a transação) para avaliações
+    gravadas, ou o cliente as enviaria de novo. A sincronia com o banco as
+    aplica depois.
+    """
+    for avaliacao_id, usuario_id, filme_id, nota, pais in avaliacoes:
+        try:
+            recomendacoes.registrar(avaliacao_id, usuario_id, filme_id, nota)
+        except Exception:
+            logger.exception("Erro ao passar a avaliação %s às recomendações", avaliacao_id)
+        try:
+            aproximados.registrar(avaliacao_id, usuario_id, filme_id, pais)
+        except Exception:
+            logger.exception("Erro ao passar a avaliação %s aos agregados aproximados", avaliacao_id)
+
+
 def registrar_avaliacao(conn, dados):
     """Realiza a inserção de uma nova avaliação no banco de dados."""
     if not dados or not 'usuario_id' in dados or not 'filme_id' in dados or not 'nota' in dados:
@@ -5,17 +49,119 @@ def registrar_avaliacao(conn, dados):
 
     try:
         cur = conn.cursor()
-        query = "INSERT INTO avaliacoes (usuario_id, filme_id, nota) VALUES (%s, %s, %s)"
-        
-        cur.execute(query, (
+        INSERIR_AVALIACAO.executar(cur, (
             dados['usuario_id'], 
             dados['filme_id'], 
             dados['nota']
         ))
+        inserida = cur.fetchone()
         
         conn.commit()
         cur.close()
-        return {'message': 'Avaliação registrada com sucesso!'}, 201
+        invalidar('avaliacoes')
+    except QueryCanceled:
+        # Tempo limite da rota: a API responde 503
+        conn.rollback()
+        raise
+    except Exception as e:
+        logger.exception("Erro ao inserir avaliação")
+        conn.rollback()
+        return {'message': 'Erro interno no servidor ao registrar a avaliação.'}, 500
+
+    _avisar_estruturas_em_memoria([inserida])
+    return {'message': 'Avaliação registrada com sucesso!'}, 201
+
+LOTE_MAXIMO = int(os.environ.get("LOTE_AVALIACOES_MAXIMO", "10000"))
+NOTA_MINIMA, NOTA_MAXIMA = 0, 10
+
+
+def validar_avaliacao(registro):
+    """Devolve a mensagem de erro de um registro do lote, ou None se for válido."""
+    if not isinstance(registro, dict):
+        return 'Registro deve ser um objeto JSON.'
+    faltando = [c for c in ('usuario_id', 'filme_id', 'nota') if c not in registro]
+    if faltando:
+        return f"Campos obrigatórios ausentes: {', '.join(faltando)}."
+    for campo in ('usuario_id', 'filme_id'):
+        valor = registro[campo]
+        if isinstance(valor, bool) or not isinstance(valor, int):
+            return f"'{campo}' deve ser um número inteiro."
+    nota = registro['nota']
+    if isinstance(nota, bool) or not isinstance(nota, numbers.Real):
+        return "'nota' deve ser um número."
+    if not NOTA_MINIMA <= nota <= NOTA_MAXIMA:
+        return f"'nota' deve estar entre {NOTA_MINIMA} e {NOTA_MAXIMA}."
+    return None
+
+
+def registrar_avaliacoes_em_lote(conn, registros):
+    """
+    Insere um lote de avaliações em uma única transação.
+
+    A validação é feita em uma passada: tipos e faixa de nota registro a
+    registro, e a existência de usuários e filmes com uma consulta para
+    cada tabela. Os registros válidos são gravados com um único INSERT de
+    várias linhas; os inválidos são devolvidos com a posição no lote.
+    """
+    if not isinstance(registros, list) or not registros:
+        return {'message': 'Erro: envie uma lista não vazia de avaliações.'}, 400
+    if len(registros) > LOTE_MAXIMO:
+        return {'message': f'Erro: o lote excede o máximo de {LOTE_MAXIMO} avaliações.'}, 413
+
+    erros = {}
+    for posicao, registro in enumerate(registros):
+        erro = validar_avaliacao(registro)
+        if erro:
+            erros[posicao] = erro
+
+    try:
+        cur = conn.cursor()
+        candidatos = [(p, r) for p, r in enumerate(registros) if p not in erros]
+
+        usuario_ids = list({r['usuario_id'] for _, r in candidatos})
+        filme_ids = list({r['filme_id'] for _, r in candidatos})
+        cur.execute("SELECT id FROM usuarios WHERE id = ANY(%s)", (usuario_ids,))
+        usuarios_existentes = {row[0] for row in cur.fetchall()}
+        cur.execute("SELECT id FROM filmes WHERE id = ANY(%s)", (filme_ids,))
+        filmes_existentes = {row[0] for row in cur.fetchall()}
+
+        valores = []
+        for posicao, registro in candidatos:
+            if registro['usuario_id'] not in usuarios_existentes:
+                erros[posicao] = f"Usuário {registro['usuario_id']} não encontrado."
+            elif registro['filme_id'] not in filmes_existentes:
+                erros[posicao] = f"Filme {registro['filme_id']} não encontrado."
+            else:
+                valores.append((registro['usuario_id'], registro['filme_id'], registro['nota']))
+
+        inseridas = []
+        if valores:
+            inseridas = execute_values(
+                cur,
+                "INSERT INTO avaliacoes (usuario_id, filme_id, nota) VALUES %s "
+                f"RETURNING id, usuario_id, filme_id, nota, {PAIS_DO_USUARIO}",
+                valores,
+                page_size=len(valores),
+                fetch=True,
+            )
+        conn.commit()
+        cur.close()
+        if valores:
+            invalidar('avaliacoes')
+    except QueryCanceled:
+        conn.rollback()
+        raise
     except Exception as e:
-        print(f"Erro ao inserir avaliação: {e}")
-        return {'message': 'Erro interno no servidor ao registrar a avaliação.'}, 500
\ No newline at end of file
+        logger.exception("Erro ao inserir lote de avaliações")
+        conn.rollback()
+        return {'message': 'Erro interno no servidor ao registrar o lote de avaliações.'}, 500
+
+    _avisar_estruturas_em_memoria(inseridas)
+    resposta = {
+        'inseridas': len(valores),
+        'rejeitadas': len(erros),
+        'erros': [{'posicao': p, 'erro': erros[p]} for p in sorted(erros)],
+    }
+    if not erros:
+        return resposta, 201
+    return resposta, (207 if valores else 400)
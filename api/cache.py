@@ -0,0 +1,188 @@
+import os
+import time
+import datetime
+import threading
+import functools
+from collections import OrderedDict
+
+from flask import current_app, request
+
+
+class BackendMemoria:
+    """
+    Armazenamento em memória do processo: LRU limitado a 'max_entradas',
+    com prazo de validade (TTL) por entrada.
+
+    Qualquer backend com os mesmos métodos pode ser usado no lugar deste.
+    Um backend compartilhado entre os workers do gunicorn (Redis, por
+    exemplo) mapearia obter/gravar para GET/SETEX e versao/incrementar_versao
+    para GET/INCR de um contador por tabela.
+    """
+
+    def __init__(self, max_entradas=256):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._versoes = {}
+        self._lock = threading.Lock()
+        self.remocoes = 0
+
+    def obter(self, chave):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return None
+            valor, expira_em = entrada
+            if expira_em <= time.monotonic():
+                del self._entradas[chave]
+                return None
+            self._entradas.move_to_end(chave)
+            return valor
+
+    def gravar(self, chave, valor, ttl):
+        with self._lock:
+            self._entradas[chave] = (valor, time.monotonic() + ttl)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.remocoes += 1
+
+    def versao(self, tabela):
+        with self._lock:
+            return self._versoes.get(tabela, 0)
+
+    def incrementar_versao(self, tabela):
+        with self._lock:
+            self._versoes[tabela] = self._versoes.get(tabela, 0) + 1
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def tamanho(self):
+        with self._lock:
+            return len(self._entradas)
+
+
+class CacheRespostas:
+    """
+    Cache das respostas JSON das rotas de consulta.
+
+    Cada rota declara as tabelas de que depende. A chave de uma entrada
+    inclui a versão atual dessas tabelas, então invalidar uma tabela
+    (incrementar sua versão) torna inacessíveis só as respostas que a usam;
+    as entradas antigas saem do cache pelo LRU ou pelo TTL. As entradas
+    guardam o corpo já serializado, e um acerto devolve os bytes sem
+    passar pelo jsonify.
+    """
+
+    def __init__(self, backend, habilitado=True, max_bytes_fluxo=1024 * 1024):
+        self.backend = backend
+        self.habilitado = habilitado
+        self.max_bytes_fluxo = max_bytes_fluxo
+        self.acertos = 0
+        self.falhas = 0
+        # Função opcional que devolve versões das tabelas compartilhadas
+        # entre os processos (por exemplo, lidas do banco), ou None
+        self.versoes_externas = None
+        # Função opcional que devolve a data atual do banco, ou None
+        self.data_externa = None
+
+    def _chave(self, tabelas, por_data=False):
+        versoes = '|'.join(f"{t}:{self.backend.versao(t)}" for t in tabelas)
+        externas = self.versoes_externas(tabelas) if self.versoes_externas else None
+        if externas is not None:
+            # Escritas feitas por outros workers também mudam a chave
+            versoes += '|' + '|'.join(f"{t}@{externas[t]}" for t in tabelas)
+        if por_data:
+            # Sem a data do banco, vale a data local
+            data = self.data_externa() if self.data_externa else None
+            versoes += f"|{data or datetime.date.today().isoformat()}"
+        return f"{request.path}?{request.query_string.decode()}|{versoes}"
+
+    def rota(self, ttl, tabelas, por_data=False):
+        """
+        Decorador para rotas GET cujo resultado depende de 'tabelas'. Com
+        'por_data', a chave inclui a data atual, para respostas que mudam
+        com as faixas etárias (os aniversários não gravam em tabela alguma).
+        """
+        def decorador(view):
+            @functools.wraps(view)
+            def envolvida(*args, **kwargs):
+                if not self.habilitado:
+                    return view(*args, **kwargs)
+
+                chave = self._chave(tabelas, por_data)
+                corpo = self.backend.obter(chave)
+                if corpo is not None:
+                    self.acertos += 1
+                    resposta = current_app.response_class(corpo, mimetype='application/json')
+                    resposta.headers['X-Cache'] = 'HIT'
+                    return resposta
+
+                self.falhas += 1
+                resposta = current_app.make_response(view(*args, **kwargs))
+                if resposta.status_code == 200:
+                    if resposta.is_streamed:
+                        resposta.response = self._guardar_ao_final(chave, ttl, resposta.response)
+                    else:
+                        self.backend.gravar(chave, resposta.get_data(), ttl)
+                resposta.headers['X-Cache'] = 'MISS'
+                return resposta
+            return envolvida
+        return decorador
+
+    def _guardar_ao_final(self, chave, ttl, pedacos):
+        """
+        Repassa os pedaços de uma resposta em fluxo e, se ela terminar sem
+        passar de 'max_bytes_fluxo', guarda o corpo completo no cache.
+        Respostas maiores seguem em fluxo sem ocupar memória.
+        """
+        guardados, tamanho = [], 0
+        try:
+            for pedaco in pedacos:
+                if isinstance(pedaco, str):
+                    pedaco = pedaco.encode()
+                if guardados is not None:
+                    tamanho += len(pedaco)
+                    if tamanho <= self.max_bytes_fluxo:
+                        guardados.append(pedaco)
+                    else:
+                        guardados = None
+                yield pedaco
+            if guardados is not None:
+                self.backend.gravar(chave, b''.join(guardados), ttl)
+        finally:
+            if hasattr(pedacos, 'close'):
+                pedacos.close()
+
+    def invalidar(self, *tabelas):
+        """
+        Invalida as respostas que dependem de alguma das tabelas. Sem
+        argumentos, esvazia o cache inteiro.
+        """
+        if not tabelas:
+            self.backend.limpar()
+            return
+        for tabela in tabelas:
+            self.backend.incrementar_versao(tabela)
+
+    def estatisticas(self):
+        return {
+            'habilitado': self.habilitado,
+            'entradas': self.backend.tamanho(),
+            'max_entradas': self.backend.max_entradas,
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'remocoes_lru': self.backend.remocoes,
+        }
+
+
+cache = CacheRespostas(
+    BackendMemoria(max_entradas=int(os.environ.get("CACHE_MAX_ENTRADAS", "256"))),
+    habilitado=os.environ.get("CACHE_HABILITADO", "1") == "1",
+    max_bytes_fluxo=int(os.environ.get("CACHE_MAX_BYTES_FLUXO", str(1024 * 1024))),
+)
+
+
+def invalidar(*tabelas):
+    cache.invalidar(*tabelas)
@@ -0,0 +1,211 @@
+"""
+Validadores (ETag) e cabeçalhos Cache-Control das respostas da API.
+
+A ETag de uma resposta é o hash do caminho, da query string e das versões,
+no banco, das tabelas de que a rota depende. As versões ficam na tabela
+'versoes_tabelas', incrementada por gatilhos a cada escrita (migração 6 do
+importador), então todos os workers calculam a mesma ETag para os mesmos
+dados. Uma revalidação (If-None-Match) custa a leitura dessas versões, e
+não as consultas do relatório.
+
+Com réplicas de leitura (DATABASE_READ_URLS), as versões e o corpo de uma
+resposta são lidos da mesma réplica, para que a ETag corresponda aos dados.
+"""
+import math
+import hashlib
+import logging
+import functools
+
+import psycopg2
+from flask import current_app, g, request
+
+from database import conexao, get_replicas, replica_de_leitura
+
+
+logger = logging.getLogger(__name__)
+
+# Cache-Control de cada grupo de rotas. 'stale-while-revalidate' permite que
+# o micro-cache do nginx (frontend/nginx.conf) continue servindo a cópia
+# antiga enquanto busca a nova em segundo plano.
+CACHE_CONTROL_RELATORIOS = 'public, max-age=5, stale-while-revalidate=30'
+CACHE_CONTROL_FAIXA_ETARIA = 'public, max-age=30, stale-while-revalidate=300'
+CACHE_CONTROL_BUSCAS = 'public, max-age=30'
+CACHE_CONTROL_EM_ALTA = 'public, max-age=60'
+CACHE_CONTROL_PADRAO = 'no-store'
+
+TABELAS_VERSIONADAS = ('filmes', 'usuarios', 'avaliacoes')
+
+# statement_timeout da leitura das versões, feita antes de toda rota com
+# ETag. Se passar disso, a resposta sai sem ETag em vez de prender o worker.
+TEMPO_LIMITE_VERSOES_MS = 500
+
+# Marca, no navegador, quem gravou algo há pouco: as leituras dessa pessoa
+# vão ao primário até que as réplicas certamente tenham a escrita
+COOKIE_ESCRITA_RECENTE = 'escrita_recente'
+
+
+def replica_da_requisicao():
+    """
+    Réplica que atende as leituras desta requisição, escolhida na primeira
+    chamada, ou None para ler do primário (sem réplicas saudáveis, ou logo
+    depois de uma escrita do mesmo cliente).
+    """
+    if 'replica' not in g:
+        escreveu = request.cookies.get(COOKIE_ESCRITA_RECENTE)
+        g.replica = None if escreveu else replica_de_leitura()
+    return g.replica
+
+
+def versoes_do_banco():
+    """
+    Versões de todas as tabelas versionadas e a data do banco, lidas uma
+    vez por requisição (ficam em 'flask.g'). Devolve None se o banco não
+    responder a tempo ou ainda não tiver a tabela 'versoes_tabelas'.
+    """
+    if 'versoes_tabelas' not in g:
+        g.versoes_tabelas = None
+        with conexao(replica_da_requisicao(), tempo_limite_ms=TEMPO_LIMITE_VERSOES_MS) as conn:
+            if conn is not None:
+                try:
+                    cur = conn.cursor()
+                    cur.execute("SELECT tabela, versao, CURRENT_DATE FROM versoes_tabelas")
+                    linhas = cur.fetchall()
+                    conn.commit()
+                    cur.close()
+                    if linhas:
+                        versoes = {tabela: versao for tabela, versao, _ in linhas}
+                        versoes['data'] = linhas[0][2].isoformat()
+                        g.versoes_tabelas = versoes
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    logger.warning("Versões das tabelas indisponíveis: %s", e)
+    return g.versoes_tabelas
+
+
+def versoes_de(tabelas):
+    """Versão no banco de cada tabela, ou None se as versões estiverem indisponíveis."""
+    versoes = versoes_do_banco()
+    if versoes is None:
+        return None
+    return {tabela: versoes.get(tabela) for tabela in tabelas}
+
+
+def data_do_banco():
+    """CURRENT_DATE do banco (AAAA-MM-DD), ou None se as versões estiverem indisponíveis."""
+    versoes = versoes_do_banco()
+    return None if versoes is None else versoes['data']
+
+
+def etag_de(tabelas, por_data=False):
+    """
+    ETag da requisição atual, ou None sem as versões do banco. Com
+    'por_data', inclui a data do banco, para rotas que mudam com as
+    faixas etárias (que dependem dos aniversários, e não só de escritas).
+    """
+    versoes = versoes_do_banco()
+    if versoes is None:
+        return None
+    partes = [request.path, request.query_string.decode()]
+    partes += [f"{tabela}:{versoes.get(tabela)}" for tabela in sorted(tabelas)]
+    if por_data:
+        partes.append(versoes['data'])
+    return hashlib.sha1('|'.join(partes).encode()).hexdigest()
+
+
+def nao_modificado(etag):
+    """True se o cliente já tem a resposta com esta ETag (If-None-Match)."""
+    # If-None-Match usa a comparação fraca: o nginx marca como fraca a ETag
+    # das respostas que comprime com gzip
+    return etag is not None and request.if_none_match.contains_weak(etag)
+
+
+def resposta_304():
+    return current_app.response_class(status=304)
+
+
+def validar(resposta, etag, cache_control):
+    """Acrescenta a ETag e o Cache-Control a uma resposta 200 ou 304."""
+    if resposta.status_code in (200, 304):
+        if etag is not None:
+            resposta.set_etag(etag)
+        resposta.headers['Cache-Control'] = cache_control
+    return resposta
+
+
+def condicional(tabelas, cache_control, por_data=False):
+    """
+    Decorador para rotas GET cujo resultado depende de 'tabelas': responde
+    304 sem executar a rota quando o If-None-Match do cliente ainda vale e,
+    nas demais respostas, envia a ETag e o Cache-Control.
+    """
+    def decorador(view):
+        @functools.wraps(view)
+        def envolvida(*args, **kwargs):
+            etag = etag_de(tabelas, por_data)
+            if nao_modificado(etag):
+                return validar(resposta_304(), etag, cache_control)
+            resposta = current_app.make_response(view(*args, **kwargs))
+            return validar(resposta, etag, cache_control)
+        return envolvida
+    return decorador
+
+
+def apenas_cache_control(cache_control):
+    """
+    Decorador para rotas GET cujo resultado muda com o tempo, e não só com
+    as tabelas (janelas relativas a agora): envia o Cache-Control, mas
+    nenhuma ETag, que continuaria valendo com a janela já deslocada.
+    """
+    def decorador(view):
+        @functools.wraps(view)
+        def envolvida(*args, **kwargs):
+            resposta = current_app.make_response(view(*args, **kwargs))
+            return validar(resposta, None, cache_control)
+        return envolvida
+    return decorador
+
+
+def por_conteudo(cache_control):
+    """
+    Decorador para rotas GET cujo resultado não vem só das tabelas do banco
+    (os agregados aproximados, calculados na memória de cada worker): a ETag
+    é fraca e calculada do próprio corpo, então uma revalidação só recebe
+    304 se o worker que a atende gerar o mesmo corpo que o cliente já tem.
+    """
+    def decorador(view):
+        @functools.wraps(view)
+        def envolvida(*args, **kwargs):
+            resposta = current_app.make_response(view(*args, **kwargs))
+            if resposta.status_code != 200:
+                return resposta
+            etag = hashlib.sha1(resposta.get_data()).hexdigest()
+            if nao_modificado(etag):
+                resposta = resposta_304()
+            resposta.set_etag(etag, weak=True)
+            resposta.headers['Cache-Control'] = cache_control
+            return resposta
+        return envolvida
+    return decorador
+
+
+def _cache_control_padrao(resposta):
+    resposta.headers.setdefault('Cache-Control', CACHE_CONTROL_PADRAO)
+    return resposta
+
+
+def _marcar_escrita(resposta):
+    replicas = get_replicas()
+    if replicas is not None and request.method not in ('GET', 'HEAD', 'OPTIONS') and resposta.status_code < 400:
+        # Até a réplica mais atrasada ainda em rotação ter aplicado a escrita
+        validade = math.ceil(replicas.atraso_maximo + replicas.intervalo)
+        resposta.set_cookie(COOKIE_ESCRITA_RECENTE, '1', max_age=validade, httponly=True, samesite='Lax')
+    return resposta
+
+
+def configurar(app):
+    """
+    Rotas sem Cache-Control próprio (cadastros, health, métricas) não são
+    guardadas por ninguém, e as escritas marcam o cliente para ler do primário.
+    """
+    app.after_request(_cache_control_padrao)
+    app.after_request(_marcar_escrita)
@@ -0,0 +1,267 @@
+"""
+Consultas dos relatórios e das buscas e a formatação das linhas em JSON.
+Compartilhadas pela API síncrona (api.py) e pela assíncrona (api_async.py),
+que usam drivers diferentes mas o mesmo SQL e o mesmo formato de resposta.
+As conexões das duas já devolvem NUMERIC como float (serializacao.py).
+"""
+
+
+# --- RELATÓRIOS ---
+
+TOP_FILMES_GENERO = """
+    WITH FilmesRanqueados AS (
+        SELECT
+            f.genero,
+            f.titulo,
+            ROUND(r.soma_notas / r.quantidade_notas, 1) as nota_media,
+            ROW_NUMBER() OVER (PARTITION BY f.genero ORDER BY r.soma_notas / r.quantidade_notas DESC) as ranking
+        FROM
+            resumo_filmes AS r
+        JOIN
+            filmes AS f ON f.id = r.filme_id
+        WHERE
+            r.quantidade_notas > 0
+    )
+    SELECT genero, titulo, nota_media, ranking
+    FROM FilmesRanqueados
+    WHERE ranking <= 10
+    ORDER BY genero, nota_media DESC;
+"""
+
+
+def formatar_top_filmes_genero(colunas, linhas):
+    result = {}
+    for genero, titulo, nota, ranking in linhas:
+        if genero not in result:
+            result[genero] = []
+        result[genero].append({'titulo': titulo, 'nota_media': nota, 'posicao_no_genero': ranking})
+    return result
+
+
+CINCO_POPULARES = """
+    SELECT
+        f.titulo, f.genero, f.ano, r.quantidade_avaliacoes
+    FROM
+        resumo_filmes AS r
+    JOIN
+        filmes AS f ON f.id = r.filme_id
+    WHERE
+        r.quantidade_avaliacoes > 0
+    ORDER BY
+        r.quantidade_avaliacoes DESC, r.filme_id
+    LIMIT 5;
+"""
+
+
+def formatar_cinco_populares(colunas, linhas):
+    return [
+        {'indice': indice, **dict(zip(colunas, row))}
+        for indice, row in enumerate(linhas, start=1)
+    ]
+
+
+AVALIACOES_PAIS = """
+    SELECT pais, quantidade_avaliacoes AS total_avaliacoes
+    FROM resumo_paises
+    WHERE quantidade_avaliacoes > 0
+    ORDER BY total_avaliacoes DESC;
+"""
+
+
+def formatar_avaliacoes_pais(colunas, linhas):
+    return [{'pais': pais, 'total_avaliacoes': count} for pais, count in linhas]
+
+
+# Move para a nova faixa os usuários que fizeram aniversário em um limite de
+# faixa; na maioria dos dias não altera nenhuma linha. Precisa de commit.
+ATUALIZAR_FAIXAS_ETARIAS = "SELECT atualizar_faixas_etarias()"
+
+# Colunas listadas, e não '*': a consulta é preparada em cada conexão do
+# pool, e uma coluna nova na view mudaria o tipo do resultado do plano guardado
+NOTAS_MEDIAS_FAIXA_ETARIA = """
+    SELECT titulo, media_criancas_ate_12, media_adolescentes_13_a_17, media_jovens_adultos_18_a_29,
+           media_adultos_30_a_49, media_50_mais, media_geral
+    FROM public.notas_medias_por_filme_por_idade
+    WHERE (%(after)s::text IS NULL OR titulo > %(after)s)
+    ORDER BY titulo
+    LIMIT %(limite)s
+"""
+
+
+def formatar_linha_faixa_etaria(colunas, linha):
+    return dict(zip(colunas, linha))
+
+
+def formatar_notas_medias_faixa_etaria(colunas, linhas):
+    return [formatar_linha_faixa_etaria(colunas, linha) for linha in linhas]
+
+
+GENEROS_MELHOR_AVALIACAO = """
+    SELECT genero, (soma_notas / quantidade_notas)::numeric(10,2) AS nota_media
+    FROM resumo_generos
+    ORDER BY nota_media DESC;
+"""
+
+
+def formatar_generos_melhor_avaliacao(colunas, linhas):
+    return [{'genero': g, 'nota_media': n} for g, n in linhas]
+
+
+# Os cinco relatórios completos: nome -> (consulta, parâmetros, formatação)
+RELATORIOS = {
+    'top-filmes-genero': (TOP_FILMES_GENERO, None, formatar_top_filmes_genero),
+    'cinco-populares': (CINCO_POPULARES, None, formatar_cinco_populares),
+    'avaliacoes-pais': (AVALIACOES_PAIS, None, formatar_avaliacoes_pais),
+    'notas-medias-faixa-etaria': (
+        NOTAS_MEDIAS_FAIXA_ETARIA, {'after': None, 'limite': None}, formatar_notas_medias_faixa_etaria,
+    ),
+    'generos-melhor-avaliacao': (GENEROS_MELHOR_AVALIACAO, None, formatar_generos_melhor_avaliacao),
+}
+
+# Tabelas de que cada relatório depende, para invalidar cache e ETags
+TABELAS_DOS_RELATORIOS = {
+    'top-filmes-genero': ('filmes', 'avaliacoes'),
+    'cinco-populares': ('filmes', 'avaliacoes'),
+    'avaliacoes-pais': ('usuarios', 'avaliacoes'),
+    'notas-medias-faixa-etaria': ('filmes', 'usuarios', 'avaliacoes'),
+    'generos-melhor-avaliacao': ('filmes', 'avaliacoes'),
+}
+
+
+# Filmes mais avaliados em uma janela recente. O filtro em 'criado_em' contra
+# now() (estável na consulta) permite ao PostgreSQL ignorar as partições
+# mensais de 'avaliacoes' fora da janela já no início da execução.
+EM_ALTA = """
+    SELECT f.id, f.titulo, f.genero, f.ano,
+           COUNT(*) AS quantidade_avaliacoes,
+           ROUND(AVG(a.nota), 2) AS nota_media
+    FROM avaliacoes AS a
+    JOIN filmes AS f ON f.id = a.filme_id
+    WHERE a.criado_em >= now() - %(janela)s::interval
+    GROUP BY f.id
+    ORDER BY quantidade_avaliacoes DESC, nota_media DESC NULLS LAST, f.id
+    LIMIT %(limite)s
+"""
+
+def formatar_em_alta(colunas, linhas):
+    return [
+        {'id': i, 'titulo': t, 'genero': g, 'ano': a, 'quantidade_avaliacoes': q, 'nota_media': n}
+        for i, t, g, a, q, n in linhas
+    ]
+
+
+# --- PARÂMETROS DE CONSULTA ---
+
+def limite_opcional(args):
+    """Lê 'limit' da query string; None quando ausente."""
+    valor = args.get('limit')
+    if valor is None:
+        return None
+    try:
+        limite = int(valor)
+    except ValueError:
+        raise ValueError("Parâmetro 'limit' deve ser um número inteiro.")
+    if limite < 1:
+        raise ValueError("Parâmetro 'limit' deve ser maior que zero.")
+    return limite
+
+
+JANELA_EM_ALTA_PADRAO = '7d'
+JANELA_EM_ALTA_MAXIMA_DIAS = 365
+LIMITE_EM_ALTA_PADRAO = 10
+UNIDADES_DA_JANELA = {'h': 'hours', 'd': 'days'}
+
+
+def parametros_em_alta(args):
+    """
+    Lê 'janela' (horas ou dias, como '24h' ou '7d') e 'limit' da query
+    string. Devolve a janela como um intervalo do PostgreSQL e o limite.
+    """
+    janela = args.get('janela', JANELA_EM_ALTA_PADRAO).strip().lower()
+    quantidade, unidade = janela[:-1], janela[-1:]
+    if unidade not in UNIDADES_DA_JANELA or not quantidade.isdigit() or int(quantidade) < 1:
+        raise ValueError("Parâmetro 'janela' deve ser um número de horas ou dias, como '24h' ou '7d'.")
+    horas = int(quantidade) * (24 if unidade == 'd' else 1)
+    if horas > JANELA_EM_ALTA_MAXIMA_DIAS * 24:
+        raise ValueError(f"Parâmetro 'janela' deve ser de no máximo {JANELA_EM_ALTA_MAXIMA_DIAS} dias.")
+    limite = limite_opcional(args) or LIMITE_EM_ALTA_PADRAO
+    if limite > LIMITE_BUSCA_MAXIMO:
+        raise ValueError(f"Parâmetro 'limit' deve ser no máximo {LIMITE_BUSCA_MAXIMO}.")
+    return f"{int(quantidade)} {UNIDADES_DA_JANELA[unidade]}", limite
+
+
+def secoes_do_dashboard(args):
+    """
+    Lê '?secoes=' (nomes de relatórios separados por vírgula). Sem o
+    parâmetro, devolve todos os relatórios, na ordem de RELATORIOS.
+    """
+    secoes = [s for s in args.get('secoes', '').split(',') if s] or list(RELATORIOS)
+    desconhecidas = [s for s in secoes if s not in RELATORIOS]
+    if desconhecidas:
+        raise ValueError(f"Seções desconhecidas: {', '.join(desconhecidas)}.")
+    return secoes
+
+
+# --- BUSCAS ---
+
+LIMITE_BUSCA_PADRAO = 50
+LIMITE_BUSCA_MAXIMO = 500
+
+
+def parametros_de_busca(args):
+    """
+    Lê 'limit', 'offset' e 'sem_acento' da query string. Sem 'limit' nem
+    'after', o limite é None e a busca devolve todos os resultados; com
+    'after' sem 'limit', as páginas têm LIMITE_BUSCA_PADRAO linhas. Levanta
+    ValueError com uma mensagem para o usuário se algum for inválido.
+    """
+    try:
+        limite = None if args.get('limit') is None else int(args.get('limit'))
+        deslocamento = int(args.get('offset', 0))
+    except ValueError:
+        raise ValueError("Parâmetros 'limit' e 'offset' devem ser números inteiros.")
+    if limite is None and args.get('after') is not None:
+        limite = LIMITE_BUSCA_PADRAO
+    if (limite is not None and not 1 <= limite <= LIMITE_BUSCA_MAXIMO) or deslocamento < 0:
+        raise ValueError(f"'limit' deve estar entre 1 e {LIMITE_BUSCA_MAXIMO} e 'offset' não pode ser negativo.")
+    sem_acento = args.get('sem_acento', '0').lower() in ('1', 'true', 'sim')
+    return limite, deslocamento, sem_acento
+
+
+def padrao_de_substring(termo):
+    """Escapa os curingas do LIKE para que o termo seja buscado literalmente."""
+    termo = termo.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{termo}%'
+
+
+def consulta_de_busca(colunas, tabela, coluna_busca, sem_acento):
+    """
+    Monta a busca por substring, ordenada pela similaridade de trigramas
+    com o termo. Os dois modos usam os índices GIN criados pelo importador.
+
+    Com 'after' (o último valor de coluna_busca recebido), a página começa
+    logo depois dele na mesma ordenação, sem precisar de OFFSET.
+    """
+    if sem_acento:
+        alvo, termo = f"texto_busca({coluna_busca})", "texto_busca(%(termo)s)"
+        alvo_after = "texto_busca(%(after)s)"
+        filtro = f"{alvo} LIKE texto_busca(%(padrao)s)"
+    else:
+        alvo, termo, alvo_after = coluna_busca, "%(termo)s", "%(after)s"
+        filtro = f"{alvo} ILIKE %(padrao)s"
+    return f"""
+        SELECT {colunas} FROM {tabela}
+        WHERE {filtro}
+          AND (%(after)s::text IS NULL
+               OR (-similarity({alvo}, {termo}), {coluna_busca}) > (-similarity({alvo_after}, {termo}), %(after)s))
+        ORDER BY similarity({alvo}, {termo}) DESC, {coluna_busca}
+        LIMIT %(limite)s OFFSET %(deslocamento)s
+    """
+
+
+def formatar_usuario_encontrado(colunas, u):
+    return {'id': u[0], 'nome_de_usuario': u[1], 'nome': u[2]}
+
+
+def formatar_filme_encontrado(colunas, f):
+    return {'id': f[0], 'titulo': f[1], 'ano': f[2]}
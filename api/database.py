@@ -1,22 +1,426 @@
 import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import extensions
+
+from preparadas import ConexaoPreparada, CursorComTempoLimite
+from serializacao import registrar_tipos
+
+
+logger = logging.getLogger(__name__)
+
+
+class PoolDeConexoes:
+    """
+    Pool de conexões compartilhado pelo processo inteiro.
+
+    Mantém entre 'minimo' e 'maximo' conexões abertas com o banco. Quando
+    todas estão em uso, quem pede uma conexão espera até 'timeout' segundos
+    antes de desistir. Só as conexões paradas há mais de 'ociosidade_teste'
+    segundos são testadas antes de serem entregues (e descartadas se
+    estiverem quebradas); as usadas há pouco vão direto, e uma que falhar
+    durante o uso é descartada na devolução.
+    """
+
+    def __init__(self, db_url, minimo=1, maximo=10, timeout=5.0, timeout_conexao=5, ociosidade_teste=30.0):
+        if minimo < 0 or maximo < 1 or minimo > maximo:
+            raise ValueError("Tamanhos inválidos para o pool de conexões.")
+        self.db_url = db_url
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.timeout_conexao = timeout_conexao
+        self.ociosidade_teste = ociosidade_teste
+
+        # Pares (conexão, instante em que ficou livre); a última devolvida sai primeiro
+        self._livres = []
+        self._em_uso = set()
+        self._condicao = threading.Condition()
+
+        # Estatísticas acumuladas desde a criação do pool
+        self._total_checkouts = 0
+        self._total_esperas = 0
+        self._tempo_espera_total = 0.0
+        self._tempo_espera_maximo = 0.0
+        self._total_timeouts = 0
+        self._total_descartadas = 0
+
+        for _ in range(minimo):
+            self._livres.append((self._nova_conexao(), time.monotonic()))
+
+    def _nova_conexao(self):
+        # A conexão guarda as consultas já preparadas nela; os cursores medem o
+        # tempo de banco, registram as consultas lentas e aplicam o tempo limite
+        conn = psycopg2.connect(
+            self.db_url, connect_timeout=self.timeout_conexao,
+            connection_factory=ConexaoPreparada, cursor_factory=CursorComTempoLimite,
+        )
+        # NUMERIC chega como float, pronto para o JSON
+        registrar_tipos(conn)
+        return conn
+
+    def _conexao_saudavel(self, conn):
+        """Verifica, com um 'SELECT 1', se a conexão ainda responde."""
+        if conn.closed:
+            return False
+        try:
+            # Em autocommit o teste custa uma única ida ao servidor
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.autocommit = False
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _descartar(self, conn):
+        self._total_descartadas += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def obter(self):
+        """
+        Retira uma conexão do pool. Levanta TimeoutError se nenhuma
+        conexão ficar disponível dentro do tempo limite.
+        """
+        inicio = time.monotonic()
+        limite = inicio + self.timeout
+        esperou = False
+        livre_desde = None
+
+        with self._condicao:
+            while True:
+                if self._livres:
+                    conn, livre_desde = self._livres.pop()
+                    break
+                if len(self._em_uso) < self.maximo:
+                    conn = None
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._total_timeouts += 1
+                    raise TimeoutError(
+                        f"Nenhuma conexão livre no pool após {self.timeout}s."
+                    )
+                esperou = True
+                self._condicao.wait(restante)
+
+            # Reserva a vaga antes de sair do lock para não ultrapassar o máximo
+            marcador = object()
+            self._em_uso.add(marcador)
+
+        try:
+            testar = conn is not None and (conn.closed or time.monotonic() - livre_desde > self.ociosidade_teste)
+            if conn is None or (testar and not self._conexao_saudavel(conn)):
+                if conn is not None:
+                    self._descartar(conn)
+                conn = self._nova_conexao()
+        except Exception:
+            with self._condicao:
+                self._em_uso.discard(marcador)
+                self._condicao.notify()
+            raise
+
+        espera = time.monotonic() - inicio
+        with self._condicao:
+            self._em_uso.discard(marcador)
+            self._em_uso.add(conn)
+            self._total_checkouts += 1
+            if esperou:
+                self._total_esperas += 1
+            self._tempo_espera_total += espera
+            self._tempo_espera_maximo = max(self._tempo_espera_maximo, espera)
+        return conn
+
+    def devolver(self, conn):
+        """
+        Devolve a conexão ao pool. Transações deixadas abertas são
+        desfeitas; conexões quebradas são fechadas em vez de reaproveitadas.
+        """
+        reaproveitar = not conn.closed
+        if reaproveitar:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                reaproveitar = False
+
+        with self._condicao:
+            self._em_uso.discard(conn)
+            if reaproveitar:
+                self._livres.append((conn, time.monotonic()))
+            else:
+                self._descartar(conn)
+            self._condicao.notify()
+
+    @contextmanager
+    def conexao(self):
+        conn = self.obter()
+        try:
+            yield conn
+        finally:
+            self.devolver(conn)
+
+    def fechar(self):
+        with self._condicao:
+            for conn, _ in self._livres:
+                conn.close()
+            self._livres = []
+
+    def estatisticas(self):
+        with self._condicao:
+            checkouts = self._total_checkouts
+            return {
+                'minimo': self.minimo,
+                'maximo': self.maximo,
+                'em_uso': len(self._em_uso),
+                'livres': len(self._livres),
+                'total_checkouts': checkouts,
+                'total_esperas': self._total_esperas,
+                'total_timeouts': self._total_timeouts,
+                'total_descartadas': self._total_descartadas,
+                'espera_media_ms': round(1000 * self._tempo_espera_total / checkouts, 3) if checkouts else 0.0,
+                'espera_maxima_ms': round(1000 * self._tempo_espera_maximo, 3),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Devolve o pool do processo, criando-o na primeira chamada. O tamanho
+    é configurado pelas variáveis DB_POOL_MIN, DB_POOL_MAX e DB_POOL_TIMEOUT;
+    DB_POOL_TESTE_OCIOSA_SEGUNDOS é a ociosidade a partir da qual a conexão
+    é testada antes de ser entregue.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                db_url = os.environ.get("DATABASE_URL")
+                if not db_url:
+                    raise ValueError("A variável de ambiente DATABASE_URL não foi definida.")
+                _pool = PoolDeConexoes(
+                    db_url,
+                    minimo=int(os.environ.get("DB_POOL_MIN", "1")),
+                    maximo=int(os.environ.get("DB_POOL_MAX", "10")),
+                    timeout=float(os.environ.get("DB_POOL_TIMEOUT", "5")),
+                    ociosidade_teste=float(os.environ.get("DB_POOL_TESTE_OCIOSA_SEGUNDOS", "30")),
+                )
+    return _pool
+
+
+# --- RÉPLICAS DE LEITURA ---
+
+# Atraso da réplica em segundos: zero se ela já aplicou todo o WAL recebido;
+# senão, o tempo desde a última transação aplicada
+CONSULTA_ATRASO = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class Replica:
+    """Pool de uma réplica de leitura e o resultado da última verificação de saúde."""
+
+    def __init__(self, db_url, maximo, timeout, nome):
+        # As réplicas não abrem conexões na criação: uma réplica fora do ar
+        # não pode impedir a API de subir
+        self.pool = PoolDeConexoes(db_url, minimo=0, maximo=maximo, timeout=timeout, timeout_conexao=2)
+        self.nome = nome
+        self.saudavel = False
+        self.atraso_s = None
+        self.erro = None
+        self.verificada_em = None
+
+    def marcar_falha(self, erro):
+        self.saudavel = False
+        self.erro = str(erro).strip()
+
+    def verificar(self, atraso_maximo):
+        try:
+            with self.pool.conexao() as conn:
+                cur = conn.cursor()
+                cur.execute(CONSULTA_ATRASO)
+                atraso = float(cur.fetchone()[0])
+                conn.commit()
+                cur.close()
+        except Exception as e:
+            if self.saudavel:
+                logger.warning("Réplica %s fora de rotação: %s", self.nome, e)
+            self.atraso_s = None
+            self.marcar_falha(e)
+        else:
+            saudavel = atraso <= atraso_maximo
+            if saudavel != self.saudavel:
+                if saudavel:
+                    logger.info("Réplica %s de volta à rotação (atraso %.1fs).", self.nome, atraso)
+                else:
+                    logger.warning("Réplica %s fora de rotação: atraso de %.1fs.", self.nome, atraso)
+            self.atraso_s = atraso
+            self.saudavel = saudavel
+            self.erro = None if saudavel else f"Atraso de {atraso:.1f}s acima de {atraso_maximo}s."
+        self.verificada_em = time.time()
+
+    def estatisticas(self):
+        return {
+            'nome': self.nome,
+            'saudavel': self.saudavel,
+            'atraso_s': self.atraso_s,
+            'erro': self.erro,
+            'verificada_em': self.verificada_em,
+            **self.pool.estatisticas(),
+        }
+
+
+class Replicas:
+    """
+    Réplicas de leitura do processo, escolhidas em rodízio entre as
+    saudáveis. Uma thread mede o atraso de cada uma a cada 'intervalo'
+    segundos; acima de 'atraso_maximo', ou sem responder, a réplica sai de
+    rotação até a próxima verificação que passar.
+    """
+
+    def __init__(self, urls, maximo, timeout, atraso_maximo=5.0, intervalo=2.0):
+        self.replicas = [Replica(url, maximo, timeout, f"replica{i}") for i, url in enumerate(urls, 1)]
+        self.atraso_maximo = atraso_maximo
+        self.intervalo = intervalo
+        self._proxima = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._verificar_sempre, name='verificacao-replicas', daemon=True)
+        self._thread.start()
+
+    def _verificar_sempre(self):
+        while True:
+            for replica in self.replicas:
+                replica.verificar(self.atraso_maximo)
+            time.sleep(self.intervalo)
+
+    def escolher(self):
+        """A próxima réplica saudável do rodízio, ou None se nenhuma estiver."""
+        with self._lock:
+            for _ in range(len(self.replicas)):
+                replica = self.replicas[self._proxima]
+                self._proxima = (self._proxima + 1) % len(self.replicas)
+                if replica.saudavel:
+                    return replica
+        return None
+
+    def estatisticas(self):
+        return [replica.estatisticas() for replica in self.replicas]
+
+
+_replicas = None
+
+
+def get_replicas():
+    """
+    Réplicas configuradas em DATABASE_READ_URLS (URLs separadas por
+    vírgula), criadas na primeira chamada, ou None se não houver nenhuma.
+    """
+    global _replicas
+    urls = [url.strip() for url in os.environ.get("DATABASE_READ_URLS", "").split(",") if url.strip()]
+    if urls and _replicas is None:
+        with _pool_lock:
+            if _replicas is None:
+                _replicas = Replicas(
+                    urls,
+                    maximo=int(os.environ.get("DB_POOL_MAX", "10")),
+                    timeout=float(os.environ.get("DB_POOL_TIMEOUT", "5")),
+                    atraso_maximo=float(os.environ.get("REPLICA_ATRASO_MAXIMO", "5")),
+                    intervalo=float(os.environ.get("REPLICA_VERIFICACAO_SEGUNDOS", "2")),
+                )
+    return _replicas
+
+
+def replica_de_leitura():
+    """Réplica saudável para uma leitura, em rodízio, ou None para ler do primário."""
+    replicas = get_replicas()
+    return replicas.escolher() if replicas is not None else None
+
+
+@contextmanager
+def _emprestada(pool, conn, tempo_limite_ms):
+    conn.tempo_limite_ms = tempo_limite_ms
+    try:
+        yield conn
+    finally:
+        conn.tempo_limite_ms = None
+        pool.devolver(conn)
+
+
+@contextmanager
+def conexao(replica=None, tempo_limite_ms=None):
+    """
+    Empresta uma conexão do pool durante o bloco 'with'. Se não for possível
+    obter uma conexão, entrega None, como get_db_connection() fazia.
+
+    Com 'replica' (de replica_de_leitura()), a conexão vem do pool da
+    réplica; se ela tiver saído de rotação ou não responder, do primário.
+    Com 'tempo_limite_ms', cada comando no bloco é cancelado pelo banco se
+    passar desse tempo (statement_timeout, veja preparadas.py).
+    """
+    if replica is not None and replica.saudavel:
+        try:
+            conn = replica.pool.obter()
+        except Exception as e:
+            logger.warning("Réplica %s fora de rotação: %s", replica.nome, e)
+            replica.marcar_falha(e)
+        else:
+            with _emprestada(replica.pool, conn, tempo_limite_ms) as conn:
+                yield conn
+            return
+
+    try:
+        pool = get_pool()
+        conn = pool.obter()
+    except Exception as e:
+        logger.error("Não foi possível conectar ao banco de dados: %s", e)
+        yield None
+        return
+    with _emprestada(pool, conn, tempo_limite_ms) as conn:
+        yield conn
+
+
+def estatisticas_pool():
+    if _pool is None:
+        estatisticas = {'em_uso': 0, 'livres': 0}
+    else:
+        estatisticas = _pool.estatisticas()
+    if _replicas is not None:
+        estatisticas['replicas'] = _replicas.estatisticas()
+    return estatisticas
+
 
 def get_db_connection():
     """
     Cria uma conexão com o banco de dados usando a URL
     fornecida pela variável de ambiente 'DATABASE_URL'.
+
+    Conexão avulsa, fora do pool. As rotas da API devem usar conexao().
     """
     try:
         # Pega a URL completa do banco da variável de ambiente
         db_url = os.environ.get("DATABASE_URL")
-        
+
         if not db_url:
             raise ValueError("A variável de ambiente DATABASE_URL não foi definida.")
-            
+
         # Usa a URL para se conectar. Simples e flexível!
         conn = psycopg2.connect(db_url)
         return conn
 
     except Exception as e:
-        print(f"ERRO: Não foi possível conectar ao banco de dados: {e}")
-        return None
\ No newline at end of file
+        logger.error("Não foi possível conectar ao banco de dados: %s", e)
+        return None
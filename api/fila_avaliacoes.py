@@ -0,0 +1,277 @@
+import os
+import time
+import fcntl
+import logging
+import sqlite3
+import threading
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from cache import invalidar
+from database import conexao
+
+
+logger = logging.getLogger(__name__)
+
+
+class FilaCheia(Exception):
+    """A fila atingiu a capacidade máxima; o cliente deve tentar mais tarde."""
+
+
+class FilaAvaliacoes:
+    """
+    Fila local e durável de avaliações, gravada em um arquivo SQLite em modo
+    WAL. A rota de cadastro só grava na fila e responde 202; uma thread
+    descarrega a fila no PostgreSQL em lotes, um commit por lote.
+
+    - Memória limitada: os itens ficam em disco e a thread lê no máximo
+      'tamanho_lote' por vez.
+    - Contrapressão: com 'capacidade' itens pendentes, enfileirar() levanta
+      FilaCheia.
+    - Recuperação: cada lote grava no PostgreSQL, na mesma transação, o
+      último id da fila aplicado (tabela fila_confirmacoes). Ao reiniciar,
+      itens já aplicados são descartados e os demais são reenviados, sem
+      duplicar avaliações.
+    - Vários workers podem compartilhar o arquivo; um lock de arquivo
+      garante que só um deles descarrega a fila por vez.
+    - Durabilidade: com sincrono='FULL' (o padrão), cada item é gravado no
+      disco antes do 202. 'NORMAL' é mais rápido em WAL, mas uma queda de
+      energia pode perder os últimos itens já confirmados ao cliente.
+    """
+
+    def __init__(self, caminho, capacidade=100000, tamanho_lote=500, intervalo=0.5, sincrono='FULL'):
+        self.caminho = caminho
+        self.nome = os.path.abspath(caminho)
+        self.capacidade = capacidade
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        if sincrono.upper() not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+            raise ValueError(f"Modo de sincronização inválido para o SQLite: {sincrono}")
+        self.sincrono = sincrono.upper()
+
+        self._local = threading.local()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+        self._arquivo_lock = None
+
+        self._lock_metricas = threading.Lock()
+        self.enfileiradas = 0
+        self.recusadas = 0
+        self.descarregadas = 0
+        self.falhas = 0
+        self.lotes = 0
+        self.ultima_descarga_ms = None
+        self.tempo_total_descarga = 0.0
+
+        conn = self._sqlite()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS fila (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                usuario_id INTEGER NOT NULL,
+                filme_id INTEGER NOT NULL,
+                nota REAL NOT NULL,
+                recebida_em REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS falhas (
+                id INTEGER PRIMARY KEY,
+                usuario_id INTEGER,
+                filme_id INTEGER,
+                nota REAL,
+                recebida_em REAL,
+                erro TEXT
+            )
+        """)
+
+    def _sqlite(self):
+        """Uma conexão SQLite por thread, em autocommit (transações explícitas)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.sincrono}")
+            self._local.conn = conn
+        return conn
+
+    def profundidade(self):
+        # Os itens saem da fila sempre do início, então os ids pendentes são contíguos
+        linha = self._sqlite().execute("SELECT MIN(id), MAX(id) FROM fila").fetchone()
+        return 0 if linha[0] is None else linha[1] - linha[0] + 1
+
+    def enfileirar(self, usuario_id, filme_id, nota):
+        conn = self._sqlite()
+        # BEGIN IMMEDIATE serializa a verificação de capacidade entre os workers
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.profundidade() >= self.capacidade:
+                conn.execute("ROLLBACK")
+                with self._lock_metricas:
+                    self.recusadas += 1
+                raise FilaCheia(f"A fila de avaliações atingiu a capacidade de {self.capacidade} itens.")
+            cur = conn.execute(
+                "INSERT INTO fila (usuario_id, filme_id, nota, recebida_em) VALUES (?, ?, ?, ?)",
+                (usuario_id, filme_id, nota, time.time()),
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock_metricas:
+            self.enfileiradas += 1
+        self._acordar.set()
+        return cur.lastrowid
+
+    # --- Descarga para o PostgreSQL ---
+
+    def iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._executar, name='fila-avaliacoes', daemon=True)
+            self._thread.start()
+
+    def parar(self, timeout=5):
+        self._parar.set()
+        self._acordar.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _obter_lock(self):
+        if self._arquivo_lock is None:
+            arquivo = open(self.caminho + '.lock', 'w')
+            try:
+                fcntl.flock(arquivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                arquivo.close()
+                return False
+            self._arquivo_lock = arquivo
+        return True
+
+    def _executar(self):
+        while not self._parar.is_set():
+            if not self._obter_lock():
+                # Outro worker está descarregando a fila
+                self._parar.wait(5)
+                continue
+            try:
+                if self.descarregar() == 0:
+                    self._acordar.wait(self.intervalo)
+                    self._acordar.clear()
+            except Exception as e:
+                logger.exception("Erro ao descarregar a fila de avaliações")
+                self._parar.wait(self.intervalo)
+
+    def descarregar(self):
+        """Envia um lote ao PostgreSQL. Devolve quantos itens saíram da fila."""
+        fila = self._sqlite()
+        itens = fila.execute(
+            "SELECT id, usuario_id, filme_id, nota, recebida_em FROM fila ORDER BY id LIMIT ?",
+            (self.tamanho_lote,),
+        ).fetchall()
+        if not itens:
+            return 0
+
+        inicio = time.perf_counter()
+        with conexao() as conn:
+            if conn is None:
+                raise ConnectionError("Falha na conexão com o banco.")
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT ultimo_id FROM fila_confirmacoes WHERE nome = %s FOR UPDATE",
+                (self.nome,),
+            )
+            linha = cur.fetchone()
+            ultimo_aplicado = linha[0] if linha else 0
+            pendentes = [item for item in itens if item[0] > ultimo_aplicado]
+
+            falhas = []
+            if pendentes:
+                try:
+                    cur.execute("SAVEPOINT lote")
+                    execute_values(
+                        cur,
+                        "INSERT INTO avaliacoes (usuario_id, filme_id, nota) VALUES %s",
+                        [(u, f, n) for _, u, f, n, _ in pendentes],
+                        page_size=len(pendentes),
+                    )
+                except (psycopg2.IntegrityError, psycopg2.DataError):
+                    # Algum item é inválido: grava um a um e separa os que falharem
+                    cur.execute("ROLLBACK TO SAVEPOINT lote")
+                    for item in pendentes:
+                        cur.execute("SAVEPOINT item")
+                        try:
+                            cur.execute(
+                                "INSERT INTO avaliacoes (usuario_id, filme_id, nota) VALUES (%s, %s, %s)",
+                                item[1:4],
+                            )
+                        except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+                            cur.execute("ROLLBACK TO SAVEPOINT item")
+                            falhas.append(item + (str(e).strip(),))
+
+            maior_id = itens[-1][0]
+            cur.execute("""
+                INSERT INTO fila_confirmacoes (nome, ultimo_id) VALUES (%s, %s)
+                ON CONFLICT (nome) DO UPDATE SET ultimo_id = EXCLUDED.ultimo_id
+            """, (self.nome, maior_id))
+            conn.commit()
+            cur.close()
+
+        # Só depois do commit no PostgreSQL os itens saem do arquivo local
+        fila.execute("BEGIN IMMEDIATE")
+        fila.executemany(
+            "INSERT OR REPLACE INTO falhas (id, usuario_id, filme_id, nota, recebida_em, erro) VALUES (?, ?, ?, ?, ?, ?)",
+            falhas,
+        )
+        fila.execute("DELETE FROM fila WHERE id <= ?", (maior_id,))
+        fila.execute("COMMIT")
+
+        if pendentes:
+            invalidar('avaliacoes')
+        duracao = time.perf_counter() - inicio
+        with self._lock_metricas:
+            self.lotes += 1
+            self.descarregadas += len(pendentes) - len(falhas)
+            self.falhas += len(falhas)
+            self.ultima_descarga_ms = round(1000 * duracao, 3)
+            self.tempo_total_descarga += duracao
+        return len(itens)
+
+    def metricas(self):
+        fila = self._sqlite()
+        mais_antiga = fila.execute("SELECT MIN(recebida_em) FROM fila").fetchone()[0]
+        total_falhas = fila.execute("SELECT COUNT(*) FROM falhas").fetchone()[0]
+        with self._lock_metricas:
+            return {
+                'profundidade': self.profundidade(),
+                'capacidade': self.capacidade,
+                'idade_item_mais_antigo_s': round(time.time() - mais_antiga, 3) if mais_antiga else 0.0,
+                'descarregando_neste_processo': self._arquivo_lock is not None,
+                'enfileiradas': self.enfileiradas,
+                'recusadas_fila_cheia': self.recusadas,
+                'descarregadas': self.descarregadas,
+                'falhas': self.falhas,
+                'falhas_guardadas': total_falhas,
+                'lotes': self.lotes,
+                'ultima_descarga_ms': self.ultima_descarga_ms,
+                'descarga_media_ms': round(1000 * self.tempo_total_descarga / self.lotes, 3) if self.lotes else None,
+            }
+
+
+def criar_fila_do_ambiente():
+    """
+    Cria e inicia a fila se FILA_AVALIACOES=1. Sem isso, devolve None e o
+    cadastro de avaliações continua gravando direto no banco.
+    """
+    if os.environ.get("FILA_AVALIACOES", "0") != "1":
+        return None
+    fila = FilaAvaliacoes(
+        os.environ.get("FILA_AVALIACOES_ARQUIVO", "fila-avaliacoes.db"),
+        capacidade=int(os.environ.get("FILA_AVALIACOES_CAPACIDADE", "100000")),
+        tamanho_lote=int(os.environ.get("FILA_AVALIACOES_LOTE", "500")),
+        intervalo=float(os.environ.get("FILA_AVALIACOES_INTERVALO", "0.5")),
+        sincrono=os.environ.get("FILA_AVALIACOES_SINCRONO", "FULL"),
+    )
+    fila.iniciar()
+    return fila
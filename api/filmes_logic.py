@@ -1,3 +1,16 @@
+import logging
+
+from psycopg2.errors import QueryCanceled
+
+from cache import invalidar
+from preparadas import Preparada
+
+
+logger = logging.getLogger(__name__)
+
+INSERIR_FILME = Preparada('inserir_filme', "INSERT INTO filmes (titulo, genero, ano) VALUES (%s, %s, %s)")
+
+
 def registrar_filme(conn, dados):
     """Realiza a inserção de um novo filme no banco de dados."""
     if not dados or not 'titulo' in dados or not 'genero' in dados or not 'ano' in dados:
@@ -9,11 +22,16 @@ def registrar_filme(conn, dados):
 
     try:
         cur = conn.cursor()
-        query = "INSERT INTO filmes (titulo, genero, ano) VALUES (%s, %s, %s)"
-        cur.execute(query, (titulo, genero, ano))
+        INSERIR_FILME.executar(cur, (titulo, genero, ano))
         conn.commit()
         cur.close()
+        invalidar('filmes')
         return {'message': 'Filme cadastrado com sucesso!'}, 201
+    except QueryCanceled:
+        # Tempo limite da rota: a API responde 503
+        conn.rollback()
+        raise
     except Exception as e:
-        print(f"Erro ao inserir filme: {e}")
+        logger.exception("Erro ao inserir filme")
+        conn.rollback()
         return {'message': 'Erro interno no servidor ao cadastrar o filme.'}, 500
\ No newline at end of file
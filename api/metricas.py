@@ -0,0 +1,257 @@
+import os
+import io
+import time
+import bisect
+import pstats
+import logging
+import cProfile
+import threading
+
+from psycopg2 import extensions
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+import serializacao
+
+
+logger = logging.getLogger(__name__)
+
+# Limites dos histogramas, em segundos
+LIMITES = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FASES = ('total', 'banco', 'materializacao', 'serializacao')
+
+SQL_LENTA_MS = float(os.environ.get("SQL_LENTA_MS", "200"))
+PERFIL_HABILITADO = os.environ.get("PERFIL_HABILITADO", "0") == "1"
+CABECALHO_PERFIL = 'X-Perfil'
+
+
+class Histograma:
+    """Histograma cumulativo no formato do Prometheus."""
+
+    def __init__(self):
+        self.contagens = [0] * (len(LIMITES) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.contagens[bisect.bisect_left(LIMITES, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+
+class RegistroMetricas:
+    """
+    Métricas acumuladas pelo processo: um histograma por rota e fase e um
+    contador de requisições por rota, método e status. Com vários workers
+    do gunicorn, cada worker expõe as próprias métricas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas = {}
+        self._requisicoes = {}
+        self.sql_lentas = 0
+
+    def registrar(self, rota, metodo, status, duracoes):
+        with self._lock:
+            chave = (rota, metodo, status)
+            self._requisicoes[chave] = self._requisicoes.get(chave, 0) + 1
+            for fase, duracao in duracoes.items():
+                histograma = self._histogramas.get((rota, fase))
+                if histograma is None:
+                    histograma = self._histogramas[(rota, fase)] = Histograma()
+                histograma.observar(duracao)
+
+    def contar_sql_lenta(self):
+        with self._lock:
+            self.sql_lentas += 1
+
+    def exportar(self, extras=()):
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)."""
+        linhas = [
+            "# HELP movieflix_requisicao_segundos Duração das requisições por rota e fase.",
+            "# TYPE movieflix_requisicao_segundos histogram",
+        ]
+        with self._lock:
+            for (rota, fase), h in sorted(self._histogramas.items()):
+                rotulos = f'rota="{rota}",fase="{fase}"'
+                acumulado = 0
+                for limite, contagem in zip(LIMITES + ('+Inf',), h.contagens):
+                    acumulado += contagem
+                    linhas.append(f'movieflix_requisicao_segundos_bucket{{{rotulos},le="{limite}"}} {acumulado}')
+                linhas.append(f'movieflix_requisicao_segundos_sum{{{rotulos}}} {h.soma:.6f}')
+                linhas.append(f'movieflix_requisicao_segundos_count{{{rotulos}}} {h.total}')
+
+            linhas.append("# HELP movieflix_requisicoes_total Requisições atendidas por rota, método e status.")
+            linhas.append("# TYPE movieflix_requisicoes_total counter")
+            for (rota, metodo, status), total in sorted(self._requisicoes.items()):
+                linhas.append(f'movieflix_requisicoes_total{{rota="{rota}",metodo="{metodo}",status="{status}"}} {total}')
+
+            linhas.append(f"# HELP movieflix_sql_lentas_total Comandos SQL acima de {SQL_LENTA_MS:g} ms.")
+            linhas.append("# TYPE movieflix_sql_lentas_total counter")
+            linhas.append(f"movieflix_sql_lentas_total {self.sql_lentas}")
+
+        for nome, tipo, ajuda, valor in extras:
+            linhas.append(f"# HELP {nome} {ajuda}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            linhas.append(f"{nome} {valor}")
+        return '\n'.join(linhas) + '\n'
+
+
+registro = RegistroMetricas()
+
+# Medição da requisição em andamento na thread atual. É uma variável da
+# thread, e não 'flask.g', porque o corpo das respostas em fluxo é gerado
+# depois que o contexto da requisição já foi encerrado.
+_atual = threading.local()
+
+
+class MedicaoRequisicao:
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.banco = 0.0
+        self.materializacao = 0.0
+        self.serializacao = 0.0
+        self.perfil = None
+
+
+def _medicao():
+    return getattr(_atual, 'medicao', None)
+
+
+class CursorInstrumentado(extensions.cursor):
+    """
+    Cursor do psycopg2 que soma o tempo de execução (banco) e de leitura das
+    linhas (materialização) à requisição atual e registra no log os
+    comandos mais lentos que SQL_LENTA_MS, com seus parâmetros.
+
+    Em cursores nomeados, o execute() só declara o cursor; o trabalho do
+    banco aparece no tempo de materialização dos fetch*().
+    """
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._medir('banco', inicio, query, vars)
+
+    def executemany(self, query, vars_list):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._medir('banco', inicio, query, '<executemany>')
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._medir('materializacao', inicio)
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchmany(size) if size is not None else super().fetchmany()
+        finally:
+            self._medir('materializacao', inicio)
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._medir('materializacao', inicio)
+
+    def _medir(self, fase, inicio, query=None, params=None):
+        duracao = time.perf_counter() - inicio
+        medicao = _medicao()
+        if medicao is not None:
+            setattr(medicao, fase, getattr(medicao, fase) + duracao)
+        if duracao * 1000 >= SQL_LENTA_MS:
+            registro.contar_sql_lenta()
+            if query is None:
+                query = self.query.decode(errors='replace') if self.query else '<fetch>'
+            elif isinstance(query, bytes):
+                query = query.decode(errors='replace')
+            elif not isinstance(query, str):
+                query = query.as_string(self)
+            logger.warning("SQL lenta (%.1f ms, %s): %s | parâmetros: %r",
+                           duracao * 1000, fase, ' '.join(query.split()), params)
+
+
+class ProvedorJSONInstrumentado(DefaultJSONProvider):
+    """
+    Provedor JSON do Flask que serializa com serializacao.py e soma o tempo
+    de serialização à requisição atual.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return self._medir(serializacao.dumps, obj)
+
+    def itens_de_array(self, objetos):
+        return self._medir(serializacao.itens_de_array, objetos)
+
+    def loads(self, s, **kwargs):
+        return serializacao.loads(s)
+
+    @staticmethod
+    def _medir(funcao, obj):
+        inicio = time.perf_counter()
+        try:
+            return funcao(obj)
+        finally:
+            medicao = _medicao()
+            if medicao is not None:
+                medicao.serializacao += time.perf_counter() - inicio
+
+
+def _iniciar_requisicao():
+    medicao = _atual.medicao = MedicaoRequisicao()
+    if PERFIL_HABILITADO and request.headers.get(CABECALHO_PERFIL) == '1':
+        medicao.perfil = cProfile.Profile()
+        medicao.perfil.enable()
+
+
+def _finalizar_requisicao(resposta):
+    medicao = _medicao()
+    if medicao is None:
+        return resposta
+    rota = request.url_rule.rule if request.url_rule else 'desconhecida'
+    metodo = request.method
+
+    if medicao.perfil is not None:
+        # Consome o corpo (inclusive respostas em fluxo) ainda sob o perfilador
+        resposta.get_data()
+        medicao.perfil.disable()
+        saida = io.StringIO()
+        pstats.Stats(medicao.perfil, stream=saida).sort_stats('cumulative').print_stats(40)
+        resposta.set_data(saida.getvalue())
+        resposta.mimetype = 'text/plain'
+        medicao.perfil = None
+
+    def registrar():
+        registro.registrar(rota, metodo, resposta.status_code, {
+            'total': time.perf_counter() - medicao.inicio,
+            'banco': medicao.banco,
+            'materializacao': medicao.materializacao,
+            'serializacao': medicao.serializacao,
+        })
+        if getattr(_atual, 'medicao', None) is medicao:
+            _atual.medicao = None
+
+    # Respostas em fluxo só terminam quando o último pedaço é enviado
+    resposta.call_on_close(registrar)
+    return resposta
+
+
+def instrumentar(app):
+    """
+    Liga a medição por requisição no app: tempos por fase, perfil com
+    cProfile (cabeçalho X-Perfil: 1, se PERFIL_HABILITADO=1) e o registro
+    exportado em /api/metrics.
+    """
+    app.json = ProvedorJSONInstrumentado(app)
+    app.before_request(_iniciar_requisicao)
+    app.after_request(_finalizar_requisicao)
@@ -0,0 +1,77 @@
+"""
+Manutenção das partições mensais de 'avaliacoes' pela API.
+
+Cada avaliação vai para a partição do mês da sua data de criação; sem a
+partição do mês, ela cai na partição padrão, que toda consulta por janela
+de tempo precisa ler. Uma thread chama manter_particoes_avaliacoes() (criada
+pelo importador) ao iniciar e depois a cada PARTICOES_MANUTENCAO_HORAS, para
+que as partições do mês atual e dos seguintes sempre existam. A função usa
+um advisory lock, então vários workers podem chamá-la ao mesmo tempo.
+
+Desanexar as partições antigas é uma decisão de retenção e fica com o
+importador (--desanexar-antes).
+"""
+import os
+import logging
+import threading
+
+from database import conexao
+
+
+logger = logging.getLogger(__name__)
+
+
+class ManutencaoParticoes:
+    def __init__(self, intervalo_horas=24):
+        self.intervalo = intervalo_horas * 3600
+        self._parar = threading.Event()
+        self._thread = None
+
+    def executar_uma_vez(self):
+        """Cria as partições que faltam; devolve quantas foram criadas."""
+        with conexao() as conn:
+            if conn is None:
+                raise ConnectionError("Falha na conexão com o banco.")
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT manter_particoes_avaliacoes()")
+                    criadas = cur.fetchone()[0]
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        if criadas:
+            logger.info("%d partição(ões) de 'avaliacoes' criada(s)", criadas)
+        return criadas
+
+    def iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._executar, name='particoes', daemon=True)
+            self._thread.start()
+
+    def parar(self, timeout=5):
+        self._parar.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _executar(self):
+        espera = 0
+        while not self._parar.wait(espera):
+            try:
+                self.executar_uma_vez()
+                espera = self.intervalo
+            except Exception:
+                logger.exception("Erro ao manter as partições de 'avaliacoes'")
+                # Tenta de novo antes do próximo ciclo completo
+                espera = min(self.intervalo, 60)
+
+
+def criar_manutencao_do_ambiente():
+    """Cria e inicia a manutenção, a menos que PARTICOES_MANUTENCAO_HORAS=0."""
+    intervalo = float(os.environ.get("PARTICOES_MANUTENCAO_HORAS", "24"))
+    if intervalo <= 0:
+        return None
+    manutencao = ManutencaoParticoes(intervalo)
+    manutencao.iniciar()
+    return manutencao
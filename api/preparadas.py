@@ -0,0 +1,135 @@
+"""
+Consultas preparadas e tempo limite por rota nas conexões do pool.
+
+- Os comandos mais frequentes da API são registrados aqui (Preparada). Na
+  primeira vez que uma conexão do pool executa um deles, ele é preparado no
+  servidor (PREPARE); daí em diante a conexão só envia o nome e os
+  parâmetros (EXECUTE), e o PostgreSQL não analisa nem planeja o SQL de
+  novo a cada requisição. Cada conexão guarda os nomes que já preparou; uma
+  conexão nova (ou recriada pelo pool) começa vazia e prepara de novo.
+- Cada rota pode definir um tempo limite para os seus comandos. A conexão
+  guarda o valor enquanto está emprestada, e o primeiro comando de cada
+  transação leva junto um 'SET LOCAL statement_timeout', na mesma ida ao
+  servidor. Um comando que passa do limite é cancelado pelo PostgreSQL
+  (psycopg2.errors.QueryCanceled), e a rota responde 503.
+"""
+import re
+
+from psycopg2 import extensions, sql
+
+import consultas
+from metricas import CursorInstrumentado
+
+
+class ConexaoPreparada(extensions.connection):
+    """Conexão do pool com os nomes já preparados nela e o tempo limite da rota atual."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.preparadas = set()
+        self.tempo_limite_ms = None
+
+    def prefixo_tempo_limite(self):
+        """'SET LOCAL statement_timeout' se o próximo comando abrir uma transação; senão ''."""
+        if (not self.tempo_limite_ms or self.autocommit
+                or self.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE):
+            return ''
+        return f"SET LOCAL statement_timeout = {int(self.tempo_limite_ms)}; "
+
+
+class CursorComTempoLimite(CursorInstrumentado):
+    """
+    Cursor das conexões do pool: aplica o tempo limite da rota no início de
+    cada transação, além de medir os comandos (CursorInstrumentado).
+    """
+
+    def execute(self, query, vars=None):
+        prefixo = self.connection.prefixo_tempo_limite() if isinstance(self.connection, ConexaoPreparada) else ''
+        if prefixo:
+            if self.name is None:
+                if isinstance(query, sql.Composable):
+                    query = query.as_string(self)
+                query = prefixo + query
+            else:
+                # Um cursor nomeado só aceita uma consulta (DECLARE ... FOR)
+                with extensions.cursor(self.connection) as cur:
+                    cur.execute(prefixo)
+        return super().execute(query, vars)
+
+
+# Parâmetros no estilo do psycopg2 (%s ou %(nome)s) e o '%' escapado
+_PARAMETRO = re.compile(r"%\((\w+)\)s|%s|%%")
+
+# Todas as consultas preparadas, pelo nome
+REGISTRO = {}
+
+
+class Preparada:
+    """
+    Um comando SQL preparado uma vez por conexão e executado pelo nome.
+    Recebe o SQL com os parâmetros do psycopg2, todos posicionais (%s) ou
+    todos nomeados (%(nome)s); o tipo de cada parâmetro é deduzido pelo
+    PostgreSQL a partir do uso, como nas consultas não preparadas.
+    """
+
+    def __init__(self, nome, comando):
+        if nome in REGISTRO:
+            raise ValueError(f"Já existe uma consulta preparada chamada '{nome}'.")
+        self.nome = nome
+        self.sql = comando
+
+        nomeados, posicionais = {}, 0
+
+        def numerar(parametro):
+            nonlocal posicionais
+            if parametro.group(0) == '%%':
+                return '%'
+            if parametro.group(1) is None:
+                posicionais += 1
+                return f"${posicionais}"
+            return f"${nomeados.setdefault(parametro.group(1), len(nomeados) + 1)}"
+
+        corpo = _PARAMETRO.sub(numerar, comando)
+        if nomeados and posicionais:
+            raise ValueError(f"A consulta '{nome}' mistura parâmetros posicionais e nomeados.")
+        self.preparar = f"PREPARE {nome} AS {corpo}"
+        argumentos = [f"%({p})s" for p in nomeados] or ['%s'] * posicionais
+        self.executar_sql = f"EXECUTE {nome}" + (f"({', '.join(argumentos)})" if argumentos else '')
+        REGISTRO[nome] = self
+
+    def executar(self, cur, params=None):
+        """
+        Executa o comando no cursor, preparando-o antes se a conexão ainda
+        não o preparou. Fora do pool (conexões comuns), executa o SQL original.
+        """
+        conn = cur.connection
+        if not isinstance(conn, ConexaoPreparada):
+            cur.execute(self.sql, params)
+            return
+        if self.nome not in conn.preparadas:
+            cur.execute(self.preparar)
+            # O PREPARE vale para a sessão, mesmo se a transação for desfeita
+            conn.preparadas.add(self.nome)
+        cur.execute(self.executar_sql, params)
+
+
+# --- COMANDOS DA API ---
+# Os INSERTs dos cadastros ficam nos módulos *_logic.py, junto com o SQL deles.
+
+RELATORIOS = {
+    nome: Preparada(f"relatorio_{nome.replace('-', '_')}", query)
+    for nome, (query, _, _) in consultas.RELATORIOS.items()
+}
+EM_ALTA = Preparada('em_alta', consultas.EM_ALTA)
+ATUALIZAR_FAIXAS_ETARIAS = Preparada('atualizar_faixas_etarias', consultas.ATUALIZAR_FAIXAS_ETARIAS)
+BUSCAS = {
+    (tabela, sem_acento): Preparada(
+        f"buscar_{tabela}{'_sem_acento' if sem_acento else ''}",
+        consultas.consulta_de_busca(colunas, tabela, coluna_busca, sem_acento),
+    )
+    for tabela, colunas, coluna_busca in (
+        ('usuarios', "id, nome_de_usuario, nome", "nome_de_usuario"),
+        ('filmes', "id, titulo, ano", "titulo"),
+    )
+    for sem_acento in (False, True)
+}
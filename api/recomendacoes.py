@@ -0,0 +1,466 @@
+"""
+Recomendações de filmes por similaridade entre filmes (item a item), para
+GET /api/usuarios/<id>/recomendacoes.
+
+As avaliações ficam na memória do processo em uma matriz esparsa usuário x
+filme no formato CSR, em arrays do NumPy:
+
+- indptr[u]:indptr[u + 1] delimita, em 'filmes' e 'notas', as avaliações do
+  usuário u, ordenadas por filme (vale a nota mais recente de cada filme);
+- 'vizinhos' e 'similaridades' guardam, para cada filme, os K filmes mais
+  parecidos, pelo cosseno das notas centradas na média de cada usuário.
+
+Avaliações novas entram em um delta por usuário e valem imediatamente para
+as recomendações desse usuário. As gravadas por este worker chegam por
+registrar(); as dos demais workers (e da fila de avaliações), por
+sincronizar(), que uma thread chama a cada RECOMENDACOES_SINCRONIA_SEGUNDOS
+e lê do banco as avaliações com id acima de uma marca. Como ids menores podem ser
+confirmados depois de ids maiores, a marca só avança até o maior id visto
+há mais de JANELA_SINCRONIA segundos, e as últimas avaliações são lidas de
+novo (aplicar a mesma avaliação duas vezes não muda nada).
+
+A mesma thread recarrega a matriz do banco periodicamente (o que também remove
+avaliações apagadas), recalcula as similaridades e grava um snapshot em
+disco, que torna a próxima inicialização rápida. O snapshot guarda a
+identidade do banco de onde veio (o identificador do cluster, o nome do
+banco e o OID da tabela 'avaliacoes', que muda quando o importador a recria
+ou um backup é restaurado) e só é usado no mesmo banco, se o maior id das
+avaliações não tiver diminuído.
+
+Orçamento de memória por milhão de avaliações, em cada worker:
+
+- matriz CSR: 8 MB (filme int32 + nota float32), mais 8 bytes por usuário;
+- similaridades: 8 * K bytes por filme (400 KB para mil filmes com K=50),
+  independentes do número de avaliações;
+- delta: cerca de 220 bytes por avaliação recebida desde a última recarga;
+- durante a recarga, cerca de 60 MB temporários (as colunas lidas do banco
+  e as cópias por filme usadas no cálculo das similaridades).
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+from database import conexao
+
+
+logger = logging.getLogger(__name__)
+
+VERSAO_SNAPSHOT = 2
+TAMANHO_LOTE_CARGA = 100000
+# Transações da API duram milissegundos; ids confirmados fora de ordem
+# aparecem bem antes disso
+JANELA_SINCRONIA = 10.0
+# Similaridades com poucos usuários em comum são reduzidas: s * n / (n + 10)
+ENCOLHIMENTO = 10.0
+NOTA_MINIMA, NOTA_MAXIMA = 0.0, 10.0
+# Ao lado deste arquivo, para não depender do diretório de trabalho
+ARQUIVO_SNAPSHOT_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recomendacoes.npz')
+
+IDENTIDADE_DO_BANCO = """
+    SELECT (SELECT system_identifier FROM pg_control_system())::text
+           || '/' || current_database() || '/' || 'avaliacoes'::regclass::oid::text,
+           (SELECT COALESCE(max(id), 0) FROM avaliacoes)
+"""
+
+
+def _csr(usuarios, filmes, notas, ids):
+    """
+    Monta a matriz CSR a partir de colunas de avaliações. Com avaliações
+    repetidas de um usuário para um filme, fica a de maior id.
+    """
+    ordem = np.lexsort((ids, filmes, usuarios))
+    usuarios, filmes, notas = usuarios[ordem], filmes[ordem], notas[ordem]
+    ultima = np.ones(len(usuarios), dtype=bool)
+    ultima[:-1] = (usuarios[1:] != usuarios[:-1]) | (filmes[1:] != filmes[:-1])
+    usuarios, filmes, notas = usuarios[ultima], filmes[ultima], notas[ultima]
+
+    n_usuarios = int(usuarios.max(initial=-1)) + 1
+    indptr = np.zeros(n_usuarios + 1, dtype=np.int64)
+    np.cumsum(np.bincount(usuarios, minlength=n_usuarios), out=indptr[1:])
+    return indptr, filmes.astype(np.int32), notas.astype(np.float32)
+
+
+def _intervalos(inicios, tamanhos):
+    """Índices de todos os intervalos [inicio, inicio + tamanho), concatenados."""
+    total = int(tamanhos.sum())
+    deslocamento = np.repeat(inicios - np.cumsum(tamanhos) + tamanhos, tamanhos)
+    return deslocamento + np.arange(total)
+
+
+def _similaridades(indptr, filmes, notas, n_filmes, k):
+    """
+    Os k vizinhos de cada filme pelo cosseno ajustado, sem montar a matriz
+    filme x filme: para cada filme, soma as avaliações dos usuários que o
+    avaliaram. Custo proporcional à soma, por usuário, do quadrado do número
+    de avaliações. Devolve (vizinhos int32, similaridades float32), n_filmes x k,
+    com -1 e 0 onde não há vizinho.
+    """
+    tamanhos = np.diff(indptr)
+    usuario_da_entrada = np.repeat(np.arange(len(tamanhos), dtype=np.int64), tamanhos)
+    media = np.zeros(len(tamanhos))
+    np.divide(np.bincount(usuario_da_entrada, weights=notas, minlength=len(tamanhos)), tamanhos,
+              out=media, where=tamanhos > 0)
+    desvios = notas - media[usuario_da_entrada]
+    norma = np.sqrt(np.bincount(filmes, weights=desvios ** 2, minlength=n_filmes))
+
+    # Colunas (usuários de cada filme), como em uma matriz CSC
+    por_filme = np.argsort(filmes, kind='stable')
+    colptr = np.zeros(n_filmes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(filmes, minlength=n_filmes), out=colptr[1:])
+
+    vizinhos = np.full((n_filmes, k), -1, dtype=np.int32)
+    similaridades = np.zeros((n_filmes, k), dtype=np.float32)
+    for filme in np.flatnonzero(norma > 0):
+        entradas = por_filme[colptr[filme]:colptr[filme + 1]]
+        usuarios = usuario_da_entrada[entradas]
+        indices = _intervalos(indptr[usuarios], tamanhos[usuarios])
+        pesos = np.repeat(desvios[entradas], tamanhos[usuarios]) * desvios[indices]
+        produto = np.bincount(filmes[indices], weights=pesos, minlength=n_filmes)
+        em_comum = np.bincount(filmes[indices], minlength=n_filmes)
+
+        similaridade = np.zeros(n_filmes)
+        np.divide(produto, norma[filme] * norma, out=similaridade, where=norma > 0)
+        similaridade *= em_comum / (em_comum + ENCOLHIMENTO)
+        similaridade[filme] = 0
+
+        melhores = np.argpartition(-similaridade, min(k, n_filmes - 1))[:k] if n_filmes > k else np.arange(n_filmes)
+        melhores = melhores[similaridade[melhores] > 0]
+        melhores = melhores[np.argsort(-similaridade[melhores], kind='stable')]
+        vizinhos[filme, :len(melhores)] = melhores
+        similaridades[filme, :len(melhores)] = similaridade[melhores]
+    return vizinhos, similaridades
+
+
+class Recomendador:
+    """
+    Matriz de avaliações e similaridades de um processo. As leituras usam
+    os arrays vigentes; recarregar() monta arrays novos e os troca de uma vez.
+    """
+
+    def __init__(self, arquivo_snapshot=None, vizinhos=50, intervalo_recarga=600.0, intervalo_sincronia=1.0):
+        self.arquivo_snapshot = arquivo_snapshot
+        self.k = vizinhos
+        self.intervalo_recarga = intervalo_recarga
+        self.intervalo_sincronia = intervalo_sincronia
+
+        self._lock = threading.Lock()
+        self._pronto = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.filmes = np.zeros(0, dtype=np.int32)
+        self.notas = np.zeros(0, dtype=np.float32)
+        self.vizinhos = np.zeros((0, vizinhos), dtype=np.int32)
+        self.similaridades = np.zeros((0, vizinhos), dtype=np.float32)
+        self.popularidade = np.zeros(0, dtype=np.int64)
+        # Avaliações posteriores à matriz: usuário -> {filme: (id, nota, geração)}
+        self._delta = {}
+        self._geracao = 0
+        self._ultimo_id_matriz = 0
+        self._identidade_banco = None
+        self._marca = 0
+        self._leituras = deque()
+
+        self.recargas = 0
+        self.ultima_recarga_s = None
+        self.origem_carga = None
+
+    # --- Carga ---
+
+    def _ler_do_banco(self):
+        """Lê todas as avaliações do banco em colunas do NumPy e guarda a identidade do banco."""
+        blocos = []
+        with conexao() as conn:
+            if conn is None:
+                raise ConnectionError("Falha na conexão com o banco.")
+            with conn.cursor() as cur:
+                cur.execute(IDENTIDADE_DO_BANCO)
+                self._identidade_banco = cur.fetchone()[0]
+            with conn.cursor(name='recomendacoes_carga') as cur:
+                cur.itersize = TAMANHO_LOTE_CARGA
+                cur.execute("""
+                    SELECT id, usuario_id, filme_id, nota FROM avaliacoes
+                    WHERE usuario_id IS NOT NULL AND filme_id IS NOT NULL AND nota IS NOT NULL
+                """)
+                while True:
+                    linhas = cur.fetchmany(TAMANHO_LOTE_CARGA)
+                    if not linhas:
+                        break
+                    bloco = np.array(linhas, dtype=np.float64)
+                    blocos.append((bloco[:, 0].astype(np.int64), bloco[:, 1].astype(np.int32),
+                                   bloco[:, 2].astype(np.int32), bloco[:, 3].astype(np.float32)))
+            conn.commit()
+        if not blocos:
+            return np.zeros(0, np.int64), np.zeros(0, np.int32), np.zeros(0, np.int32), np.zeros(0, np.float32)
+        return tuple(np.concatenate(coluna) for coluna in zip(*blocos))
+
+    def recarregar(self):
+        """Remonta a matriz e as similaridades a partir do banco."""
+        inicio = time.perf_counter()
+        # registrar() é chamado depois do commit: o que já está no delta agora estará na leitura
+        with self._lock:
+            self._geracao += 1
+            geracao = self._geracao
+        lida_em = time.monotonic()
+        ids, usuarios, filmes, notas = self._ler_do_banco()
+        ultimo_id = int(ids.max(initial=0))
+        indptr, filmes, notas = _csr(usuarios, filmes, notas, ids)
+        n_filmes = int(filmes.max(initial=-1)) + 1
+        vizinhos, similaridades = _similaridades(indptr, filmes, notas, n_filmes, self.k)
+        self._trocar(indptr, filmes, notas, vizinhos, similaridades, ultimo_id, geracao)
+        self._marcar_leitura(lida_em, ultimo_id)
+        self.recargas += 1
+        self.ultima_recarga_s = round(time.perf_counter() - inicio, 3)
+        self.origem_carga = 'banco'
+        logger.info("Recomendações recarregadas do banco: %d avaliações em %.2fs.", len(filmes), self.ultima_recarga_s)
+
+    def _trocar(self, indptr, filmes, notas, vizinhos, similaridades, ultimo_id, geracao=0):
+        popularidade = np.bincount(filmes, minlength=len(vizinhos))
+        with self._lock:
+            self.indptr, self.filmes, self.notas = indptr, filmes, notas
+            self.vizinhos, self.similaridades, self.popularidade = vizinhos, similaridades, popularidade
+            self._ultimo_id_matriz = ultimo_id
+            # O delta só guarda o que a matriz nova ainda não tem
+            for usuario in list(self._delta):
+                restantes = {f: v for f, v in self._delta[usuario].items() if v[2] >= geracao}
+                if restantes:
+                    self._delta[usuario] = restantes
+                else:
+                    del self._delta[usuario]
+
+    def _marcar_leitura(self, momento, ultimo_id):
+        """Registra que, no momento dado, o maior id visto no banco era ultimo_id."""
+        with self._lock:
+            self._leituras.append((momento, ultimo_id))
+            if self._marca == 0:
+                self._marca = ultimo_id
+
+    def salvar_snapshot(self):
+        if not self.arquivo_snapshot:
+            return
+        with self._lock:
+            arrays = {
+                'versao': np.array(VERSAO_SNAPSHOT), 'ultimo_id': np.array(self._ultimo_id_matriz),
+                'banco': np.array(self._identidade_banco or ''),
+                'indptr': self.indptr, 'filmes': self.filmes, 'notas': self.notas,
+                'vizinhos': self.vizinhos, 'similaridades': self.similaridades,
+            }
+        # Grava em um arquivo temporário e troca, para que outro worker nunca leia um snapshot pela metade
+        temporario = f"{self.arquivo_snapshot}.{os.getpid()}.tmp"
+        with open(temporario, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temporario, self.arquivo_snapshot)
+
+    def _identidade_atual(self):
+        """(identidade do banco, maior id das avaliações)."""
+        with conexao() as conn:
+            if conn is None:
+                raise ConnectionError("Falha na conexão com o banco.")
+            with conn.cursor() as cur:
+                cur.execute(IDENTIDADE_DO_BANCO)
+                identidade = cur.fetchone()
+            conn.commit()
+        return identidade
+
+    def carregar_snapshot(self):
+        """
+        Carrega o snapshot, se existir, for desta versão e tiver vindo do
+        banco atual. Devolve True se carregou.
+        """
+        if not self.arquivo_snapshot or not os.path.exists(self.arquivo_snapshot):
+            return False
+        inicio = time.perf_counter()
+        with np.load(self.arquivo_snapshot) as arrays:
+            if int(arrays['versao']) != VERSAO_SNAPSHOT or arrays['vizinhos'].shape[1] != self.k:
+                return False
+            identidade, maior_id = self._identidade_atual()
+            if str(arrays['banco']) != identidade or int(arrays['ultimo_id']) > maior_id:
+                # Outro banco, ou o mesmo recriado: as marcas de id do snapshot não valem aqui
+                logger.info("Snapshot das recomendações é de outro banco; descartado.")
+                return False
+            self._identidade_banco = identidade
+            self._trocar(arrays['indptr'], arrays['filmes'], arrays['notas'],
+                         arrays['vizinhos'], arrays['similaridades'], int(arrays['ultimo_id']))
+            self._marcar_leitura(time.monotonic(), int(arrays['ultimo_id']))
+        self.origem_carga = 'snapshot'
+        logger.info("Recomendações carregadas do snapshot em %.3fs.", time.perf_counter() - inicio)
+        return True
+
+    # --- Atualização incremental ---
+
+    def registrar(self, avaliacao_id, usuario_id, filme_id, nota):
+        """Aplica uma avaliação gravada. Reaplicar a mesma avaliação não muda nada."""
+        if nota is None:
+            return
+        # Os ids podem ter vindo como texto no JSON; o banco já os aceitou como inteiros
+        avaliacao_id, usuario_id, filme_id = int(avaliacao_id), int(usuario_id), int(filme_id)
+        with self._lock:
+            filmes_do_usuario = self._delta.setdefault(usuario_id, {})
+            atual = filmes_do_usuario.get(filme_id)
+            if atual is None or atual[0] < avaliacao_id:
+                filmes_do_usuario[filme_id] = (avaliacao_id, float(nota), self._geracao)
+
+    def sincronizar(self):
+        """Aplica as avaliações gravadas por outros workers desde a última marca."""
+        agora = time.monotonic()
+        with conexao() as conn:
+            if conn is None:
+                return
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT id, usuario_id, filme_id, nota FROM avaliacoes
+                WHERE id > %s AND usuario_id IS NOT NULL AND filme_id IS NOT NULL
+                ORDER BY id
+            """, (self._marca,))
+            linhas = cur.fetchall()
+            conn.commit()
+            cur.close()
+        for linha in linhas:
+            self.registrar(*linha)
+        self._marcar_leitura(agora, linhas[-1][0] if linhas else self._marca)
+        with self._lock:
+            while self._leituras and agora - self._leituras[0][0] >= JANELA_SINCRONIA:
+                self._marca = max(self._marca, self._leituras.popleft()[1])
+
+    # --- Consulta ---
+
+    def _avaliacoes_do_usuario(self, usuario_id):
+        with self._lock:
+            if 0 <= usuario_id < len(self.indptr) - 1:
+                inicio, fim = self.indptr[usuario_id], self.indptr[usuario_id + 1]
+                avaliacoes = dict(zip(self.filmes[inicio:fim].tolist(), self.notas[inicio:fim].tolist()))
+            else:
+                avaliacoes = {}
+            for filme, (_, nota, _) in self._delta.get(usuario_id, {}).items():
+                avaliacoes[filme] = nota
+            return avaliacoes, self.vizinhos, self.similaridades, self.popularidade
+
+    def recomendar(self, usuario_id, limite=10):
+        """
+        Devolve (origem, [(filme_id, nota_prevista)]) com os 'limite' filmes
+        ainda não avaliados de maior nota prevista. Sem avaliações (ou sem
+        vizinhos), recomenda os filmes mais avaliados: origem 'populares'.
+        """
+        avaliacoes, vizinhos, similaridades, popularidade = self._avaliacoes_do_usuario(usuario_id)
+        n_filmes = len(vizinhos)
+        avaliados = np.fromiter(avaliacoes.keys(), dtype=np.int64, count=len(avaliacoes))
+        notas = np.fromiter(avaliacoes.values(), dtype=np.float64, count=len(avaliacoes))
+
+        conhecidos = avaliados < n_filmes
+        if conhecidos.any():
+            media = notas.mean()
+            candidatos = vizinhos[avaliados[conhecidos]].ravel()
+            pesos = similaridades[avaliados[conhecidos]].ravel().astype(np.float64)
+            desvios = np.repeat(notas[conhecidos] - media, vizinhos.shape[1])
+            validos = candidatos >= 0
+            candidatos, pesos, desvios = candidatos[validos], pesos[validos], desvios[validos]
+            soma = np.bincount(candidatos, weights=pesos * desvios, minlength=n_filmes)
+            peso_total = np.bincount(candidatos, weights=pesos, minlength=n_filmes)
+            peso_total[avaliados[conhecidos]] = 0
+
+            escolhidos = np.flatnonzero(peso_total > 0)
+            if len(escolhidos):
+                previsao = np.clip(media + soma[escolhidos] / peso_total[escolhidos], NOTA_MINIMA, NOTA_MAXIMA)
+                # Maior nota prevista; no empate, a que tem mais vizinhos avaliados, e depois o menor id
+                ordem = np.lexsort((escolhidos, -peso_total[escolhidos], -previsao))[:limite]
+                return 'similares', [(int(escolhidos[i]), round(float(previsao[i]), 2)) for i in ordem]
+
+        disponiveis = np.ones(len(popularidade), dtype=bool)
+        disponiveis[avaliados[conhecidos]] = False
+        disponiveis &= popularidade > 0
+        escolhidos = np.flatnonzero(disponiveis)
+        ordem = np.lexsort((escolhidos, -popularidade[escolhidos]))[:limite]
+        return 'populares', [(int(escolhidos[i]), None) for i in ordem]
+
+    @property
+    def pronto(self):
+        return self._pronto.is_set()
+
+    def estatisticas(self):
+        with self._lock:
+            bytes_matriz = self.indptr.nbytes + self.filmes.nbytes + self.notas.nbytes
+            bytes_similaridades = self.vizinhos.nbytes + self.similaridades.nbytes
+            return {
+                'pronto': self.pronto,
+                'origem_carga': self.origem_carga,
+                'usuarios': len(self.indptr) - 1,
+                'filmes': len(self.vizinhos),
+                'avaliacoes_na_matriz': len(self.filmes),
+                'avaliacoes_no_delta': sum(len(d) for d in self._delta.values()),
+                'vizinhos_por_filme': self.k,
+                'bytes_matriz': bytes_matriz,
+                'bytes_similaridades': bytes_similaridades,
+                'recargas': self.recargas,
+                'ultima_recarga_s': self.ultima_recarga_s,
+                'ultimo_id_matriz': self._ultimo_id_matriz,
+            }
+
+    # --- Thread de recarga ---
+
+    def iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._executar, name='recomendacoes', daemon=True)
+            self._thread.start()
+
+    def parar(self, timeout=5):
+        self._parar.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _executar(self):
+        # Carga inicial: do snapshot, se houver; senão, do banco (com novas tentativas)
+        while not self._parar.is_set() and not self.pronto:
+            try:
+                if not self.carregar_snapshot():
+                    self.recarregar()
+                    self.salvar_snapshot()
+                self._pronto.set()
+            except Exception:
+                logger.exception("Erro ao carregar as recomendações")
+                self._parar.wait(5)
+
+        ultima_recarga = time.monotonic()
+        while not self._parar.wait(self.intervalo_sincronia):
+            try:
+                if time.monotonic() - ultima_recarga >= self.intervalo_recarga:
+                    ultima_recarga = time.monotonic()
+                    self.recarregar()
+                    self.salvar_snapshot()
+                else:
+                    self.sincronizar()
+            except Exception:
+                logger.exception("Erro ao atualizar as recomendações")
+
+def criar_recomendador_do_ambiente():
+    """
+    Cria e inicia o recomendador se RECOMENDACOES=1. Fica desligado por
+    padrão porque cada worker lê todas as avaliações e guarda a própria
+    matriz. A carga acontece em segundo plano; até terminar, a rota
+    responde 503.
+    """
+    if os.environ.get("RECOMENDACOES", "0") != "1":
+        return None
+    recomendador = Recomendador(
+        arquivo_snapshot=os.environ.get("RECOMENDACOES_ARQUIVO", ARQUIVO_SNAPSHOT_PADRAO) or None,
+        vizinhos=int(os.environ.get("RECOMENDACOES_VIZINHOS", "50")),
+        intervalo_recarga=float(os.environ.get("RECOMENDACOES_RECARGA_SEGUNDOS", "600")),
+        intervalo_sincronia=float(os.environ.get("RECOMENDACOES_SINCRONIA_SEGUNDOS", "1")),
+    )
+    recomendador.iniciar()
+    return recomendador
+
+
+# Recomendador deste processo, criado por api.py; None se desligado
+recomendador = None
+
+
+def registrar(avaliacao_id, usuario_id, filme_id, nota):
+    """Avisa o recomendador deste processo de uma avaliação gravada (se houver recomendador)."""
+    if recomendador is not None:
+        recomendador.registrar(avaliacao_id, usuario_id, filme_id, nota)
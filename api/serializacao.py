@@ -0,0 +1,79 @@
+"""
+Conversão dos resultados do banco e serialização JSON das respostas,
+compartilhadas pela API síncrona (api.py) e pela assíncrona (api_async.py).
+
+- As conexões dos dois pools convertem NUMERIC direto em float ao ler as
+  linhas, então as rotas não precisam examinar cada valor.
+- O JSON é gerado pelo orjson quando ele está instalado (várias vezes mais
+  rápido que o módulo json) e pelo json da biblioteca padrão caso
+  contrário. Nos dois casos a saída é compacta e tem as chaves em ordem
+  alfabética; o orjson escreve os caracteres não ASCII direto em UTF-8, em
+  vez de escapá-los.
+"""
+import json
+import decimal
+
+from psycopg2 import extensions
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# --- TIPOS DO BANCO ---
+
+NUMERIC_COMO_FLOAT = extensions.new_type(
+    extensions.DECIMAL.values,
+    'NUMERIC_COMO_FLOAT',
+    lambda valor, cur: float(valor) if valor is not None else None,
+)
+
+
+def registrar_tipos(conn):
+    """Faz uma conexão do psycopg2 devolver NUMERIC como float."""
+    extensions.register_type(NUMERIC_COMO_FLOAT, conn)
+
+
+async def registrar_tipos_async(conn):
+    """Mesma conversão para as conexões do psycopg 3 (callback 'configure' do pool)."""
+    from psycopg.types.numeric import FloatLoader
+    conn.adapters.register_loader('numeric', FloatLoader)
+
+
+# --- JSON ---
+
+def _padrao(obj):
+    # Mesmo tratamento que o provedor JSON padrão do Flask dá a Decimal
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    raise TypeError(f"Objeto do tipo {type(obj).__name__} não é serializável em JSON.")
+
+
+if orjson is not None:
+    _OPCOES_ORJSON = orjson.OPT_SORT_KEYS
+
+    def dumps_bytes(obj):
+        return orjson.dumps(obj, default=_padrao, option=_OPCOES_ORJSON)
+
+    loads = orjson.loads
+else:
+    _codificador = json.JSONEncoder(ensure_ascii=True, sort_keys=True, separators=(',', ':'), default=_padrao)
+
+    def dumps_bytes(obj):
+        return _codificador.encode(obj).encode()
+
+    loads = json.loads
+
+
+def dumps(obj):
+    return dumps_bytes(obj).decode()
+
+
+def itens_de_array(objetos):
+    """
+    Os objetos como itens de um array JSON, separados por vírgula e sem os
+    colchetes, para as respostas em fluxo. Serializar o lote inteiro em uma
+    chamada evita o custo de uma chamada ao codificador por linha.
+    """
+    return dumps_bytes(objetos)[1:-1]
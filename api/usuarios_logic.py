@@ -1,3 +1,18 @@
+import logging
+
+from psycopg2.errors import QueryCanceled
+
+from cache import invalidar
+from preparadas import Preparada
+
+
+logger = logging.getLogger(__name__)
+
+INSERIR_USUARIO = Preparada('inserir_usuario', """
+    INSERT INTO usuarios (nome_de_usuario, nome, senha, pais, data_de_nascimento)
+    VALUES (%s, %s, %s, %s, %s)
+""")
+
 
 def registrar_usuario(conn, dados):
     """Realiza a inserção de um novo usuário no banco de dados."""
@@ -9,15 +24,9 @@ def registrar_usuario(conn, dados):
 
     try:
         cur = conn.cursor()
-        
-        # Query SQL com as colunas corretas da tabela 'usuarios'
-        query = """ 
-            INSERT INTO usuarios (nome_de_usuario, nome, senha, pais, data_de_nascimento) 
-            VALUES (%s, %s, %s, %s, %s)
-        """ # <-- ALTERADO
 
         # Executa a query com os valores corretos
-        cur.execute(query, (
+        INSERIR_USUARIO.executar(cur, (
             dados['nome_de_usuario'], 
             dados['nome'], 
             dados['senha'], # Lembre-se da nota de segurança sobre a senha!
@@ -27,7 +36,13 @@ def registrar_usuario(conn, dados):
         
         conn.commit()
         cur.close()
+        invalidar('usuarios')
         return {'message': 'Usuário cadastrado com sucesso!'}, 201
+    except QueryCanceled:
+        # Tempo limite da rota: a API responde 503
+        conn.rollback()
+        raise
     except Exception as e:
-        print(f"Erro ao inserir usuário: {e}")
+        logger.exception("Erro ao inserir usuário")
+        conn.rollback()
         return {'message': 'Erro interno no servidor ao cadastrar o usuário.'}, 500
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""
+Verifica os limites de erro dos agregados aproximados (api/aproximados.py)
+contra as contagens exatas e mede o custo de montar os esboços.
+
+Gera avaliações sintéticas (filmes e países com popularidade de Zipf),
+monta os esboços em duas metades, mescla as metades e confere:
+
+- a mescla é idêntica aos esboços montados de uma vez;
+- nenhuma contagem estimada fica abaixo da real, e a fração de filmes (e de
+  países) com erro acima de (e / largura) * N não passa de e^-profundidade;
+- o erro relativo quadrático médio dos avaliadores distintos (grupos com
+  pelo menos --minimo-avaliadores) fica abaixo de 1,5 vez 1,04 / sqrt(m);
+- os filmes mais avaliados estimados são os mesmos das contagens exatas.
+
+Termina com erro se alguma verificação falhar. Com --banco, compara também
+os esboços montados a partir do banco apontado por DATABASE_URL com os
+relatórios exatos (só lê o banco).
+
+    python benchmarks/agregados_aproximados.py --avaliacoes 1000000
+"""
+import os
+import sys
+import math
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api'))
+import aproximados  # noqa: E402
+
+
+def gerar_avaliacoes(quantidade, filmes, usuarios, paises, semente=42):
+    """Colunas sintéticas: filmes e países com popularidade de Zipf e usuários uniformes."""
+    aleatorio = np.random.default_rng(semente)
+    ids_filmes = (aleatorio.zipf(1.3, quantidade) - 1) % filmes
+    ids_usuarios = aleatorio.integers(0, usuarios, quantidade)
+    # O país é do usuário: alguns usuários não têm país
+    nomes = [None] + [f"País {i}" for i in range(1, paises)]
+    pais_do_usuario = (aleatorio.zipf(1.5, usuarios) - 1) % paises
+    return ids_filmes.astype(np.int64), ids_usuarios.astype(np.int64), [nomes[i] for i in pais_do_usuario[ids_usuarios]]
+
+
+def montar(esbocos, filmes, usuarios, paises, lote=aproximados.TAMANHO_LOTE_CARGA):
+    for inicio in range(0, len(filmes), lote):
+        fim = inicio + lote
+        esbocos.adicionar(filmes[inicio:fim], usuarios[inicio:fim], paises[inicio:fim])
+    return esbocos
+
+
+def verificar_contagem(nome, contagem, chaves, exatas, falhas):
+    estimadas = contagem.estimar(chaves)
+    erros = estimadas - exatas
+    acima = float(np.mean(erros > contagem.erro_maximo))
+    print(f"  {nome}: erro máximo {int(erros.max())} (limite {contagem.erro_maximo:.0f}), "
+          f"acima do limite {100 * acima:.2f}% (permitido {100 * contagem.probabilidade_de_falha:.2f}%)")
+    if erros.min() < 0:
+        falhas.append(f"{nome}: estimativa abaixo do valor real")
+    if acima > contagem.probabilidade_de_falha:
+        falhas.append(f"{nome}: {100 * acima:.2f}% das chaves acima do limite de erro")
+
+
+def verificar_avaliadores(nome, hll, grupos, exatos, minimo, falhas):
+    grupos, exatos = [g for g, e in zip(grupos, exatos) if e >= minimo], np.array([e for e in exatos if e >= minimo])
+    if not len(exatos):
+        print(f"  {nome}: nenhum grupo com {minimo} avaliadores ou mais")
+        return
+    relativos = hll.estimar(grupos) / exatos - 1
+    rms = math.sqrt(float(np.mean(relativos ** 2)))
+    print(f"  {nome}: erro relativo quadrático médio {100 * rms:.2f}% em {len(exatos)} grupos "
+          f"(esperado {100 * hll.erro_relativo:.2f}%), máximo {100 * float(np.abs(relativos).max()):.2f}%")
+    if rms > 1.5 * hll.erro_relativo:
+        falhas.append(f"{nome}: erro relativo {100 * rms:.2f}% acima de 1,5 vez o esperado")
+
+
+def sinteticos(args, falhas):
+    filmes, usuarios, paises = gerar_avaliacoes(args.avaliacoes, args.filmes, args.usuarios, args.paises)
+    parametros = dict(largura=args.largura, profundidade=args.profundidade, precisao=args.precisao)
+
+    inicio = time.perf_counter()
+    inteiro = montar(aproximados.Esbocos(**parametros), filmes, usuarios, paises)
+    duracao = time.perf_counter() - inicio
+    print(f"{args.avaliacoes} avaliações sintéticas, {args.filmes} filmes, {args.usuarios} usuários, {args.paises} países")
+    print(f"  montagem: {duracao:.2f}s ({args.avaliacoes / duracao / 1e6:.2f} milhões de avaliações/s), "
+          f"{inteiro.nbytes / 1e6:.1f} MB")
+
+    metade = len(filmes) // 2
+    mesclado = montar(aproximados.Esbocos(**parametros), filmes[:metade], usuarios[:metade], paises[:metade])
+    mesclado.mesclar(montar(aproximados.Esbocos(**parametros), filmes[metade:], usuarios[metade:], paises[metade:]))
+    iguais = (np.array_equal(mesclado.avaliacoes_por_filme.contadores, inteiro.avaliacoes_por_filme.contadores)
+              and np.array_equal(mesclado.avaliacoes_por_pais.contadores, inteiro.avaliacoes_por_pais.contadores)
+              and all(np.array_equal(m.estimar(i.grupos), i.estimar(i.grupos)) for m, i in (
+                  (mesclado.avaliadores_por_filme, inteiro.avaliadores_por_filme),
+                  (mesclado.avaliadores_por_pais, inteiro.avaliadores_por_pais))))
+    print(f"  mescla de duas metades idêntica à montagem inteira: {'sim' if iguais else 'NÃO'}")
+    if not iguais:
+        falhas.append("a mescla difere da montagem inteira")
+
+    contagem_filmes = np.bincount(filmes)
+    com_avaliacoes = np.flatnonzero(contagem_filmes)
+    verificar_contagem("avaliações por filme", inteiro.avaliacoes_por_filme, com_avaliacoes,
+                       contagem_filmes[com_avaliacoes], falhas)
+    codigos = np.array([aproximados.codigo_do_pais(p) for p in paises], dtype=np.int64)
+    codigos_unicos, contagem_paises = np.unique(codigos, return_counts=True)
+    verificar_contagem("avaliações por país", inteiro.avaliacoes_por_pais, codigos_unicos, contagem_paises, falhas)
+
+    pares_filmes = np.unique(filmes * args.usuarios + usuarios)
+    avaliadores_filmes = np.bincount(pares_filmes // args.usuarios)
+    verificar_avaliadores("avaliadores por filme", inteiro.avaliadores_por_filme, com_avaliacoes.tolist(),
+                          avaliadores_filmes[com_avaliacoes], args.minimo_avaliadores, falhas)
+    pares_paises = {(c, u) for c, u in zip(codigos.tolist(), usuarios.tolist())}
+    avaliadores_paises = {}
+    for codigo, _ in pares_paises:
+        avaliadores_paises[codigo] = avaliadores_paises.get(codigo, 0) + 1
+    verificar_avaliadores("avaliadores por país", inteiro.avaliadores_por_pais, list(avaliadores_paises),
+                          list(avaliadores_paises.values()), args.minimo_avaliadores, falhas)
+
+    exatos = np.lexsort((np.arange(len(contagem_filmes)), -contagem_filmes))[:5].tolist()
+    estimados = [f for f, _, _ in inteiro.mais_avaliados_com_avaliadores(5)]
+    print(f"  cinco mais avaliados: exatos {exatos}, estimados {estimados}")
+    if estimados != exatos:
+        falhas.append("os cinco filmes mais avaliados estimados diferem dos exatos")
+
+
+def banco(args, falhas):
+    """Esboços montados do banco contra os relatórios exatos."""
+    import consultas
+    from database import conexao
+
+    agregados = aproximados.AgregadosAproximados(args.largura, args.profundidade, args.precisao)
+    agregados.recarregar()
+    print(f"\nBanco: {agregados.esbocos.avaliacoes_por_filme.total} avaliações, recarga em {agregados.ultima_recarga_s}s")
+    with conexao() as conn:
+        if conn is None:
+            sys.exit("Falha na conexão com o banco.")
+        with conn.cursor() as cur:
+            cur.execute(consultas.AVALIACOES_PAIS)
+            exatos = dict(cur.fetchall())
+            cur.execute("""
+                SELECT u.pais, COUNT(DISTINCT a.usuario_id)
+                FROM avaliacoes AS a JOIN usuarios AS u ON u.id = a.usuario_id
+                GROUP BY u.pais
+            """)
+            distintos = dict(cur.fetchall())
+            cur.execute("SELECT filme_id FROM resumo_filmes WHERE quantidade_avaliacoes > 0 "
+                        "ORDER BY quantidade_avaliacoes DESC, filme_id LIMIT 5")
+            cinco = [linha[0] for linha in cur.fetchall()]
+        conn.commit()
+
+    limite = agregados.esbocos.avaliacoes_por_pais.erro_maximo
+    print(f"  {'país':<20} {'exato':>10} {'estimado':>10} {'distintos':>10} {'estimados':>10}")
+    for pais, total, avaliadores in agregados.por_pais():
+        print(f"  {str(pais):<20} {exatos.get(pais, 0):>10} {total:>10} {distintos.get(pais, 0):>10} {avaliadores:>10}")
+        if not 0 <= total - exatos.get(pais, 0) <= limite:
+            falhas.append(f"banco: contagem do país {pais} fora do limite de erro")
+    estimados = [f for f, _, _ in agregados.mais_avaliados(5)]
+    print(f"  cinco mais avaliados: exatos {cinco}, estimados {estimados}")
+    if set(estimados) != set(cinco):
+        # Empates na quinta posição podem trocar filmes de mesma contagem
+        print("  (conjuntos diferentes: confira os empates nas contagens exatas)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--avaliacoes', type=int, default=1000000)
+    parser.add_argument('--filmes', type=int, default=5000)
+    parser.add_argument('--usuarios', type=int, default=50000)
+    parser.add_argument('--paises', type=int, default=30)
+    parser.add_argument('--largura', type=int, default=4096)
+    parser.add_argument('--profundidade', type=int, default=5)
+    parser.add_argument('--precisao', type=int, default=10)
+    parser.add_argument('--minimo-avaliadores', type=int, default=1000)
+    parser.add_argument('--banco', action='store_true', help="Compara também com o banco de DATABASE_URL.")
+    args = parser.parse_args()
+
+    falhas = []
+    sinteticos(args, falhas)
+    if args.banco:
+        if not os.environ.get("DATABASE_URL"):
+            sys.exit("A variável de ambiente DATABASE_URL não foi definida.")
+        banco(args, falhas)
+
+    if falhas:
+        print("\nFALHOU:")
+        for falha in falhas:
+            print(f"  - {falha}")
+        sys.exit(1)
+    print("\nTodos os limites de erro foram respeitados.")
+
+
+if __name__ == '__main__':
+    main()
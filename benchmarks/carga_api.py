@@ -0,0 +1,210 @@
+"""
+Gerador de carga para a API: dispara requisições contra todas as rotas de
+api/api.py, com a concorrência escolhida, e mede a latência (p50, p95, p99)
+e a vazão de cada rota.
+
+As rotas de cadastro gravam dados de verdade; use um banco descartável.
+Os IDs usados nas avaliações são sorteados entre os que existem no banco
+apontado por DATABASE_URL.
+
+    DATABASE_URL=postgresql://... python benchmarks/carga_api.py \\
+        --url http://localhost:5000 --concorrencia 1 8 32 --requisicoes 500
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+from gerar_csvs import GENEROS, PAISES, TERMOS_BUSCA_FILMES, TERMOS_BUSCA_USUARIOS
+
+
+TAMANHO_LOTE = 100
+
+
+def percentil(valores_ordenados, p):
+    """Percentil pelo método do vizinho mais próximo (valores já ordenados)."""
+    if not valores_ordenados:
+        return None
+    indice = max(0, math.ceil(p / 100 * len(valores_ordenados)) - 1)
+    return valores_ordenados[indice]
+
+
+def ids_existentes(db_url):
+    conn = psycopg2.connect(db_url)
+    with conn.cursor() as cur:
+        cur.execute("SELECT min(id), max(id) FROM usuarios;")
+        usuarios = cur.fetchone()
+        cur.execute("SELECT min(id), max(id) FROM filmes;")
+        filmes = cur.fetchone()
+    conn.close()
+    if usuarios[0] is None or filmes[0] is None:
+        raise ValueError("O banco precisa ter usuários e filmes para gerar avaliações.")
+    return usuarios, filmes
+
+
+def rotas(usuarios, filmes, sufixo=''):
+    """
+    Lista de (nome, função) em que a função recebe (i, aleatorio) e devolve
+    (método, caminho, corpo). As leituras vêm antes das escritas, para que
+    as escritas não invalidem o cache no meio da medição das leituras.
+    'sufixo' distingue os títulos e nomes de usuário de cada rodada.
+    """
+    execucao = f"{int(time.time())}-{os.getpid()}{sufixo}"
+
+    def avaliacao(aleatorio):
+        return {
+            'usuario_id': aleatorio.randint(*usuarios),
+            'filme_id': aleatorio.randint(*filmes),
+            'nota': aleatorio.randrange(101) / 10,
+        }
+
+    def get(caminho):
+        return lambda i, aleatorio: ('GET', caminho, None)
+
+    return [
+        ('GET /api/health', get('/api/health')),
+        ('GET /api/health/pool', get('/api/health/pool')),
+        ('GET /api/health/cache', get('/api/health/cache')),
+        ('GET /api/health/fila', get('/api/health/fila')),
+        ('GET /api/top-filmes-genero', get('/api/top-filmes-genero')),
+        ('GET /api/cinco-populares', get('/api/cinco-populares')),
+        ('GET /api/avaliacoes-pais', get('/api/avaliacoes-pais')),
+        ('GET /api/notas-medias-faixa-etaria', get('/api/notas-medias-faixa-etaria')),
+        ('GET /api/generos-melhor-avaliacao', get('/api/generos-melhor-avaliacao')),
+        ('GET /api/dashboard', get('/api/dashboard')),
+        ('GET /api/filmes/buscar', lambda i, aleatorio: (
+            'GET', "/api/filmes/buscar?" + urllib.parse.urlencode({'titulo': aleatorio.choice(TERMOS_BUSCA_FILMES)}), None)),
+        ('GET /api/usuarios/buscar', lambda i, aleatorio: (
+            'GET', "/api/usuarios/buscar?" + urllib.parse.urlencode({'nome': aleatorio.choice(TERMOS_BUSCA_USUARIOS)}), None)),
+        ('POST /api/cadastrar-filme', lambda i, aleatorio: ('POST', '/api/cadastrar-filme', {
+            'titulo': f"Carga {execucao} {i}", 'genero': aleatorio.choice(GENEROS),
+            'ano': aleatorio.randint(1930, 2024),
+        })),
+        ('POST /api/cadastrar-usuario', lambda i, aleatorio: ('POST', '/api/cadastrar-usuario', {
+            'nome_de_usuario': f"carga{execucao}-{i}", 'nome': 'Usuário de Carga', 'senha': '1234',
+            'pais': aleatorio.choice(PAISES), 'data_de_nascimento': '1990-01-01',
+        })),
+        ('POST /api/cadastrar-avaliacao', lambda i, aleatorio: (
+            'POST', '/api/cadastrar-avaliacao', avaliacao(aleatorio))),
+        ('POST /api/avaliacoes/batch', lambda i, aleatorio: (
+            'POST', '/api/avaliacoes/batch', [avaliacao(aleatorio) for _ in range(TAMANHO_LOTE)])),
+    ]
+
+
+def requisitar(url_base, metodo, caminho, corpo, timeout):
+    dados = None
+    cabecalhos = {}
+    if corpo is not None:
+        dados = json.dumps(corpo).encode()
+        cabecalhos['Content-Type'] = 'application/json'
+    pedido = urllib.request.Request(url_base + caminho, data=dados, headers=cabecalhos, method=metodo)
+    try:
+        with urllib.request.urlopen(pedido, timeout=timeout) as resposta:
+            resposta.read()
+            return resposta.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def medir_rota(url_base, gerar, concorrencia, requisicoes, timeout=30, semente=42):
+    """
+    Envia 'requisicoes' requisições com 'concorrencia' em paralelo e devolve
+    as latências (ms), a vazão e a contagem de respostas por status.
+    """
+    latencias = []
+    status = {}
+    erros = 0
+    lock = threading.Lock()
+    contador = iter(range(requisicoes))
+
+    def trabalhador(n):
+        nonlocal erros
+        aleatorio = random.Random(semente + n)
+        while True:
+            with lock:
+                i = next(contador, None)
+            if i is None:
+                return
+            metodo, caminho, corpo = gerar(i, aleatorio)
+            inicio = time.perf_counter()
+            try:
+                codigo = requisitar(url_base, metodo, caminho, corpo, timeout)
+            except OSError:
+                codigo = None
+            duracao = 1000 * (time.perf_counter() - inicio)
+            with lock:
+                latencias.append(duracao)
+                status[str(codigo)] = status.get(str(codigo), 0) + 1
+                if codigo is None or codigo >= 500:
+                    erros += 1
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        list(executor.map(trabalhador, range(concorrencia)))
+    duracao_total = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        'requisicoes': requisicoes,
+        'concorrencia': concorrencia,
+        'duracao_s': round(duracao_total, 3),
+        'vazao_rps': round(requisicoes / duracao_total, 1),
+        'p50_ms': round(percentil(latencias, 50), 3),
+        'p95_ms': round(percentil(latencias, 95), 3),
+        'p99_ms': round(percentil(latencias, 99), 3),
+        'max_ms': round(latencias[-1], 3),
+        'erros': erros,
+        'status': status,
+    }
+
+
+def executar_carga(url_base, db_url, concorrencias, requisicoes, filtro=None):
+    """Mede todas as rotas em cada nível de concorrência. Devolve uma lista de resultados."""
+    usuarios, filmes = ids_existentes(db_url)
+    resultados = []
+    for concorrencia in concorrencias:
+        for nome, gerar in rotas(usuarios, filmes, sufixo=f"-c{concorrencia}"):
+            if filtro and not any(f in nome for f in filtro):
+                continue
+            # Uma requisição de aquecimento (cache, conexões do pool) fora da medição
+            requisitar(url_base, *gerar(-1, random.Random(0)), timeout=60)
+            medida = medir_rota(url_base, gerar, concorrencia, requisicoes)
+            medida['rota'] = nome
+            resultados.append(medida)
+            print(f"{nome:<40} c={concorrencia:<3} p50={medida['p50_ms']:>9.2f}ms "
+                  f"p95={medida['p95_ms']:>9.2f}ms p99={medida['p99_ms']:>9.2f}ms "
+                  f"{medida['vazao_rps']:>8.1f} req/s erros={medida['erros']}")
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--concorrencia', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--requisicoes', type=int, default=200, help="Requisições por rota e nível de concorrência.")
+    parser.add_argument('--rotas', nargs='+', help="Mede apenas as rotas cujo nome contém um destes trechos.")
+    parser.add_argument('--saida', help="Arquivo JSON onde gravar os resultados.")
+    args = parser.parse_args()
+
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        sys.exit("A variável de ambiente DATABASE_URL não foi definida.")
+
+    resultados = executar_carga(args.url.rstrip('/'), db_url, args.concorrencia, args.requisicoes, args.rotas)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump({'carga': resultados}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Compara dois arquivos de resultados da suíte (suite.py) e mostra a variação
+de cada medida. Com --limite, termina com código 1 se o p95 de alguma rota
+ou o tempo de algum modo do importador piorar mais que o limite (em %).
+
+    python benchmarks/comparar.py antes.json depois.json --limite 20
+"""
+import sys
+import json
+import argparse
+
+
+def carregar(caminho):
+    with open(caminho, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def variacao(antes, depois):
+    if not antes:
+        return None
+    return 100 * (depois - antes) / antes
+
+
+def formatar(valor):
+    return '—' if valor is None else f"{valor:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('antes')
+    parser.add_argument('depois')
+    parser.add_argument('--limite', type=float, help="Piora máxima aceita, em %%.")
+    args = parser.parse_args()
+
+    antes, depois = carregar(args.antes), carregar(args.depois)
+    print(f"antes:  {antes.get('commit')}  {antes.get('escala')}")
+    print(f"depois: {depois.get('commit')}  {depois.get('escala')}\n")
+    regressoes = []
+
+    for modo, medida in depois.get('importador', {}).items():
+        anterior = antes.get('importador', {}).get(modo)
+        if not anterior:
+            continue
+        v = variacao(anterior['duracao_s'], medida['duracao_s'])
+        print(f"importador {modo:<8} {anterior['duracao_s']:>10.2f}s -> {medida['duracao_s']:>10.2f}s  {formatar(v)}")
+        if args.limite is not None and v is not None and v > args.limite:
+            regressoes.append(f"importador {modo}")
+
+    medidas_antes = {(m['rota'], m['concorrencia']): m for m in antes.get('carga', [])}
+    print(f"\n{'rota':<40} {'c':>3} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8}")
+    for medida in depois.get('carga', []):
+        chave = (medida['rota'], medida['concorrencia'])
+        anterior = medidas_antes.get(chave)
+        if not anterior:
+            continue
+        p95 = variacao(anterior['p95_ms'], medida['p95_ms'])
+        print(f"{chave[0]:<40} {chave[1]:>3} "
+              f"{formatar(variacao(anterior['p50_ms'], medida['p50_ms'])):>8} {formatar(p95):>8} "
+              f"{formatar(variacao(anterior['p99_ms'], medida['p99_ms'])):>8} "
+              f"{formatar(variacao(anterior['vazao_rps'], medida['vazao_rps'])):>8}")
+        if args.limite is not None and p95 is not None and p95 > args.limite:
+            regressoes.append(f"{chave[0]} (c={chave[1]})")
+
+    if regressoes:
+        print(f"\n❌ Pioraram mais de {args.limite}%: {', '.join(regressoes)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Mede o ganho das consultas preparadas (api/preparadas.py) nos comandos
+mais frequentes da API: cada comando é executado várias vezes em uma
+conexão comum, enviando o SQL completo (o PostgreSQL analisa e planeja a
+cada vez), e em uma conexão do pool, que o prepara uma vez e depois só
+envia EXECUTE com os parâmetros.
+
+Lê o banco apontado por DATABASE_URL, que precisa ter dados. Os INSERTs dos
+cadastros rodam dentro de uma transação desfeita no fim, então nenhuma
+linha é gravada.
+
+    DATABASE_URL=postgresql://... python benchmarks/consultas_preparadas.py --repeticoes 500
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api'))
+import preparadas  # noqa: E402
+from filmes_logic import INSERIR_FILME  # noqa: E402
+from usuarios_logic import INSERIR_USUARIO  # noqa: E402
+from avaliacoes_logic import INSERIR_AVALIACAO  # noqa: E402
+from serializacao import registrar_tipos  # noqa: E402
+
+from gerar_csvs import TERMOS_BUSCA_FILMES, TERMOS_BUSCA_USUARIOS  # noqa: E402
+
+
+def parametros_de_busca(termo):
+    return {'termo': termo, 'padrao': f'%{termo}%', 'after': None, 'limite': 50, 'deslocamento': 0}
+
+
+def comandos(cur):
+    """(nome, Preparada, função que devolve os parâmetros da execução i)."""
+    cur.execute("SELECT min(id) FROM usuarios")
+    usuario = cur.fetchone()[0]
+    cur.execute("SELECT min(id) FROM filmes")
+    filme = cur.fetchone()[0]
+    if usuario is None or filme is None:
+        sys.exit("O banco precisa ter usuários e filmes.")
+
+    lista = [(nome, consulta, lambda i, p=params: p)
+             for nome, consulta in preparadas.RELATORIOS.items()
+             for params in [{'after': None, 'limite': 50} if nome == 'notas-medias-faixa-etaria' else None]]
+    lista += [
+        ('em-alta', preparadas.EM_ALTA, lambda i: {'janela': '7 days', 'limite': 10}),
+        ('buscar filmes', preparadas.BUSCAS[('filmes', False)],
+         lambda i: parametros_de_busca(TERMOS_BUSCA_FILMES[i % len(TERMOS_BUSCA_FILMES)])),
+        ('buscar filmes sem acento', preparadas.BUSCAS[('filmes', True)],
+         lambda i: parametros_de_busca(TERMOS_BUSCA_FILMES[i % len(TERMOS_BUSCA_FILMES)])),
+        ('buscar usuários', preparadas.BUSCAS[('usuarios', False)],
+         lambda i: parametros_de_busca(TERMOS_BUSCA_USUARIOS[i % len(TERMOS_BUSCA_USUARIOS)])),
+        ('inserir filme', INSERIR_FILME, lambda i: (f"Filme preparado {i}", 'Drama', 2000)),
+        ('inserir usuário', INSERIR_USUARIO,
+         lambda i: (f"preparado{i}", 'Usuário Preparado', 'senha', 'Brasil', '1990-01-01')),
+        ('inserir avaliação', INSERIR_AVALIACAO, lambda i: (usuario, filme, 7.5)),
+    ]
+    return lista
+
+
+def medir(conn, consulta, parametros, repeticoes, preparada):
+    """
+    Mediana, em µs, de uma execução completa (comando + leitura das linhas).
+    A primeira execução (que aquece o catálogo e faz o PREPARE) fica de fora.
+    """
+    duracoes = []
+    with conn.cursor() as cur:
+        for i in range(repeticoes + 1):
+            inicio = time.perf_counter()
+            if preparada:
+                consulta.executar(cur, parametros(i))
+            else:
+                cur.execute(consulta.sql, parametros(i))
+            if cur.description is not None:
+                cur.fetchall()
+            duracoes.append(time.perf_counter() - inicio)
+    # Desfaz os INSERTs antes que a outra conexão grave as mesmas chaves
+    conn.rollback()
+    return 1e6 * statistics.median(duracoes[1:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeticoes', type=int, default=300)
+    args = parser.parse_args()
+
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        sys.exit("A variável de ambiente DATABASE_URL não foi definida.")
+    texto = psycopg2.connect(db_url)
+    preparada = psycopg2.connect(db_url, connection_factory=preparadas.ConexaoPreparada)
+    for conn in (texto, preparada):
+        registrar_tipos(conn)
+
+    with texto.cursor() as cur:
+        lista = comandos(cur)
+    texto.rollback()
+
+    print(f"Mediana de {args.repeticoes} execuções por comando (a melhor de duas rodadas), em µs:\n")
+    print(f"  {'comando':<28} {'SQL completo':>12} {'preparado':>12} {'ganho':>7}")
+    for nome, consulta, parametros in lista:
+        # As duas formas se alternam duas vezes e fica a melhor mediana de
+        # cada, para que a ordem não favoreça nenhuma delas
+        sem, com = float('inf'), float('inf')
+        for _ in range(2):
+            sem = min(sem, medir(texto, consulta, parametros, args.repeticoes, preparada=False))
+            com = min(com, medir(preparada, consulta, parametros, args.repeticoes, preparada=True))
+        print(f"  {nome:<28} {sem:12.0f} {com:12.0f} {sem / com:6.1f}x")
+
+    texto.close()
+    preparada.close()
+
+
+if __name__ == '__main__':
+    main()
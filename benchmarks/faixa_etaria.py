@@ -0,0 +1,151 @@
+"""
+Compara o relatório de notas médias por faixa etária calculado pelas views
+antigas (idade calculada por avaliação) com o caminho atual, que lê as
+faixas pré-calculadas em 'resumo_filmes_faixas'.
+
+ATENÇÃO: o script recria o esquema do banco apontado por DATABASE_URL e o
+preenche com dados sintéticos. Use um banco descartável.
+
+    DATABASE_URL=postgresql://... python benchmarks/faixa_etaria.py --avaliacoes 1000000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import importlib.util
+
+import psycopg2
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def carregar_importador():
+    """Carrega dados/gera-db-postgres.py (o nome do arquivo não é um módulo válido)."""
+    caminho = os.path.join(RAIZ, 'dados', 'gera-db-postgres.py')
+    spec = importlib.util.spec_from_file_location('gera_db_postgres', caminho)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+# Definição da view notas_medias_por_filme_por_idade antes das faixas pré-calculadas
+CONSULTA_ANTIGA = """
+    WITH avaliacoes_com_detalhes AS (
+        SELECT
+            fi.titulo,
+            av.nota,
+            CASE
+                WHEN EXTRACT(YEAR FROM AGE(CURRENT_DATE, us.data_de_nascimento)) <= 12 THEN 'criancas'
+                WHEN EXTRACT(YEAR FROM AGE(CURRENT_DATE, us.data_de_nascimento)) BETWEEN 13 AND 17 THEN 'adolescentes'
+                WHEN EXTRACT(YEAR FROM AGE(CURRENT_DATE, us.data_de_nascimento)) BETWEEN 18 AND 29 THEN 'jovens_adultos'
+                WHEN EXTRACT(YEAR FROM AGE(CURRENT_DATE, us.data_de_nascimento)) BETWEEN 30 AND 49 THEN 'adultos'
+                ELSE '50_mais'
+            END AS faixa_etaria
+        FROM filmes AS fi
+        LEFT JOIN avaliacoes AS av ON fi.id = av.filme_id
+        LEFT JOIN usuarios AS us ON av.usuario_id = us.id
+    )
+    SELECT
+        titulo,
+        ROUND(AVG(CASE WHEN faixa_etaria = 'criancas' THEN nota END), 2) AS media_criancas_ate_12,
+        ROUND(AVG(CASE WHEN faixa_etaria = 'adolescentes' THEN nota END), 2) AS media_adolescentes_13_a_17,
+        ROUND(AVG(CASE WHEN faixa_etaria = 'jovens_adultos' THEN nota END), 2) AS media_jovens_adultos_18_a_29,
+        ROUND(AVG(CASE WHEN faixa_etaria = 'adultos' THEN nota END), 2) AS media_adultos_30_a_49,
+        ROUND(AVG(CASE WHEN faixa_etaria = '50_mais' THEN nota END), 2) AS media_50_mais,
+        ROUND(AVG(nota), 2) AS media_geral
+    FROM avaliacoes_com_detalhes
+    GROUP BY titulo
+    ORDER BY titulo
+"""
+
+CONSULTA_NOVA = "SELECT * FROM notas_medias_por_filme_por_idade ORDER BY titulo"
+
+
+def gerar_dados(conn, filmes, usuarios, avaliacoes):
+    generos = ['Ação', 'Animação', 'Biografia', 'Comédia', 'Crime', 'Drama',
+               'Fantasia', 'Ficção Científica', 'Guerra', 'Musical', 'Romance', 'Suspense', 'Terror']
+    paises = ['Argentina', 'Brasil', 'Chile', 'Espanha', 'Mexico', 'Portugal']
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO filmes (titulo, genero, ano)
+            SELECT 'Filme ' || i, (%s::text[])[1 + i %% %s], 1930 + i %% 95
+            FROM generate_series(1, %s) AS i;
+        """, (generos, len(generos), filmes))
+        cur.execute("""
+            INSERT INTO usuarios (nome_de_usuario, nome, senha, pais, data_de_nascimento)
+            SELECT 'usuario' || i, 'Usuário ' || i, '1234', (%s::text[])[1 + i %% %s],
+                   DATE '1940-01-01' + (random() * 30000)::int
+            FROM generate_series(1, %s) AS i;
+        """, (paises, len(paises), usuarios))
+        cur.execute("""
+            INSERT INTO avaliacoes (usuario_id, filme_id, nota)
+            SELECT 1 + (random() * (%s - 1))::int, 1 + (random() * (%s - 1))::int, round((random() * 10)::numeric, 1)
+            FROM generate_series(1, %s);
+        """, (usuarios, filmes, avaliacoes))
+        cur.execute("ANALYZE;")
+    conn.commit()
+
+
+def medir(conn, consultas, repeticoes):
+    tempos = []
+    resultado = None
+    with conn.cursor() as cur:
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            for consulta in consultas:
+                cur.execute(consulta)
+            resultado = cur.fetchall()
+            tempos.append(time.perf_counter() - inicio)
+    conn.rollback()
+    return tempos, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filmes', type=int, default=5000)
+    parser.add_argument('--usuarios', type=int, default=100000)
+    parser.add_argument('--avaliacoes', type=int, default=1000000)
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--saida', help="Arquivo JSON onde gravar os resultados.")
+    args = parser.parse_args()
+
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        sys.exit("A variável de ambiente DATABASE_URL não foi definida.")
+
+    importador = carregar_importador()
+    conn = psycopg2.connect(db_url)
+    importador.criar_esquema(conn)
+
+    print(f"\nGerando {args.filmes} filmes, {args.usuarios} usuários e {args.avaliacoes} avaliações...")
+    inicio = time.perf_counter()
+    gerar_dados(conn, args.filmes, args.usuarios, args.avaliacoes)
+    print(f"✅ Dados gerados em {time.perf_counter() - inicio:.1f}s.")
+
+    tempos_antigos, resultado_antigo = medir(conn, [CONSULTA_ANTIGA], args.repeticoes)
+    tempos_novos, resultado_novo = medir(
+        conn, ["SELECT atualizar_faixas_etarias()", CONSULTA_NOVA], args.repeticoes
+    )
+    conn.close()
+
+    resultados = {
+        'filmes': args.filmes,
+        'usuarios': args.usuarios,
+        'avaliacoes': args.avaliacoes,
+        'views_antigas_ms': round(1000 * statistics.median(tempos_antigos), 2),
+        'faixas_pre_calculadas_ms': round(1000 * statistics.median(tempos_novos), 2),
+        'resultados_iguais': resultado_antigo == resultado_novo,
+    }
+    resultados['aceleracao'] = round(resultados['views_antigas_ms'] / resultados['faixas_pre_calculadas_ms'], 1)
+
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
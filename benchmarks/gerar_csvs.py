@@ -0,0 +1,105 @@
+"""
+Gera filmes.csv, usuarios.csv e avaliacoes.csv sintéticos, com as mesmas
+colunas dos arquivos de dados/, para alimentar o importador em escala.
+
+Os arquivos são escritos linha a linha, então a memória usada depende do
+número de filmes e usuários, não do número de avaliações. A mesma semente
+gera sempre os mesmos arquivos.
+
+    python benchmarks/gerar_csvs.py --avaliacoes 10000000 --destino /tmp/csvs
+"""
+import os
+import csv
+import time
+import random
+import argparse
+import datetime
+
+
+GENEROS = ['Ação', 'Animação', 'Biografia', 'Comédia', 'Crime', 'Drama',
+           'Fantasia', 'Ficção Científica', 'Guerra', 'Musical', 'Romance', 'Suspense', 'Terror']
+PAISES = ['Argentina', 'Brasil', 'Chile', 'Espanha', 'Mexico', 'Portugal']
+PALAVRAS_TITULO = ['Sonho', 'Noite', 'Rei', 'Cidade', 'Chefão', 'Estrela', 'Viagem', 'Coração',
+                   'Segredo', 'Guerra', 'Mar', 'Sombra', 'Memória', 'Fuga', 'Verão', 'Lenda']
+NOMES = ['Alice', 'Ana', 'Bruno', 'Carla', 'Daniel', 'Eduardo', 'Fernanda', 'Gabriel',
+         'Helena', 'Igor', 'Julia', 'Lucas', 'Mariana', 'Pedro', 'Rafael', 'Sofia']
+SOBRENOMES = ['Almeida', 'Barbosa', 'Costa', 'Dias', 'Ferreira', 'Gomes', 'Lima', 'Martins',
+              'Oliveira', 'Pereira', 'Ribeiro', 'Rocha', 'Santos', 'Silva', 'Souza']
+
+# Termos usados pelo gerador de carga nas rotas de busca
+TERMOS_BUSCA_FILMES = [p.lower() for p in PALAVRAS_TITULO[:8]]
+TERMOS_BUSCA_USUARIOS = [n.lower() for n in NOMES[:8]]
+
+
+def titulo_do_filme(i):
+    a = PALAVRAS_TITULO[i % len(PALAVRAS_TITULO)]
+    b = PALAVRAS_TITULO[(i // len(PALAVRAS_TITULO)) % len(PALAVRAS_TITULO)]
+    return f"{a} da {b} {i}"
+
+
+def nome_do_usuario(i):
+    nome = NOMES[i % len(NOMES)]
+    sobrenome = SOBRENOMES[(i // len(NOMES)) % len(SOBRENOMES)]
+    return f"{nome.lower()}{sobrenome.lower()}{i}", f"{nome} {sobrenome}"
+
+
+def gerar_csvs(destino, filmes, usuarios, avaliacoes, semente=42):
+    """Escreve os três CSVs em 'destino' e devolve o tempo gasto em segundos."""
+    os.makedirs(destino, exist_ok=True)
+    aleatorio = random.Random(semente)
+    inicio = time.perf_counter()
+
+    titulos = [titulo_do_filme(i) for i in range(1, filmes + 1)]
+    with open(os.path.join(destino, 'filmes.csv'), 'w', newline='', encoding='utf-8') as f:
+        escritor = csv.writer(f)
+        escritor.writerow(['titulo', 'genero', 'ano', 'nota'])
+        for titulo in titulos:
+            escritor.writerow([titulo, aleatorio.choice(GENEROS), aleatorio.randint(1930, 2024),
+                               round(aleatorio.uniform(5, 10), 1)])
+
+    nomes_de_usuario = []
+    nascimento_minimo = datetime.date(1940, 1, 1)
+    with open(os.path.join(destino, 'usuarios.csv'), 'w', newline='', encoding='utf-8') as f:
+        escritor = csv.writer(f)
+        escritor.writerow(['nome_de_usuario', 'nome', 'senha', 'pais', 'data_de_nascimento'])
+        for i in range(1, usuarios + 1):
+            nome_de_usuario, nome = nome_do_usuario(i)
+            nascimento = nascimento_minimo + datetime.timedelta(days=aleatorio.randint(0, 27000))
+            escritor.writerow([nome_de_usuario, nome, '1234', aleatorio.choice(PAISES), nascimento.isoformat()])
+            nomes_de_usuario.append(nome_de_usuario)
+
+    with open(os.path.join(destino, 'avaliacoes.csv'), 'w', newline='', encoding='utf-8') as f:
+        escritor = csv.writer(f)
+        escritor.writerow(['nome_de_usuario', 'titulo', 'nota'])
+        sortear = aleatorio.randrange
+        for _ in range(avaliacoes):
+            escritor.writerow([nomes_de_usuario[sortear(usuarios)], titulos[sortear(filmes)],
+                               sortear(101) / 10])
+
+    return time.perf_counter() - inicio
+
+
+def escala_padrao(avaliacoes, filmes=None, usuarios=None):
+    """Em média 1000 avaliações por filme e 20 por usuário, com no mínimo 50 filmes e 100 usuários."""
+    filmes = filmes or max(50, avaliacoes // 1000)
+    usuarios = usuarios or max(100, avaliacoes // 20)
+    return filmes, usuarios
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--avaliacoes', type=int, default=100000)
+    parser.add_argument('--filmes', type=int, help="Padrão: avaliações / 1000 (mínimo 50).")
+    parser.add_argument('--usuarios', type=int, help="Padrão: avaliações / 20 (mínimo 100).")
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--destino', required=True, help="Diretório onde gravar os CSVs.")
+    args = parser.parse_args()
+
+    filmes, usuarios = escala_padrao(args.avaliacoes, args.filmes, args.usuarios)
+    print(f"Gerando {filmes} filmes, {usuarios} usuários e {args.avaliacoes} avaliações em {args.destino}...")
+    duracao = gerar_csvs(args.destino, filmes, usuarios, args.avaliacoes, args.semente)
+    print(f"✅ CSVs gerados em {duracao:.1f}s.")
+
+
+if __name__ == '__main__':
+    main()
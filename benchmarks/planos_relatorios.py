@@ -0,0 +1,139 @@
+"""
+Registra os planos (EXPLAIN ANALYZE) das consultas dos relatórios antes e
+depois da migração de índices das junções (versão 5 do esquema).
+
+O esquema é criado até a versão 4, preenchido com dados sintéticos, e cada
+consulta é explicada; em seguida a migração 5 é aplicada e as consultas são
+explicadas de novo sobre os mesmos dados.
+
+ATENÇÃO: o script recria o esquema do banco apontado por DATABASE_URL e o
+preenche com dados sintéticos. Use um banco descartável.
+
+    DATABASE_URL=postgresql://... python benchmarks/planos_relatorios.py --saida planos.txt
+"""
+import os
+import re
+import sys
+import argparse
+
+import psycopg2
+
+from faixa_etaria import carregar_importador, gerar_dados
+
+
+VERSAO_INDICES = 5
+
+# Consultas das rotas de relatório (api/api.py) e dos caminhos que leem as
+# tabelas base. As escritas são desfeitas depois de explicadas.
+CONSULTAS = [
+    ("/api/top-filmes-genero", """
+        WITH FilmesRanqueados AS (
+            SELECT
+                f.genero,
+                f.titulo,
+                ROUND(r.soma_notas / r.quantidade_notas, 1) as nota_media,
+                ROW_NUMBER() OVER (PARTITION BY f.genero ORDER BY r.soma_notas / r.quantidade_notas DESC) as ranking
+            FROM resumo_filmes AS r
+            JOIN filmes AS f ON f.id = r.filme_id
+            WHERE r.quantidade_notas > 0
+        )
+        SELECT genero, titulo, nota_media, ranking
+        FROM FilmesRanqueados
+        WHERE ranking <= 10
+        ORDER BY genero, nota_media DESC
+    """),
+    ("/api/cinco-populares", """
+        SELECT f.titulo, f.genero, f.ano, r.quantidade_avaliacoes
+        FROM resumo_filmes AS r
+        JOIN filmes AS f ON f.id = r.filme_id
+        WHERE r.quantidade_avaliacoes > 0
+        ORDER BY r.quantidade_avaliacoes DESC, r.filme_id
+        LIMIT 5
+    """),
+    ("/api/avaliacoes-pais", """
+        SELECT pais, quantidade_avaliacoes AS total_avaliacoes
+        FROM resumo_paises
+        WHERE quantidade_avaliacoes > 0
+        ORDER BY total_avaliacoes DESC
+    """),
+    ("/api/notas-medias-faixa-etaria", """
+        SELECT * FROM public.notas_medias_por_filme_por_idade ORDER BY titulo
+    """),
+    ("/api/generos-melhor-avaliacao", """
+        SELECT genero, (soma_notas / quantidade_notas)::numeric(10,2) AS nota_media
+        FROM resumo_generos
+        ORDER BY nota_media DESC
+    """),
+    ("view notas_medias_filmes (um filme)", """
+        SELECT * FROM notas_medias_filmes WHERE id = 42
+    """),
+    ("apagar um filme (cascata em avaliacoes)", """
+        DELETE FROM filmes WHERE id = 42
+    """),
+    ("trocar a faixa etária de um usuário", """
+        UPDATE usuarios SET data_de_nascimento = DATE '1950-01-01' WHERE id = 42
+    """),
+]
+
+
+def explicar(conn):
+    planos = {}
+    with conn.cursor() as cur:
+        for nome, consulta in CONSULTAS:
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + consulta)
+            planos[nome] = '\n'.join(linha[0] for linha in cur.fetchall())
+            conn.rollback()
+    return planos
+
+
+def tempo_execucao(plano):
+    encontrado = re.search(r"Execution Time: ([\d.]+) ms", plano)
+    return float(encontrado.group(1)) if encontrado else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filmes', type=int, default=5000)
+    parser.add_argument('--usuarios', type=int, default=100000)
+    parser.add_argument('--avaliacoes', type=int, default=1000000)
+    parser.add_argument('--saida', help="Arquivo texto onde gravar os planos.")
+    args = parser.parse_args()
+
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        sys.exit("A variável de ambiente DATABASE_URL não foi definida.")
+
+    importador = carregar_importador()
+    conn = psycopg2.connect(db_url)
+    importador.criar_esquema(conn, ate_versao=VERSAO_INDICES - 1)
+
+    print(f"\nGerando {args.filmes} filmes, {args.usuarios} usuários e {args.avaliacoes} avaliações...")
+    gerar_dados(conn, args.filmes, args.usuarios, args.avaliacoes)
+
+    antes = explicar(conn)
+    importador.aplicar_migracoes(conn, ate_versao=VERSAO_INDICES)
+    depois = explicar(conn)
+    cur = conn.cursor()
+    cur.execute("SHOW server_version;")
+    versao_servidor = cur.fetchone()[0]
+    conn.close()
+
+    linhas = [
+        f"PostgreSQL {versao_servidor}; {args.filmes} filmes, {args.usuarios} usuários, {args.avaliacoes} avaliações.",
+        "",
+        f"{'consulta':<45} {'antes (ms)':>12} {'depois (ms)':>12}",
+    ]
+    for nome, _ in CONSULTAS:
+        linhas.append(f"{nome:<45} {tempo_execucao(antes[nome]):>12.3f} {tempo_execucao(depois[nome]):>12.3f}")
+    resumo = '\n'.join(linhas)
+    print('\n' + resumo)
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(resumo + '\n')
+            for nome, _ in CONSULTAS:
+                f.write(f"\n\n=== {nome} ===\n\n--- antes ---\n{antes[nome]}\n\n--- depois ---\n{depois[nome]}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Mede o custo de transformar as linhas do relatório por faixa etária em JSON,
+comparando o caminho antigo das rotas com o atual (api/serializacao.py):
+
+- antigo: valores NUMERIC lidos como Decimal, um isinstance() e um float()
+  por célula, e uma chamada a json.dumps(sort_keys=True) por linha;
+- atual: NUMERIC lido direto como float, dict(zip()) por linha e uma
+  chamada ao codificador (orjson, se instalado) por lote de 1000 linhas.
+
+As linhas são sintéticas, com as mesmas colunas da view. Com --banco, mede
+também a leitura das mesmas linhas do PostgreSQL apontado por DATABASE_URL
+com cada conversão de NUMERIC (nenhuma tabela é criada ou alterada).
+
+    python benchmarks/serializacao_json.py --linhas 200000
+"""
+import os
+import sys
+import json
+import time
+import random
+import decimal
+import argparse
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api'))
+import serializacao  # noqa: E402
+
+
+COLUNAS = [
+    'titulo', 'media_criancas_ate_12', 'media_adolescentes_13_a_17', 'media_jovens_adultos_18_a_29',
+    'media_adultos_30_a_49', 'media_50_mais', 'media_geral',
+]
+TAMANHO_LOTE = 1000
+
+CONSULTA_BANCO = """
+    SELECT 'Filme ' || g,
+           (random() * 10)::numeric(4,2), (random() * 10)::numeric(4,2), (random() * 10)::numeric(4,2),
+           (random() * 10)::numeric(4,2), (random() * 10)::numeric(4,2), (random() * 10)::numeric(4,2)
+    FROM generate_series(1, %s) AS g
+"""
+
+
+def gerar_linhas(quantidade, semente=42):
+    aleatorio = random.Random(semente)
+    linhas = []
+    for i in range(quantidade):
+        medias = [None if aleatorio.random() < 0.1 else decimal.Decimal(f"{aleatorio.uniform(0, 10):.2f}")
+                  for _ in COLUNAS[1:]]
+        linhas.append((f"Filme {i}", *medias))
+    return linhas
+
+
+def em_lotes(linhas):
+    for inicio in range(0, len(linhas), TAMANHO_LOTE):
+        yield linhas[inicio:inicio + TAMANHO_LOTE]
+
+
+def json_antigo(linhas):
+    pedacos = []
+    for lote in em_lotes(linhas):
+        pedacos.append(','.join(
+            json.dumps({
+                coluna: float(valor) if isinstance(valor, decimal.Decimal) else valor
+                for coluna, valor in zip(COLUNAS, linha)
+            }, ensure_ascii=True, sort_keys=True)
+            for linha in lote
+        ))
+    return '[' + ','.join(pedacos) + ']'
+
+
+def json_atual(linhas):
+    pedacos = [serializacao.itens_de_array([dict(zip(COLUNAS, linha)) for linha in lote]) for lote in em_lotes(linhas)]
+    return b'[' + b','.join(pedacos) + b']'
+
+
+def cronometrar(funcao, *args, repeticoes=3):
+    """Melhor tempo de algumas repetições, em segundos, e o último resultado."""
+    melhor, resultado = None, None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao(*args)
+        duracao = time.perf_counter() - inicio
+        melhor = duracao if melhor is None else min(melhor, duracao)
+    return melhor, resultado
+
+
+def ler_do_banco(db_url, quantidade, como_float):
+    conn = psycopg2.connect(db_url)
+    if como_float:
+        serializacao.registrar_tipos(conn)
+    with conn.cursor() as cur:
+        cur.execute(CONSULTA_BANCO, (quantidade,))
+        linhas = cur.fetchall()
+    conn.close()
+    return linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, default=100000)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--banco', action='store_true', help="Mede também a leitura das linhas do PostgreSQL.")
+    args = parser.parse_args()
+
+    print(f"Codificador atual: {'orjson' if serializacao.orjson else 'json (orjson não instalado)'}")
+    decimais = gerar_linhas(args.linhas)
+    floats = [(linha[0], *(None if v is None else float(v) for v in linha[1:])) for linha in decimais]
+
+    antigo, saida_antiga = cronometrar(json_antigo, decimais, repeticoes=args.repeticoes)
+    atual, saida_atual = cronometrar(json_atual, floats, repeticoes=args.repeticoes)
+    if json.loads(saida_antiga) != json.loads(saida_atual):
+        sys.exit("❌ Os dois caminhos geraram JSON diferentes.")
+
+    print(f"\nSerialização de {args.linhas} linhas (melhor de {args.repeticoes}):")
+    print(f"  antigo: {1000 * antigo:9.1f} ms ({1e6 * antigo / args.linhas:.2f} µs/linha)")
+    print(f"  atual:  {1000 * atual:9.1f} ms ({1e6 * atual / args.linhas:.2f} µs/linha)")
+    print(f"  {antigo / atual:.1f}x mais rápido")
+
+    if args.banco:
+        db_url = os.environ.get("DATABASE_URL")
+        if not db_url:
+            sys.exit("A variável de ambiente DATABASE_URL não foi definida.")
+        como_decimal, _ = cronometrar(ler_do_banco, db_url, args.linhas, False, repeticoes=args.repeticoes)
+        como_float, _ = cronometrar(ler_do_banco, db_url, args.linhas, True, repeticoes=args.repeticoes)
+        print(f"\nLeitura de {args.linhas} linhas do PostgreSQL (consulta + conversão):")
+        print(f"  NUMERIC como Decimal: {1000 * como_decimal:9.1f} ms")
+        print(f"  NUMERIC como float:   {1000 * como_float:9.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
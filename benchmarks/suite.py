@@ -0,0 +1,175 @@
+"""
+Executa a suíte completa de desempenho contra um PostgreSQL local:
+
+1. gera CSVs sintéticos na escala pedida (gerar_csvs.py);
+2. cronometra o importador (dados/gera-db-postgres.py --recriar) de ponta
+   a ponta, em cada modo pedido;
+3. sobe a API com gunicorn (ou usa --url) e mede todas as rotas com
+   carga_api.py;
+4. grava um JSON com o commit, a escala e todas as medidas, para comparar
+   com comparar.py.
+
+ATENÇÃO: o banco apontado por DATABASE_URL é apagado e recriado. Use um
+banco descartável.
+
+    DATABASE_URL=postgresql://... python benchmarks/suite.py --avaliacoes 1000000 \\
+        --saida benchmarks/resultados/suite.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import platform
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+import psycopg2
+
+from gerar_csvs import gerar_csvs, escala_padrao
+from carga_api import executar_carga
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def commit_atual():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=RAIZ, capture_output=True, text=True, check=True)
+        return commit.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def contar_linhas(db_url):
+    conn = psycopg2.connect(db_url)
+    with conn.cursor() as cur:
+        contagens = {}
+        for tabela in ('filmes', 'usuarios', 'avaliacoes'):
+            cur.execute(f"SELECT count(*) FROM {tabela};")
+            contagens[tabela] = cur.fetchone()[0]
+        cur.execute("SHOW server_version;")
+        versao = cur.fetchone()[0]
+    conn.close()
+    return contagens, versao
+
+
+def medir_importador(diretorio_csvs, modo):
+    """Roda o importador como o contêiner roda (no diretório dos CSVs) e mede o tempo total."""
+    script = os.path.join(RAIZ, 'dados', 'gera-db-postgres.py')
+    inicio = time.perf_counter()
+    processo = subprocess.run(
+        [sys.executable, script, '--recriar', '--modo', modo],
+        cwd=diretorio_csvs, capture_output=True, text=True,
+    )
+    duracao = time.perf_counter() - inicio
+    # O importador registra os erros na saída em vez de terminar com código de erro
+    if processo.returncode != 0 or '❌' in processo.stdout:
+        print(processo.stdout[-3000:], processo.stderr[-3000:])
+        raise RuntimeError(f"O importador falhou no modo '{modo}'.")
+    return duracao
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def iniciar_api(workers, ambiente_extra):
+    porta = porta_livre()
+    ambiente = dict(os.environ, **ambiente_extra)
+    processo = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--threads', '1',
+         '--bind', f'127.0.0.1:{porta}', '--chdir', os.path.join(RAIZ, 'api'), 'api:app'],
+        env=ambiente, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f'http://127.0.0.1:{porta}'
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        try:
+            with urllib.request.urlopen(url + '/api/health', timeout=1):
+                return processo, url
+        except OSError:
+            if processo.poll() is not None:
+                break
+            time.sleep(0.2)
+    processo.terminate()
+    raise RuntimeError("A API não respondeu em /api/health.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--avaliacoes', type=int, default=100000, help="De 10 mil a 50 milhões.")
+    parser.add_argument('--filmes', type=int)
+    parser.add_argument('--usuarios', type=int)
+    parser.add_argument('--csvs', help="Diretório com CSVs já gerados (pula a geração).")
+    parser.add_argument('--modos', nargs='+', choices=['linhas', 'copy', 'paralelo'], default=['copy'],
+                        help="Modos do importador a cronometrar; o último deixa o banco carregado para a carga.")
+    parser.add_argument('--url', help="API já em execução; sem isto, a suíte sobe uma com gunicorn.")
+    parser.add_argument('--workers', type=int, default=2, help="Workers do gunicorn.")
+    parser.add_argument('--sem-cache', action='store_true', help="Sobe a API com CACHE_HABILITADO=0.")
+    parser.add_argument('--concorrencia', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--requisicoes', type=int, default=200)
+    parser.add_argument('--rotas', nargs='+', help="Mede apenas as rotas cujo nome contém um destes trechos.")
+    parser.add_argument('--saida', required=True, help="Arquivo JSON onde gravar os resultados.")
+    args = parser.parse_args()
+
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        sys.exit("A variável de ambiente DATABASE_URL não foi definida.")
+
+    filmes, usuarios = escala_padrao(args.avaliacoes, args.filmes, args.usuarios)
+    resultados = {
+        'commit': commit_atual(),
+        'data': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'maquina': {'cpus': os.cpu_count(), 'sistema': platform.platform()},
+        'escala': {'filmes': filmes, 'usuarios': usuarios, 'avaliacoes': args.avaliacoes},
+        'api': {'workers': args.workers, 'cache': not args.sem_cache} if not args.url else {'url': args.url},
+    }
+
+    diretorio = args.csvs or tempfile.mkdtemp(prefix='movieflix-csvs-')
+    try:
+        if not args.csvs:
+            print(f"Gerando {filmes} filmes, {usuarios} usuários e {args.avaliacoes} avaliações...")
+            resultados['geracao_csvs_s'] = round(gerar_csvs(diretorio, filmes, usuarios, args.avaliacoes), 3)
+
+        resultados['importador'] = {}
+        for modo in args.modos:
+            print(f"Cronometrando o importador no modo '{modo}'...")
+            duracao = medir_importador(diretorio, modo)
+            contagens, versao = contar_linhas(db_url)
+            resultados['importador'][modo] = {
+                'duracao_s': round(duracao, 3),
+                'avaliacoes_por_s': round(contagens['avaliacoes'] / duracao, 1),
+                'linhas': contagens,
+            }
+            resultados['postgres'] = versao
+            print(f"✅ {duracao:.1f}s ({contagens['avaliacoes'] / duracao:,.0f} avaliações/s)")
+    finally:
+        if not args.csvs:
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+    processo = None
+    url = args.url
+    if not url:
+        processo, url = iniciar_api(args.workers, {'CACHE_HABILITADO': '0' if args.sem_cache else '1'})
+    try:
+        resultados['carga'] = executar_carga(url.rstrip('/'), db_url, args.concorrencia, args.requisicoes, args.rotas)
+    finally:
+        if processo:
+            processo.terminate()
+            processo.wait(10)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.saida)), exist_ok=True)
+    with open(args.saida, 'w', encoding='utf-8') as f:
+        json.dump(resultados, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados gravados em {args.saida}.")
+
+
+if __name__ == '__main__':
+    main()
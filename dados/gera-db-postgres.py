@@ -1,6 +1,14 @@
+import io
 import os
+import csv
+import time
+import signal
+import argparse
+import datetime
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 import pandas as pd
 import psycopg2
+from psycopg2 import sql
 
 def get_db_connection():
     """
@@ -18,10 +26,11 @@ def get_db_connection():
         print(f"❌ ERRO CRÍTICO ao conectar ao banco de dados: {e}")
         return None
 
-def criar_esquema(conn):
+def criar_esquema(conn, ate_versao=None):
     """
-    Deleta e recria as tabelas e views para garantir um estado limpo
-    e espelhar a estrutura do script original.
+    Apaga todas as tabelas e views e recria o esquema do zero, aplicando
+    todas as migrações. Usado por --recriar e pelos benchmarks; os dados
+    existentes são perdidos.
     """
     print("\nIniciando a reconstrução completa do esquema do banco de dados...")
     try:
@@ -31,113 +40,876 @@ def criar_esquema(conn):
             cur.execute("DROP VIEW IF EXISTS notas_medias_por_genero_por_idade;")
             cur.execute("DROP VIEW IF EXISTS notas_medias_por_filme_por_idade;")
             cur.execute("DROP VIEW IF EXISTS notas_medias_filmes;")
+            cur.execute("DROP VIEW IF EXISTS resumo_generos;")
+            cur.execute("DROP TABLE IF EXISTS resumo_filmes CASCADE;")
+            cur.execute("DROP TABLE IF EXISTS resumo_paises CASCADE;")
+            cur.execute("DROP TABLE IF EXISTS resumo_filmes_faixas CASCADE;")
             cur.execute("DROP TABLE IF EXISTS avaliacoes CASCADE;")
             cur.execute("DROP TABLE IF EXISTS usuarios CASCADE;")
             cur.execute("DROP TABLE IF EXISTS filmes CASCADE;")
+            cur.execute("DROP TABLE IF EXISTS fila_confirmacoes;")
+            cur.execute("DROP TABLE IF EXISTS versoes_tabelas;")
+            cur.execute("DROP TABLE IF EXISTS importacao_lotes;")
+            cur.execute("DROP TABLE IF EXISTS importacao_arquivos;")
+            cur.execute("DROP TABLE IF EXISTS schema_migracoes;")
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ ERRO ao recriar o esquema: {e}")
+        raise
 
-            # --- Criação das Tabelas (idêntica ao original) ---
-            print("Criando novas tabelas...")
-            cur.execute("""
-                CREATE TABLE usuarios (
-                    id SERIAL PRIMARY KEY,
-                    nome_de_usuario VARCHAR(255) UNIQUE,
-                    nome VARCHAR(255),
-                    senha VARCHAR(255),
-                    pais VARCHAR(255),
-                    data_de_nascimento DATE
-                );
-            """)
-            cur.execute("""
-                CREATE TABLE filmes (
-                    id SERIAL PRIMARY KEY,
-                    titulo VARCHAR(255) UNIQUE,
-                    genero VARCHAR(255),
-                    ano INT
-                );
-            """)
-            cur.execute("""
-                CREATE TABLE avaliacoes (
-                    id SERIAL PRIMARY KEY,
-                    usuario_id INT REFERENCES usuarios(id) ON DELETE CASCADE,
-                    filme_id INT REFERENCES filmes(id) ON DELETE CASCADE,
-                    nota DECIMAL(3, 1)
+    aplicar_migracoes(conn, ate_versao)
+    print("🎉 Esquema do banco de dados reconstruído com sucesso.")
+
+def criar_tabelas_originais(cur):
+    """
+    Tabelas e view do script original. Usa IF NOT EXISTS para que um banco
+    criado antes das migrações seja adotado sem perder os dados.
+    """
+    print("Criando tabelas...")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id SERIAL PRIMARY KEY,
+            nome_de_usuario VARCHAR(255) UNIQUE,
+            nome VARCHAR(255),
+            senha VARCHAR(255),
+            pais VARCHAR(255),
+            data_de_nascimento DATE
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS filmes (
+            id SERIAL PRIMARY KEY,
+            titulo VARCHAR(255) UNIQUE,
+            genero VARCHAR(255),
+            ano INT
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS avaliacoes (
+            id SERIAL PRIMARY KEY,
+            usuario_id INT REFERENCES usuarios(id) ON DELETE CASCADE,
+            filme_id INT REFERENCES filmes(id) ON DELETE CASCADE,
+            nota DECIMAL(3, 1)
+        );
+    """)
+    # Último item de cada fila local da API já gravado em 'avaliacoes'
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS fila_confirmacoes (
+            nome TEXT PRIMARY KEY,
+            ultimo_id BIGINT NOT NULL
+        );
+    """)
+    cur.execute("""
+        CREATE OR REPLACE VIEW notas_medias_filmes AS
+        SELECT fi.*, ROUND(AVG(av.nota), 1) as nota_media
+        FROM filmes as fi
+        JOIN avaliacoes as av ON fi.id = av.filme_id
+        GROUP BY fi.id;
+    """)
+    print("✅ Tabelas criadas com a estrutura original.")
+
+# Corpo das funções de gatilho que mantêm os resumos. '{delta}' é trocado por
+# uma consulta que devolve (usuario_id, filme_id, nota, sinal) a partir das
+# tabelas de transição do comando que disparou o gatilho.
+_FUNCAO_RESUMOS = """
+    CREATE OR REPLACE FUNCTION {nome}() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        -- As linhas são agrupadas e ordenadas pela chave para que transações
+        -- concorrentes travem os resumos sempre na mesma ordem.
+        -- Filmes apagados em cascata já perderam suas linhas de resumo.
+        INSERT INTO resumo_filmes AS r (filme_id, quantidade_avaliacoes, quantidade_notas, soma_notas)
+        SELECT filme_id, SUM(sinal), COALESCE(SUM(sinal) FILTER (WHERE nota IS NOT NULL), 0), COALESCE(SUM(sinal * nota), 0)
+        FROM ({delta}) AS delta
+        WHERE filme_id IN (SELECT id FROM filmes)
+        GROUP BY filme_id
+        ORDER BY filme_id
+        ON CONFLICT (filme_id) DO UPDATE SET
+            quantidade_avaliacoes = r.quantidade_avaliacoes + EXCLUDED.quantidade_avaliacoes,
+            quantidade_notas = r.quantidade_notas + EXCLUDED.quantidade_notas,
+            soma_notas = r.soma_notas + EXCLUDED.soma_notas;
+
+        INSERT INTO resumo_paises AS r (pais, quantidade_avaliacoes)
+        SELECT u.pais, SUM(delta.sinal)
+        FROM ({delta}) AS delta
+        JOIN usuarios AS u ON u.id = delta.usuario_id
+        GROUP BY u.pais
+        ORDER BY u.pais
+        ON CONFLICT ((COALESCE(pais, ''))) DO UPDATE SET
+            quantidade_avaliacoes = r.quantidade_avaliacoes + EXCLUDED.quantidade_avaliacoes;
+
+        INSERT INTO resumo_filmes_faixas AS r (filme_id, faixa_etaria, quantidade_notas, soma_notas)
+        SELECT delta.filme_id, COALESCE(u.faixa_etaria, 'sem_usuario'), SUM(delta.sinal), SUM(delta.sinal * delta.nota)
+        FROM ({delta}) AS delta
+        LEFT JOIN usuarios AS u ON u.id = delta.usuario_id
+        WHERE delta.filme_id IN (SELECT id FROM filmes) AND delta.nota IS NOT NULL
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (filme_id, faixa_etaria) DO UPDATE SET
+            quantidade_notas = r.quantidade_notas + EXCLUDED.quantidade_notas,
+            soma_notas = r.soma_notas + EXCLUDED.soma_notas;
+
+        RETURN NULL;
+    END;
+    $$;
+"""
+
+def criar_resumos(cur):
+    """
+    Cria a camada de resumos usada pelos relatórios da API:
+
+    - resumo_filmes: quantidade de avaliações, quantidade de notas e soma
+      das notas de cada filme;
+    - resumo_generos: view que agrega resumo_filmes por gênero (lê uma
+      linha por filme, nunca a tabela de avaliações);
+    - resumo_paises: quantidade de avaliações por país do usuário.
+
+    Gatilhos por comando (FOR EACH STATEMENT) em 'avaliacoes' aplicam o
+    delta de cada INSERT, UPDATE ou DELETE, de modo que um INSERT com
+    milhares de linhas atualiza os resumos uma única vez. Mudanças que não
+    passam por 'avaliacoes' (apagar usuários em cascata) exigem
+    reconstruir_resumos(); a troca do país de um usuário é tratada pelo
+    gatilho da migração 8.
+    """
+    print("Criando tabelas de resumo para os relatórios...")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS resumo_filmes (
+            filme_id INT PRIMARY KEY REFERENCES filmes(id) ON DELETE CASCADE,
+            quantidade_avaliacoes BIGINT NOT NULL DEFAULT 0,
+            quantidade_notas BIGINT NOT NULL DEFAULT 0,
+            soma_notas NUMERIC NOT NULL DEFAULT 0
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS resumo_filmes_quantidade_idx ON resumo_filmes (quantidade_avaliacoes DESC, filme_id);")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS resumo_paises (
+            pais VARCHAR(255),
+            quantidade_avaliacoes BIGINT NOT NULL DEFAULT 0
+        );
+    """)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS resumo_paises_pais_idx ON resumo_paises ((COALESCE(pais, '')));")
+    cur.execute("""
+        CREATE OR REPLACE VIEW resumo_generos AS
+        SELECT f.genero, SUM(r.quantidade_notas) AS quantidade_notas, SUM(r.soma_notas) AS soma_notas
+        FROM resumo_filmes AS r
+        JOIN filmes AS f ON f.id = r.filme_id
+        WHERE r.quantidade_notas > 0
+        GROUP BY f.genero;
+    """)
+
+    cur.execute(_FUNCAO_RESUMOS.format(
+        nome='resumos_apos_inserir',
+        delta="SELECT usuario_id, filme_id, nota, 1 AS sinal FROM novas",
+    ))
+    cur.execute(_FUNCAO_RESUMOS.format(
+        nome='resumos_apos_apagar',
+        delta="SELECT usuario_id, filme_id, nota, -1 AS sinal FROM antigas",
+    ))
+    cur.execute(_FUNCAO_RESUMOS.format(
+        nome='resumos_apos_atualizar',
+        delta="SELECT usuario_id, filme_id, nota, 1 AS sinal FROM novas "
+              "UNION ALL SELECT usuario_id, filme_id, nota, -1 AS sinal FROM antigas",
+    ))
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION resumos_apos_truncar() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            DELETE FROM resumo_filmes;
+            DELETE FROM resumo_paises;
+            DELETE FROM resumo_filmes_faixas;
+            RETURN NULL;
+        END;
+        $$;
+    """)
+    cur.execute("""
+        CREATE OR REPLACE TRIGGER avaliacoes_resumos_inserir AFTER INSERT ON avaliacoes
+        REFERENCING NEW TABLE AS novas
+        FOR EACH STATEMENT EXECUTE FUNCTION resumos_apos_inserir();
+    """)
+    cur.execute("""
+        CREATE OR REPLACE TRIGGER avaliacoes_resumos_apagar AFTER DELETE ON avaliacoes
+        REFERENCING OLD TABLE AS antigas
+        FOR EACH STATEMENT EXECUTE FUNCTION resumos_apos_apagar();
+    """)
+    cur.execute("""
+        CREATE OR REPLACE TRIGGER avaliacoes_resumos_atualizar AFTER UPDATE ON avaliacoes
+        REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+        FOR EACH STATEMENT EXECUTE FUNCTION resumos_apos_atualizar();
+    """)
+    cur.execute("""
+        CREATE OR REPLACE TRIGGER avaliacoes_resumos_truncar AFTER TRUNCATE ON avaliacoes
+        FOR EACH STATEMENT EXECUTE FUNCTION resumos_apos_truncar();
+    """)
+
+    # Reconstrução completa, para recuperação: SELECT reconstruir_resumos();
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION reconstruir_resumos() RETURNS void
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            -- Impede escritas em 'avaliacoes' enquanto os resumos são refeitos
+            LOCK TABLE avaliacoes IN SHARE MODE;
+            DELETE FROM resumo_filmes;
+            DELETE FROM resumo_paises;
+
+            INSERT INTO resumo_filmes (filme_id, quantidade_avaliacoes, quantidade_notas, soma_notas)
+            SELECT filme_id, COUNT(*), COUNT(nota), COALESCE(SUM(nota), 0)
+            FROM avaliacoes
+            WHERE filme_id IS NOT NULL
+            GROUP BY filme_id;
+
+            INSERT INTO resumo_paises (pais, quantidade_avaliacoes)
+            SELECT u.pais, COUNT(*)
+            FROM avaliacoes AS a
+            JOIN usuarios AS u ON u.id = a.usuario_id
+            GROUP BY u.pais;
+
+            -- Recalcula a faixa etária de todos os usuários antes de agregar
+            UPDATE usuarios SET data_de_nascimento = data_de_nascimento;
+            DELETE FROM resumo_filmes_faixas;
+            INSERT INTO resumo_filmes_faixas (filme_id, faixa_etaria, quantidade_notas, soma_notas)
+            SELECT a.filme_id, COALESCE(u.faixa_etaria, 'sem_usuario'), COUNT(*), SUM(a.nota)
+            FROM avaliacoes AS a
+            LEFT JOIN usuarios AS u ON u.id = a.usuario_id
+            WHERE a.filme_id IS NOT NULL AND a.nota IS NOT NULL
+            GROUP BY 1, 2;
+        END;
+        $$;
+    """)
+    print("✅ Resumos e gatilhos criados.")
+
+def criar_faixas_etarias(cur):
+    """
+    Guarda a faixa etária de cada usuário na própria tabela 'usuarios' e
+    mantém as médias por filme e faixa em 'resumo_filmes_faixas'.
+
+    A faixa só muda quando o usuário faz aniversário em um limite de faixa
+    (13, 18, 30 ou 50 anos). Essa data fica em 'faixa_valida_ate', indexada,
+    e atualizar_faixas_etarias() recalcula apenas os usuários vencidos,
+    movendo as notas deles para a nova faixa. As views de notas médias por
+    idade passam a ler o resumo em vez de calcular a idade de cada avaliação.
+    """
+    print("Criando faixas etárias pré-calculadas...")
+    cur.execute("""
+        ALTER TABLE usuarios
+            ADD COLUMN IF NOT EXISTS faixa_etaria VARCHAR(20),
+            ADD COLUMN IF NOT EXISTS faixa_valida_ate DATE;
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS usuarios_faixa_valida_ate_idx ON usuarios (faixa_valida_ate);")
+    cur.execute("CREATE INDEX IF NOT EXISTS avaliacoes_usuario_id_idx ON avaliacoes (usuario_id);")
+
+    # Mesmas regras (e mesmo cálculo de idade) das views originais
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION usuarios_definir_faixa() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            idade NUMERIC := EXTRACT(YEAR FROM AGE(CURRENT_DATE, NEW.data_de_nascimento));
+            proximo_limite INT;
+        BEGIN
+            NEW.faixa_etaria := CASE
+                WHEN idade <= 12 THEN 'criancas'
+                WHEN idade BETWEEN 13 AND 17 THEN 'adolescentes'
+                WHEN idade BETWEEN 18 AND 29 THEN 'jovens_adultos'
+                WHEN idade BETWEEN 30 AND 49 THEN 'adultos'
+                ELSE '50_mais'
+            END;
+            proximo_limite := CASE
+                WHEN idade < 13 THEN 13
+                WHEN idade < 18 THEN 18
+                WHEN idade < 30 THEN 30
+                WHEN idade < 50 THEN 50
+            END;
+            IF proximo_limite IS NULL THEN
+                NEW.faixa_valida_ate := NULL;
+            ELSE
+                NEW.faixa_valida_ate := GREATEST(
+                    (NEW.data_de_nascimento + make_interval(years => proximo_limite))::date,
+                    CURRENT_DATE + 1
                 );
-            """)
-            print("✅ Tabelas criadas com a estrutura original.")
-
-            # --- Criação das Views (idêntica ao original) ---
-            print("Criando novas views...")
-            cur.execute("""
-                CREATE OR REPLACE VIEW notas_medias_filmes AS
-                SELECT fi.*, ROUND(AVG(av.nota), 1) as nota_media
-                FROM filmes as fi
-                JOIN avaliacoes as av ON fi.id = av.filme_id
-                GROUP BY fi.id;
-            """)
-            cur.execute("""
-                CREATE OR REPLACE VIEW notas_medias_por_filme_por_idade AS
-                WITH avaliacoes_com_detalhes AS (
-                    SELECT
-                        fi.titulo,
-                        av.nota,
-                        CASE
-                            WHEN EXTRACT(YEAR FROM AGE(CURRENT_DATE, us.data_de_nascimento)) <= 12 THEN 'criancas'
-                            WHEN EXTRACT(YEAR FROM AGE(CURRENT_DATE, us.data_de_nascimento)) BETWEEN 13 AND 17 THEN 'adolescentes'
-                            WHEN EXTRACT(YEAR FROM AGE(CURRENT_DATE, us.data_de_nascimento)) BETWEEN 18 AND 29 THEN 'jovens_adultos'
-                            WHEN EXTRACT(YEAR FROM AGE(CURRENT_DATE, us.data_de_nascimento)) BETWEEN 30 AND 49 THEN 'adultos'
-                            ELSE '50_mais'
-                        END AS faixa_etaria
-                    FROM filmes AS fi
-                    LEFT JOIN avaliacoes AS av ON fi.id = av.filme_id
-                    LEFT JOIN usuarios AS us ON av.usuario_id = us.id
-                )
-                SELECT
-                    titulo,
-                    ROUND(AVG(CASE WHEN faixa_etaria = 'criancas' THEN nota END), 2) AS media_criancas_ate_12,
-                    ROUND(AVG(CASE WHEN faixa_etaria = 'adolescentes' THEN nota END), 2) AS media_adolescentes_13_a_17,
-                    ROUND(AVG(CASE WHEN faixa_etaria = 'jovens_adultos' THEN nota END), 2) AS media_jovens_adultos_18_a_29,
-                    ROUND(AVG(CASE WHEN faixa_etaria = 'adultos' THEN nota END), 2) AS media_adultos_30_a_49,
-                    ROUND(AVG(CASE WHEN faixa_etaria = '50_mais' THEN nota END), 2) AS media_50_mais,
-                    ROUND(AVG(nota), 2) AS media_geral
-                FROM avaliacoes_com_detalhes
-                GROUP BY titulo;
-            """)
-            cur.execute("""
-                CREATE OR REPLACE VIEW notas_medias_por_genero_por_idade AS
-                WITH avaliacoes_por_genero_e_idade AS (
-                    SELECT
-                        fi.genero,
-                        av.nota,
-                        CASE
-                            WHEN EXTRACT(YEAR FROM AGE(CURRENT_DATE, us.data_de_nascimento)) <= 12 THEN 'criancas'
-                            WHEN EXTRACT(YEAR FROM AGE(CURRENT_DATE, us.data_de_nascimento)) BETWEEN 13 AND 17 THEN 'adolescentes'
-                            WHEN EXTRACT(YEAR FROM AGE(CURRENT_DATE, us.data_de_nascimento)) BETWEEN 18 AND 29 THEN 'jovens_adultos'
-                            WHEN EXTRACT(YEAR FROM AGE(CURRENT_DATE, us.data_de_nascimento)) BETWEEN 30 AND 49 THEN 'adultos'
-                            ELSE '50_mais'
-                        END AS faixa_etaria
-                    FROM filmes AS fi
-                    LEFT JOIN avaliacoes AS av ON fi.id = av.filme_id
-                    LEFT JOIN usuarios AS us ON av.usuario_id = us.id
-                    WHERE us.id IS NOT NULL
-                )
-                SELECT
-                    genero,
-                    ROUND(AVG(CASE WHEN faixa_etaria = 'criancas' THEN nota END), 2) AS media_criancas_ate_12,
-                    ROUND(AVG(CASE WHEN faixa_etaria = 'adolescentes' THEN nota END), 2) AS media_adolescentes_13_a_17,
-                    ROUND(AVG(CASE WHEN faixa_etaria = 'jovens_adultos' THEN nota END), 2) AS media_jovens_adultos_18_a_29,
-                    ROUND(AVG(CASE WHEN faixa_etaria = 'adultos' THEN nota END), 2) AS media_adultos_30_a_49,
-                    ROUND(AVG(CASE WHEN faixa_etaria = '50_mais' THEN nota END), 2) AS media_50_mais,
-                    ROUND(AVG(nota), 2) AS media_geral_por_genero
-                FROM avaliacoes_por_genero_e_idade
-                GROUP BY genero;
-            """)
-            print("✅ Views recriadas com sucesso.")
+            END IF;
+            RETURN NEW;
+        END;
+        $$;
+    """)
+    cur.execute("""
+        CREATE OR REPLACE TRIGGER usuarios_faixa_etaria BEFORE INSERT OR UPDATE OF data_de_nascimento ON usuarios
+        FOR EACH ROW EXECUTE FUNCTION usuarios_definir_faixa();
+    """)
+
+    # Calcula a faixa dos usuários que já existiam antes desta migração
+    cur.execute("UPDATE usuarios SET data_de_nascimento = data_de_nascimento WHERE faixa_etaria IS NULL;")
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS resumo_filmes_faixas (
+            filme_id INT REFERENCES filmes(id) ON DELETE CASCADE,
+            faixa_etaria VARCHAR(20),
+            quantidade_notas BIGINT NOT NULL DEFAULT 0,
+            soma_notas NUMERIC NOT NULL DEFAULT 0,
+            PRIMARY KEY (filme_id, faixa_etaria)
+        );
+    """)
+
+    # Quando a faixa de um usuário muda, as notas dele trocam de faixa
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION usuarios_mover_faixa() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO resumo_filmes_faixas AS r (filme_id, faixa_etaria, quantidade_notas, soma_notas)
+            SELECT filme_id, faixa_etaria, SUM(sinal), SUM(sinal * nota)
+            FROM (
+                SELECT filme_id, OLD.faixa_etaria AS faixa_etaria, -1 AS sinal, nota
+                FROM avaliacoes WHERE usuario_id = NEW.id
+                UNION ALL
+                SELECT filme_id, NEW.faixa_etaria, 1, nota
+                FROM avaliacoes WHERE usuario_id = NEW.id
+            ) AS delta
+            WHERE filme_id IS NOT NULL AND nota IS NOT NULL
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+            ON CONFLICT (filme_id, faixa_etaria) DO UPDATE SET
+                quantidade_notas = r.quantidade_notas + EXCLUDED.quantidade_notas,
+                soma_notas = r.soma_notas + EXCLUDED.soma_notas;
+            RETURN NULL;
+        END;
+        $$;
+    """)
+    cur.execute("""
+        CREATE OR REPLACE TRIGGER usuarios_mover_faixa AFTER UPDATE ON usuarios
+        FOR EACH ROW WHEN (OLD.faixa_etaria IS DISTINCT FROM NEW.faixa_etaria)
+        EXECUTE FUNCTION usuarios_mover_faixa();
+    """)
+
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION atualizar_faixas_etarias() RETURNS integer
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            atualizados INTEGER;
+        BEGIN
+            UPDATE usuarios SET data_de_nascimento = data_de_nascimento
+            WHERE faixa_valida_ate <= CURRENT_DATE;
+            GET DIAGNOSTICS atualizados = ROW_COUNT;
+            RETURN atualizados;
+        END;
+        $$;
+    """)
 
+    # Avaliações sem usuário entram em '50_mais' por filme (como no LEFT JOIN
+    # original) e ficam fora da média por gênero.
+    cur.execute("""
+        CREATE OR REPLACE VIEW notas_medias_por_filme_por_idade AS
+        SELECT
+            f.titulo,
+            ROUND(SUM(r.soma_notas) FILTER (WHERE r.faixa_etaria = 'criancas')
+                / NULLIF(SUM(r.quantidade_notas) FILTER (WHERE r.faixa_etaria = 'criancas'), 0), 2) AS media_criancas_ate_12,
+            ROUND(SUM(r.soma_notas) FILTER (WHERE r.faixa_etaria = 'adolescentes')
+                / NULLIF(SUM(r.quantidade_notas) FILTER (WHERE r.faixa_etaria = 'adolescentes'), 0), 2) AS media_adolescentes_13_a_17,
+            ROUND(SUM(r.soma_notas) FILTER (WHERE r.faixa_etaria = 'jovens_adultos')
+                / NULLIF(SUM(r.quantidade_notas) FILTER (WHERE r.faixa_etaria = 'jovens_adultos'), 0), 2) AS media_jovens_adultos_18_a_29,
+            ROUND(SUM(r.soma_notas) FILTER (WHERE r.faixa_etaria = 'adultos')
+                / NULLIF(SUM(r.quantidade_notas) FILTER (WHERE r.faixa_etaria = 'adultos'), 0), 2) AS media_adultos_30_a_49,
+            ROUND(SUM(r.soma_notas) FILTER (WHERE r.faixa_etaria IN ('50_mais', 'sem_usuario'))
+                / NULLIF(SUM(r.quantidade_notas) FILTER (WHERE r.faixa_etaria IN ('50_mais', 'sem_usuario')), 0), 2) AS media_50_mais,
+            ROUND(SUM(r.soma_notas) / NULLIF(SUM(r.quantidade_notas), 0), 2) AS media_geral
+        FROM filmes AS f
+        LEFT JOIN resumo_filmes_faixas AS r ON r.filme_id = f.id
+        GROUP BY f.titulo;
+    """)
+    cur.execute("""
+        CREATE OR REPLACE VIEW notas_medias_por_genero_por_idade AS
+        WITH por_genero AS (
+            SELECT f.genero, r.faixa_etaria, SUM(r.quantidade_notas) AS quantidade_notas, SUM(r.soma_notas) AS soma_notas
+            FROM resumo_filmes_faixas AS r
+            JOIN filmes AS f ON f.id = r.filme_id
+            WHERE r.faixa_etaria <> 'sem_usuario'
+            GROUP BY f.genero, r.faixa_etaria
+        )
+        SELECT
+            genero,
+            ROUND(SUM(soma_notas) FILTER (WHERE faixa_etaria = 'criancas')
+                / NULLIF(SUM(quantidade_notas) FILTER (WHERE faixa_etaria = 'criancas'), 0), 2) AS media_criancas_ate_12,
+            ROUND(SUM(soma_notas) FILTER (WHERE faixa_etaria = 'adolescentes')
+                / NULLIF(SUM(quantidade_notas) FILTER (WHERE faixa_etaria = 'adolescentes'), 0), 2) AS media_adolescentes_13_a_17,
+            ROUND(SUM(soma_notas) FILTER (WHERE faixa_etaria = 'jovens_adultos')
+                / NULLIF(SUM(quantidade_notas) FILTER (WHERE faixa_etaria = 'jovens_adultos'), 0), 2) AS media_jovens_adultos_18_a_29,
+            ROUND(SUM(soma_notas) FILTER (WHERE faixa_etaria = 'adultos')
+                / NULLIF(SUM(quantidade_notas) FILTER (WHERE faixa_etaria = 'adultos'), 0), 2) AS media_adultos_30_a_49,
+            ROUND(SUM(soma_notas) FILTER (WHERE faixa_etaria = '50_mais')
+                / NULLIF(SUM(quantidade_notas) FILTER (WHERE faixa_etaria = '50_mais'), 0), 2) AS media_50_mais,
+            ROUND(SUM(soma_notas) / NULLIF(SUM(quantidade_notas), 0), 2) AS media_geral_por_genero
+        FROM por_genero
+        GROUP BY genero;
+    """)
+    print("✅ Faixas etárias e views por idade criadas.")
+
+def criar_indices_de_busca(cur):
+    """
+    Cria índices de trigramas (pg_trgm) para as buscas por substring de
+    /api/filmes/buscar e /api/usuarios/buscar, que usam ILIKE '%termo%'.
+    Um segundo índice sobre texto_busca(), que remove acentos e passa para
+    minúsculas, atende o modo de busca sem acentos ('Chefao' acha 'Chefão').
+    """
+    print("Criando índices de busca por trigramas...")
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    cur.execute("CREATE EXTENSION IF NOT EXISTS unaccent;")
+    # unaccent() não é IMMUTABLE; fixar o dicionário permite usá-la em índices
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION texto_busca(texto TEXT) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS $$
+            SELECT lower(public.unaccent('public.unaccent'::regdictionary, texto));
+        $$;
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS filmes_titulo_trgm_idx ON filmes USING gin (titulo gin_trgm_ops);")
+    cur.execute("CREATE INDEX IF NOT EXISTS filmes_titulo_busca_trgm_idx ON filmes USING gin (texto_busca(titulo) gin_trgm_ops);")
+    cur.execute("CREATE INDEX IF NOT EXISTS usuarios_nome_de_usuario_trgm_idx ON usuarios USING gin (nome_de_usuario gin_trgm_ops);")
+    cur.execute("CREATE INDEX IF NOT EXISTS usuarios_nome_de_usuario_busca_trgm_idx ON usuarios USING gin (texto_busca(nome_de_usuario) gin_trgm_ops);")
+    print("✅ Índices de busca criados.")
+
+def criar_indices_de_relatorios(cur):
+    """
+    Índices para as junções e agrupamentos sobre as tabelas base:
+
+    - avaliacoes (filme_id) e (usuario_id), com 'nota' incluída, atendem o
+      ON DELETE CASCADE de filmes e usuários (sem eles, apagar um filme lê
+      a tabela de avaliações inteira), a view notas_medias_filmes, a troca
+      de faixa etária de um usuário e reconstruir_resumos() apenas com
+      leituras de índice;
+    - filmes (genero) e usuarios (pais) atendem os agrupamentos por gênero
+      e por país.
+
+    Também restringe as notas ao intervalo aceito pela API (0 a 10).
+
+    Como toda migração, roda em uma única transação: os CREATE INDEX e o
+    ALTER TABLE bloqueiam as escritas em 'avaliacoes' (e nas demais tabelas
+    indexadas) até o commit, então em um banco grande deve ser aplicada
+    fora do horário de uso.
+    """
+    print("Criando índices das junções dos relatórios...")
+    cur.execute("CREATE INDEX IF NOT EXISTS avaliacoes_filme_id_idx ON avaliacoes (filme_id) INCLUDE (nota);")
+    # Substitui o índice simples criado junto com as faixas etárias
+    cur.execute("CREATE INDEX IF NOT EXISTS avaliacoes_usuario_id_filme_nota_idx ON avaliacoes (usuario_id) INCLUDE (filme_id, nota);")
+    cur.execute("DROP INDEX IF EXISTS avaliacoes_usuario_id_idx;")
+    cur.execute("CREATE INDEX IF NOT EXISTS filmes_genero_idx ON filmes (genero) INCLUDE (id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS usuarios_pais_idx ON usuarios (pais) INCLUDE (id);")
+
+    # Na mesma transação, NOT VALID + VALIDATE equivale a um ADD CONSTRAINT
+    # direto: o bloqueio do ALTER TABLE dura até o commit da migração
+    cur.execute("""
+        ALTER TABLE avaliacoes
+            ADD CONSTRAINT avaliacoes_nota_intervalo CHECK (nota BETWEEN 0 AND 10) NOT VALID;
+    """)
+    cur.execute("ALTER TABLE avaliacoes VALIDATE CONSTRAINT avaliacoes_nota_intervalo;")
+    cur.execute("ANALYZE avaliacoes, filmes, usuarios;")
+    print("✅ Índices e restrições criados.")
+
+def criar_versoes_tabelas(cur):
+    """
+    Contador de alterações por tabela, lido pela API para montar as ETags e
+    as chaves do cache de respostas. Gatilhos por comando (e não por linha)
+    incrementam a versão de filmes, usuarios e avaliacoes a cada INSERT,
+    UPDATE, DELETE ou TRUNCATE; a versão nova fica visível no mesmo commit
+    que os dados.
+    """
+    print("Criando o contador de versões das tabelas...")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS versoes_tabelas (
+            tabela TEXT PRIMARY KEY,
+            versao BIGINT NOT NULL DEFAULT 0
+        );
+    """)
+    cur.execute("""
+        INSERT INTO versoes_tabelas (tabela)
+        VALUES ('filmes'), ('usuarios'), ('avaliacoes')
+        ON CONFLICT (tabela) DO NOTHING;
+    """)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION incrementar_versao_tabela() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE versoes_tabelas SET versao = versao + 1 WHERE tabela = TG_TABLE_NAME;
+            RETURN NULL;
+        END;
+        $$;
+    """)
+    for tabela in ('filmes', 'usuarios', 'avaliacoes'):
+        cur.execute(sql.SQL("""
+            CREATE OR REPLACE TRIGGER {} AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {}
+            FOR EACH STATEMENT EXECUTE FUNCTION incrementar_versao_tabela();
+        """).format(sql.Identifier(f"{tabela}_versao"), sql.Identifier(tabela)))
+
+    # Gatilhos por comando disparam mesmo quando o UPDATE não altera nenhuma
+    # linha; sem usuários vencidos, a função não executa o UPDATE, para não
+    # mudar a versão de 'usuarios' (e as ETags) a cada consulta ao relatório.
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION atualizar_faixas_etarias() RETURNS integer
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            atualizados INTEGER;
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM usuarios WHERE faixa_valida_ate <= CURRENT_DATE) THEN
+                RETURN 0;
+            END IF;
+            UPDATE usuarios SET data_de_nascimento = data_de_nascimento
+            WHERE faixa_valida_ate <= CURRENT_DATE;
+            GET DIAGNOSTICS atualizados = ROW_COUNT;
+            RETURN atualizados;
+        END;
+        $$;
+    """)
+    print("✅ Versões das tabelas criadas.")
+
+def criar_controle_importacao(cur):
+    """
+    Registro das importações em lotes (--modo paralelo). 'importacao_arquivos'
+    guarda, por arquivo, o tamanho dos lotes e uma assinatura do arquivo;
+    cada lote gravado ganha uma linha em 'importacao_lotes' na mesma
+    transação que as suas avaliações, então uma importação interrompida pode
+    ser retomada exatamente a partir dos lotes que faltam.
+    """
+    print("Criando o registro das importações em lotes...")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS importacao_arquivos (
+            arquivo TEXT PRIMARY KEY,
+            assinatura TEXT NOT NULL,
+            tamanho_lote INT NOT NULL,
+            iniciada_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+            concluida_em TIMESTAMPTZ
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS importacao_lotes (
+            arquivo TEXT NOT NULL REFERENCES importacao_arquivos (arquivo) ON DELETE CASCADE,
+            lote INT NOT NULL,
+            linhas INT NOT NULL,
+            gravado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (arquivo, lote)
+        );
+    """)
+    print("✅ Registro das importações criado.")
+
+def criar_gatilho_pais(cur):
+    """
+    Mantém 'resumo_paises' quando o país de um usuário muda (por exemplo,
+    na importação incremental): as avaliações dele passam do país antigo
+    para o novo, como usuarios_mover_faixa() faz com as faixas etárias.
+    """
+    print("Criando o gatilho de troca de país...")
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION usuarios_mover_pais() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO resumo_paises AS r (pais, quantidade_avaliacoes)
+            SELECT pais, quantidade
+            FROM (
+                SELECT OLD.pais AS pais, -COUNT(*) AS quantidade
+                FROM avaliacoes WHERE usuario_id = NEW.id
+                UNION ALL
+                SELECT NEW.pais, COUNT(*)
+                FROM avaliacoes WHERE usuario_id = NEW.id
+            ) AS delta
+            WHERE quantidade <> 0
+            ORDER BY COALESCE(pais, '')
+            ON CONFLICT ((COALESCE(pais, ''))) DO UPDATE SET
+                quantidade_avaliacoes = r.quantidade_avaliacoes + EXCLUDED.quantidade_avaliacoes;
+            RETURN NULL;
+        END;
+        $$;
+    """)
+    cur.execute("""
+        CREATE OR REPLACE TRIGGER usuarios_mover_pais AFTER UPDATE OF pais ON usuarios
+        FOR EACH ROW WHEN (OLD.pais IS DISTINCT FROM NEW.pais)
+        EXECUTE FUNCTION usuarios_mover_pais();
+    """)
+    print("✅ Gatilho de troca de país criado.")
+
+def particionar_avaliacoes(cur):
+    """
+    Recria 'avaliacoes' particionada por mês da nova coluna 'criado_em'
+    (TIMESTAMPTZ, padrão now()), para que consultas por período, como
+    /api/filmes/em-alta, leiam só as partições do período.
+
+    - avaliacoes_AAAA_MM: uma partição por mês (em UTC), criada por
+      manter_particoes_avaliacoes() para o mês atual e os dois seguintes;
+    - avaliacoes_padrao: recebe avaliações de meses ainda sem partição, para
+      que nenhuma inserção falhe; manter_particoes_avaliacoes() cria as
+      partições que faltam e move essas linhas para elas;
+    - desanexar_particoes_avaliacoes(data) desanexa os meses anteriores à
+      data, que ficam como tabelas avulsas 'arquivo_avaliacoes_AAAA_MM'.
+
+    As avaliações existentes recebem a data da migração. A chave primária
+    passa a ser (id, criado_em), como o PostgreSQL exige das tabelas
+    particionadas; os ids continuam vindo da mesma sequência.
+    """
+    print("Particionando 'avaliacoes' por data de criação...")
+    # A view aponta para a tabela atual, que será trocada
+    cur.execute("DROP VIEW IF EXISTS notas_medias_filmes;")
+    cur.execute("ALTER TABLE avaliacoes RENAME TO avaliacoes_antiga;")
+    cur.execute("ALTER TABLE avaliacoes_antiga RENAME CONSTRAINT avaliacoes_pkey TO avaliacoes_antiga_pkey;")
+    cur.execute("DROP INDEX IF EXISTS avaliacoes_filme_id_idx;")
+    cur.execute("DROP INDEX IF EXISTS avaliacoes_usuario_id_filme_nota_idx;")
+    cur.execute("ALTER SEQUENCE avaliacoes_id_seq OWNED BY NONE;")
+    cur.execute("""
+        CREATE TABLE avaliacoes (
+            id INT NOT NULL DEFAULT nextval('avaliacoes_id_seq'),
+            usuario_id INT REFERENCES usuarios(id) ON DELETE CASCADE,
+            filme_id INT REFERENCES filmes(id) ON DELETE CASCADE,
+            nota DECIMAL(3, 1),
+            criado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+            CONSTRAINT avaliacoes_nota_intervalo CHECK (nota BETWEEN 0 AND 10),
+            PRIMARY KEY (id, criado_em)
+        ) PARTITION BY RANGE (criado_em);
+    """)
+    cur.execute("ALTER SEQUENCE avaliacoes_id_seq OWNED BY avaliacoes.id;")
+    cur.execute("CREATE TABLE avaliacoes_padrao PARTITION OF avaliacoes DEFAULT;")
+    # Mesmos índices da migração 5, agora em cada partição, e o do período
+    cur.execute("CREATE INDEX avaliacoes_filme_id_idx ON avaliacoes (filme_id) INCLUDE (nota);")
+    cur.execute("CREATE INDEX avaliacoes_usuario_id_filme_nota_idx ON avaliacoes (usuario_id) INCLUDE (filme_id, nota);")
+    cur.execute("CREATE INDEX avaliacoes_criado_em_idx ON avaliacoes (criado_em) INCLUDE (filme_id, nota);")
+
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION criar_particao_avaliacoes(mes DATE) RETURNS boolean
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            inicio TIMESTAMPTZ := date_trunc('month', mes)::timestamp AT TIME ZONE 'UTC';
+            fim TIMESTAMPTZ := (date_trunc('month', mes) + interval '1 month')::timestamp AT TIME ZONE 'UTC';
+            nome TEXT := 'avaliacoes_' || to_char(mes, 'YYYY_MM');
+        BEGIN
+            IF to_regclass(nome) IS NOT NULL THEN
+                RETURN false;
+            END IF;
+            EXECUTE format('CREATE TABLE %I (LIKE avaliacoes INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', nome);
+            -- Comandos direto nas partições não disparam os gatilhos de
+            -- 'avaliacoes': mover as linhas não altera resumos nem versões
+            EXECUTE format(
+                'WITH movidas AS (DELETE FROM avaliacoes_padrao WHERE criado_em >= %L AND criado_em < %L RETURNING *) '
+                'INSERT INTO %I SELECT * FROM movidas', inicio, fim, nome);
+            EXECUTE format('ALTER TABLE avaliacoes ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', nome, inicio, fim);
+            RETURN true;
+        END;
+        $$;
+    """)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION manter_particoes_avaliacoes(meses_a_frente INT DEFAULT 2) RETURNS integer
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            mes DATE;
+            criadas INTEGER := 0;
+        BEGIN
+            -- Vários workers da API e o importador podem chamar ao mesmo tempo
+            PERFORM pg_advisory_xact_lock(hashtext('particoes_avaliacoes'));
+            FOR mes IN
+                SELECT date_trunc('month', criado_em AT TIME ZONE 'UTC')::date FROM avaliacoes_padrao
+                UNION
+                SELECT (date_trunc('month', now() AT TIME ZONE 'UTC') + make_interval(months => n))::date
+                FROM generate_series(0, meses_a_frente) AS n
+                ORDER BY 1
+            LOOP
+                IF criar_particao_avaliacoes(mes) THEN
+                    criadas := criadas + 1;
+                END IF;
+            END LOOP;
+            RETURN criadas;
+        END;
+        $$;
+    """)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION desanexar_particoes_avaliacoes(antes_de DATE) RETURNS SETOF text
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            particao TEXT;
+            desanexadas INTEGER := 0;
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext('particoes_avaliacoes'));
+            FOR particao IN
+                SELECT c.relname
+                FROM pg_inherits AS i
+                JOIN pg_class AS c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'avaliacoes'::regclass
+                  AND c.relname ~ '^avaliacoes_[0-9]{4}_[0-9]{2}$'
+                  AND to_date(substr(c.relname, 12), 'YYYY_MM') + interval '1 month' <= antes_de
+                ORDER BY 1
+            LOOP
+                EXECUTE format('ALTER TABLE avaliacoes DETACH PARTITION %I', particao);
+                EXECUTE format('ALTER TABLE %I RENAME TO %I', particao, 'arquivo_' || particao);
+                desanexadas := desanexadas + 1;
+                RETURN NEXT 'arquivo_' || particao;
+            END LOOP;
+            -- Desanexar não dispara os gatilhos: os resumos são refeitos sem
+            -- as avaliações arquivadas, e a versão muda para invalidar as ETags
+            IF desanexadas > 0 THEN
+                PERFORM reconstruir_resumos();
+                UPDATE versoes_tabelas SET versao = versao + 1 WHERE tabela = 'avaliacoes';
+            END IF;
+        END;
+        $$;
+    """)
+    cur.execute("SELECT manter_particoes_avaliacoes();")
+
+    cur.execute("""
+        INSERT INTO avaliacoes (id, usuario_id, filme_id, nota)
+        SELECT id, usuario_id, filme_id, nota FROM avaliacoes_antiga ORDER BY id;
+    """)
+    cur.execute("DROP TABLE avaliacoes_antiga;")
+
+    # Gatilhos das migrações 2 e 6, criados depois da cópia: as linhas
+    # copiadas já estão nos resumos
+    cur.execute("""
+        CREATE TRIGGER avaliacoes_resumos_inserir AFTER INSERT ON avaliacoes
+        REFERENCING NEW TABLE AS novas
+        FOR EACH STATEMENT EXECUTE FUNCTION resumos_apos_inserir();
+    """)
+    cur.execute("""
+        CREATE TRIGGER avaliacoes_resumos_apagar AFTER DELETE ON avaliacoes
+        REFERENCING OLD TABLE AS antigas
+        FOR EACH STATEMENT EXECUTE FUNCTION resumos_apos_apagar();
+    """)
+    cur.execute("""
+        CREATE TRIGGER avaliacoes_resumos_atualizar AFTER UPDATE ON avaliacoes
+        REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+        FOR EACH STATEMENT EXECUTE FUNCTION resumos_apos_atualizar();
+    """)
+    cur.execute("""
+        CREATE TRIGGER avaliacoes_resumos_truncar AFTER TRUNCATE ON avaliacoes
+        FOR EACH STATEMENT EXECUTE FUNCTION resumos_apos_truncar();
+    """)
+    cur.execute("""
+        CREATE TRIGGER avaliacoes_versao AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON avaliacoes
+        FOR EACH STATEMENT EXECUTE FUNCTION incrementar_versao_tabela();
+    """)
+    cur.execute("""
+        CREATE OR REPLACE VIEW notas_medias_filmes AS
+        SELECT fi.*, ROUND(AVG(av.nota), 1) as nota_media
+        FROM filmes as fi
+        JOIN avaliacoes as av ON fi.id = av.filme_id
+        GROUP BY fi.id;
+    """)
+    cur.execute("ANALYZE avaliacoes;")
+    print("✅ 'avaliacoes' particionada por mês.")
+
+def _migracao_faixas_etarias(cur):
+    criar_faixas_etarias(cur)
+    # Preenche os resumos e as faixas a partir dos dados que já existirem
+    cur.execute("SELECT reconstruir_resumos();")
+
+# Migrações do esquema, em ordem: (versão, descrição, função que recebe o
+# cursor). Uma migração já publicada não deve ser alterada; mudanças novas
+# entram como uma nova versão no fim da lista.
+MIGRACOES = [
+    (1, "tabelas originais", criar_tabelas_originais),
+    (2, "resumos dos relatórios", criar_resumos),
+    (3, "faixas etárias pré-calculadas", _migracao_faixas_etarias),
+    (4, "índices de busca por trigramas", criar_indices_de_busca),
+    (5, "índices das junções e restrição de nota", criar_indices_de_relatorios),
+    (6, "versões das tabelas para ETags", criar_versoes_tabelas),
+    (7, "registro das importações em lotes", criar_controle_importacao),
+    (8, "resumo por país acompanha a troca de país", criar_gatilho_pais),
+    (9, "avaliacoes particionada por data de criação", particionar_avaliacoes),
+]
+
+def aplicar_migracoes(conn, ate_versao=None):
+    """
+    Aplica, em ordem, as migrações ainda não registradas em
+    'schema_migracoes', cada uma em sua própria transação. Com 'ate_versao',
+    para depois dessa versão. Devolve a lista das versões aplicadas.
+    """
+    print("\nVerificando migrações do esquema...")
+    aplicadas = []
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migracoes (
+                versao INT PRIMARY KEY,
+                descricao TEXT NOT NULL,
+                aplicada_em TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """)
         conn.commit()
-        print("🎉 Esquema do banco de dados reconstruído com sucesso, seguindo a estrutura original.")
+        # Impede que dois importadores apliquem as mesmas migrações ao mesmo tempo
+        cur.execute("SELECT pg_advisory_lock(hashtext('schema_migracoes'));")
+        try:
+            cur.execute("SELECT versao FROM schema_migracoes;")
+            ja_aplicadas = {linha[0] for linha in cur.fetchall()}
+            conn.commit()
+            for versao, descricao, migracao in MIGRACOES:
+                if versao in ja_aplicadas or (ate_versao is not None and versao > ate_versao):
+                    continue
+                print(f"Aplicando migração {versao}: {descricao}...")
+                try:
+                    migracao(cur)
+                    cur.execute(
+                        "INSERT INTO schema_migracoes (versao, descricao) VALUES (%s, %s);",
+                        (versao, descricao),
+                    )
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    print(f"❌ ERRO na migração {versao} ({descricao}): {e}")
+                    raise
+                aplicadas.append(versao)
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(hashtext('schema_migracoes'));")
+            conn.commit()
+
+    if aplicadas:
+        print(f"✅ Migrações aplicadas: {', '.join(map(str, aplicadas))}.")
+    else:
+        print("✅ Esquema já está atualizado.")
+    return aplicadas
+
+def banco_tem_dados(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM filmes) OR EXISTS (SELECT 1 FROM usuarios);")
+        tem_dados = cur.fetchone()[0]
+    conn.commit()
+    return tem_dados
+
+def reconstruir_resumos(conn):
+    """Recalcula todas as tabelas de resumo a partir de 'avaliacoes'."""
+    print("\nReconstruindo as tabelas de resumo...")
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT reconstruir_resumos();")
+        conn.commit()
+        print("✅ Resumos reconstruídos.")
     except Exception as e:
         conn.rollback()
-        print(f"❌ ERRO ao recriar o esquema: {e}")
+        print(f"❌ ERRO ao reconstruir os resumos: {e}")
+        raise
+
+def manter_particoes(conn):
+    """
+    Cria as partições mensais de 'avaliacoes' que faltam (mês atual e os
+    seguintes) e move para a partição do seu mês as avaliações que caíram
+    na partição padrão, como as importadas com datas antigas.
+    """
+    print("\nMantendo as partições de 'avaliacoes'...")
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT manter_particoes_avaliacoes();")
+            criadas = cur.fetchone()[0]
+        conn.commit()
+        print(f"✅ {criadas} partição(ões) criada(s).")
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ ERRO ao manter as partições: {e}")
+        raise
+
+def desanexar_particoes(conn, antes_de):
+    """
+    Desanexa as partições de 'avaliacoes' dos meses anteriores a 'antes_de'.
+    Elas continuam no banco como tabelas 'arquivo_avaliacoes_AAAA_MM', fora
+    da API e dos relatórios.
+    """
+    print(f"\nDesanexando as partições de 'avaliacoes' anteriores a {antes_de}...")
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT desanexar_particoes_avaliacoes(%s);", (antes_de,))
+            arquivadas = [linha[0] for linha in cur.fetchall()]
+        conn.commit()
+        for tabela in arquivadas:
+            print(f"  - {tabela}")
+        print(f"✅ {len(arquivadas)} partição(ões) desanexada(s).")
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ ERRO ao desanexar as partições: {e}")
         raise
 
 def importar_dados(conn, df_filmes, df_usuarios, df_avaliacoes):
@@ -181,11 +953,13 @@ def importar_dados(conn, df_filmes, df_usuarios, df_avaliacoes):
 
             print("Importando dados para 'avaliacoes'...")
             linhas_inseridas = 0
+            tem_data = 'criado_em' in df_avaliacoes.columns
             for index, row in df_avaliacoes.iterrows():
                 if pd.notnull(row['usuario_id']) and pd.notnull(row['filme_id']):
+                    criado_em = row['criado_em'] if tem_data and pd.notnull(row['criado_em']) else None
                     cur.execute(
-                        "INSERT INTO avaliacoes (usuario_id, filme_id, nota) VALUES (%s, %s, %s);",
-                        (int(row['usuario_id']), int(row['filme_id']), row['nota'])
+                        "INSERT INTO avaliacoes (usuario_id, filme_id, nota, criado_em) VALUES (%s, %s, %s, COALESCE(%s::timestamptz, now()));",
+                        (int(row['usuario_id']), int(row['filme_id']), row['nota'], criado_em)
                     )
                     linhas_inseridas += 1
             
@@ -202,22 +976,569 @@ def importar_dados(conn, df_filmes, df_usuarios, df_avaliacoes):
             print("Fechando conexão com o banco de dados.")
             conn.close()
 
+def _criar_tabela_staging(cur, nome, arquivo_csv):
+    """
+    Cria uma tabela temporária com uma coluna TEXT para cada coluna do CSV,
+    mais a coluna 'linha', que guarda a ordem original das linhas.
+    """
+    with open(arquivo_csv, newline='', encoding='utf-8') as f:
+        colunas = next(csv.reader(f))
+
+    cur.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(sql.Identifier(nome)))
+    cur.execute(sql.SQL("CREATE TEMP TABLE {} (linha BIGSERIAL, {});").format(
+        sql.Identifier(nome),
+        sql.SQL(', ').join(sql.SQL("{} TEXT").format(sql.Identifier(c)) for c in colunas),
+    ))
+    return colunas
+
+def _copiar_csv(cur, nome, arquivo_csv):
+    """
+    Envia o CSV inteiro para a tabela de staging com COPY FROM STDIN.
+    Devolve as colunas do arquivo.
+    """
+    colunas = _criar_tabela_staging(cur, nome, arquivo_csv)
+    comando = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, HEADER true)").format(
+        sql.Identifier(nome),
+        sql.SQL(', ').join(sql.Identifier(c) for c in colunas),
+    )
+    with open(arquivo_csv, encoding='utf-8') as f:
+        cur.copy_expert(comando.as_string(cur), f)
+    return colunas
+
+def _relatar_vazao(tabela, linhas, inicio):
+    duracao = time.perf_counter() - inicio
+    vazao = linhas / duracao if duracao > 0 else float('inf')
+    print(f"✅ {linhas} linhas em '{tabela}' em {duracao:.2f}s ({vazao:,.0f} linhas/s).")
+
+def _limpar_tabelas(cur):
+    print("Limpando dados antigos das tabelas...")
+    cur.execute("TRUNCATE TABLE avaliacoes RESTART IDENTITY;")
+    cur.execute("TRUNCATE TABLE usuarios RESTART IDENTITY CASCADE;")
+    cur.execute("TRUNCATE TABLE filmes RESTART IDENTITY CASCADE;")
+    print("✅ Tabelas limpas.")
+
+def _importar_usuarios_copy(cur, arquivo_usuarios):
+    print("Importando dados para 'usuarios'...")
+    inicio = time.perf_counter()
+    _copiar_csv(cur, 'staging_usuarios', arquivo_usuarios)
+    cur.execute("""
+        INSERT INTO usuarios (nome_de_usuario, nome, senha, pais, data_de_nascimento)
+        SELECT nome_de_usuario, nome, senha, pais, data_de_nascimento::date
+        FROM staging_usuarios
+        ORDER BY linha
+        ON CONFLICT (nome_de_usuario) DO NOTHING;
+    """)
+    _relatar_vazao('usuarios', cur.rowcount, inicio)
+    cur.execute("DROP TABLE staging_usuarios;")
+
+def _importar_filmes_copy(cur, arquivo_filmes):
+    print("Importando dados para 'filmes'...")
+    inicio = time.perf_counter()
+    _copiar_csv(cur, 'staging_filmes', arquivo_filmes)
+    cur.execute("""
+        INSERT INTO filmes (titulo, genero, ano)
+        SELECT titulo, genero, ano::int
+        FROM staging_filmes
+        ORDER BY linha
+        ON CONFLICT (titulo) DO NOTHING;
+    """)
+    _relatar_vazao('filmes', cur.rowcount, inicio)
+    cur.execute("DROP TABLE staging_filmes;")
+
+# Data de criação de uma avaliação da staging: a coluna opcional 'criado_em'
+# do CSV ou, sem ela (ou vazia), o momento da importação
+CRIADO_EM_DA_STAGING = "COALESCE(NULLIF(s.criado_em, '')::timestamptz, now())"
+
+def _criado_em(colunas):
+    return sql.SQL(CRIADO_EM_DA_STAGING if 'criado_em' in colunas else "now()")
+
+# Resolve os IDs das avaliações de uma tabela de staging por JOIN, mantendo a
+# ordem das linhas do arquivo. Avaliações de usuário ou filme desconhecido
+# são descartadas, como nos outros modos.
+INSERIR_AVALIACOES_DA_STAGING = """
+    INSERT INTO avaliacoes (usuario_id, filme_id, nota, criado_em)
+    SELECT u.id, f.id, s.nota::numeric, {criado_em}
+    FROM {tabela} AS s
+    JOIN usuarios AS u ON u.nome_de_usuario = s.nome_de_usuario
+    JOIN filmes AS f ON f.titulo = s.titulo
+    ORDER BY s.linha;
+"""
+
+def importar_dados_copy(conn, arquivo_filmes, arquivo_usuarios, arquivo_avaliacoes):
+    """
+    Importa os CSVs com COPY FROM STDIN para tabelas de staging e, de lá,
+    para as tabelas finais com INSERT ... SELECT. Os IDs de usuário e filme
+    das avaliações são resolvidos por JOIN dentro do banco.
+
+    O resultado é o mesmo de importar_dados(): as linhas são inseridas na
+    ordem dos arquivos, então os IDs gerados pelas sequências coincidem.
+    """
+    print("\nIniciando importação de dados via COPY...")
+    try:
+        with conn.cursor() as cur:
+            _limpar_tabelas(cur)
+            _importar_usuarios_copy(cur, arquivo_usuarios)
+            _importar_filmes_copy(cur, arquivo_filmes)
+
+            print("Importando dados para 'avaliacoes'...")
+            inicio = time.perf_counter()
+            colunas = _copiar_csv(cur, 'staging_avaliacoes', arquivo_avaliacoes)
+            cur.execute(sql.SQL(INSERIR_AVALIACOES_DA_STAGING).format(
+                tabela=sql.Identifier('staging_avaliacoes'), criado_em=_criado_em(colunas),
+            ))
+            _relatar_vazao('avaliacoes', cur.rowcount, inicio)
+
+            cur.execute("DROP TABLE staging_avaliacoes;")
+
+        conn.commit()
+        print("\n🎉 Todas as importações foram concluídas e salvas no banco de dados.")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ ERRO GERAL durante a importação: {e}")
+    finally:
+        if conn and not conn.closed:
+            print("Fechando conexão com o banco de dados.")
+            conn.close()
+
+# --- IMPORTAÇÃO PARALELA EM LOTES ---
+
+COLUNAS_AVALIACOES = ['nome_de_usuario', 'titulo', 'nota', 'criado_em']
+# Tipos explícitos: sem eles o pandas infere os tipos de cada lote
+# separadamente. Como texto, a nota chega ao banco exatamente como está no
+# arquivo e é convertida pelo PostgreSQL, como no modo 'copy'.
+TIPOS_AVALIACOES = {coluna: str for coluna in COLUNAS_AVALIACOES}
+
+def _colunas_do_csv(arquivo_csv):
+    with open(arquivo_csv, newline='', encoding='utf-8') as f:
+        return next(csv.reader(f))
+
+# Conexão de cada processo de importação, aberta por _iniciar_processo_de_importacao()
+_conexao_do_processo = None
+
+def _iniciar_processo_de_importacao():
+    """Abre a conexão e a tabela de staging de um processo de importação."""
+    global _conexao_do_processo
+    # Ctrl+C interrompe só o processo principal, que para de distribuir
+    # lotes e espera os que já estão sendo gravados
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _conexao_do_processo = psycopg2.connect(os.environ["DATABASE_URL"])
+    with _conexao_do_processo.cursor() as cur:
+        # ON COMMIT DELETE ROWS: a staging fica vazia depois de cada lote
+        cur.execute("""
+            CREATE TEMP TABLE staging_lote (
+                linha BIGSERIAL, nome_de_usuario TEXT, titulo TEXT, nota TEXT, criado_em TEXT
+            ) ON COMMIT DELETE ROWS;
+        """)
+    _conexao_do_processo.commit()
+
+def _gravar_lote(arquivo, numero, colunas, dados_csv):
+    """
+    Grava um lote de avaliações (CSV sem cabeçalho, com 'colunas') e o
+    registra em 'importacao_lotes' na mesma transação: ou o lote fica
+    gravado e registrado, ou nada dele fica. Executado nos processos de
+    importação.
+    """
+    conn = _conexao_do_processo
+    try:
+        with conn.cursor() as cur:
+            comando = sql.SQL("COPY staging_lote ({}) FROM STDIN WITH (FORMAT csv)").format(
+                sql.SQL(', ').join(sql.Identifier(c) for c in colunas),
+            )
+            cur.copy_expert(comando.as_string(cur), io.StringIO(dados_csv))
+            cur.execute(sql.SQL(INSERIR_AVALIACOES_DA_STAGING).format(
+                tabela=sql.Identifier('staging_lote'), criado_em=sql.SQL(CRIADO_EM_DA_STAGING),
+            ))
+            inseridas = cur.rowcount
+            cur.execute(
+                "INSERT INTO importacao_lotes (arquivo, lote, linhas) VALUES (%s, %s, %s);",
+                (arquivo, numero, inseridas),
+            )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return numero, inseridas
+
+def _assinatura_do_arquivo(caminho):
+    """Tamanho e data de modificação, para não retomar a importação de um arquivo que mudou."""
+    info = os.stat(caminho)
+    return f"{info.st_size}:{info.st_mtime_ns}"
+
+def _lotes_do_csv(arquivo_csv, colunas, tamanho_lote, concluidos):
+    """
+    Lê 'colunas' do CSV em lotes de 'tamanho_lote' linhas, sem carregá-lo
+    inteiro, e devolve (número, lote em CSV) de cada lote que não está em
+    'concluidos'.
+    """
+    with pd.read_csv(arquivo_csv, usecols=colunas, dtype=TIPOS_AVALIACOES,
+                     keep_default_na=False, chunksize=tamanho_lote) as leitor:
+        for numero, lote in enumerate(leitor):
+            if numero not in concluidos:
+                yield numero, lote.to_csv(index=False, header=False, columns=colunas)
+
+def _gravar_lotes_em_paralelo(arquivo_csv, tamanho_lote, concluidos, processos):
+    """
+    Distribui os lotes entre os processos de importação. No máximo dois
+    lotes por processo ficam em memória (lidos e ainda não gravados), então
+    o uso de memória não depende do tamanho do arquivo. Devolve o número de
+    avaliações inseridas.
+    """
+    arquivo = os.path.basename(arquivo_csv)
+    # 'criado_em' é opcional no arquivo
+    colunas = [c for c in COLUNAS_AVALIACOES if c in _colunas_do_csv(arquivo_csv)]
+    inseridas = 0
+
+    def contar(prontos):
+        total = 0
+        for futuro in prontos:
+            numero, linhas = futuro.result()
+            print(f"  lote {numero}: {linhas} avaliações gravadas.")
+            total += linhas
+        return total
+
+    executor = ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_processo_de_importacao)
+    pendentes = set()
+    try:
+        for numero, dados_csv in _lotes_do_csv(arquivo_csv, colunas, tamanho_lote, concluidos):
+            if len(pendentes) >= 2 * processos:
+                prontos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+                inseridas += contar(prontos)
+            pendentes.add(executor.submit(_gravar_lote, arquivo, numero, colunas, dados_csv))
+        inseridas += contar(wait(pendentes)[0])
+    finally:
+        # Em caso de erro, os lotes que ainda não começaram são descartados;
+        # os que já estão sendo gravados terminam e ficam registrados
+        executor.shutdown(wait=True, cancel_futures=True)
+    return inseridas
+
+def importar_dados_paralelo(conn, arquivo_filmes, arquivo_usuarios, arquivo_avaliacoes,
+                            processos, tamanho_lote, retomar=False):
+    """
+    Importa usuários e filmes com COPY, como importar_dados_copy(), e as
+    avaliações em lotes de 'tamanho_lote' linhas lidos em fluxo do CSV e
+    gravados por 'processos' processos, cada um com sua conexão. Cada lote é
+    uma transação própria.
+
+    Com 'retomar', continua uma importação interrompida: não apaga nada e
+    envia só os lotes que não constam em 'importacao_lotes'. As avaliações
+    de um lote mantêm a ordem do arquivo, mas lotes diferentes são gravados
+    em paralelo, então a ordem dos IDs de 'avaliacoes' entre lotes pode
+    diferir da dos outros modos.
+    """
+    print(f"\nIniciando importação em lotes com {processos} processos...")
+    arquivo = os.path.basename(arquivo_avaliacoes)
+    registrada = False
+    try:
+        with conn.cursor() as cur:
+            if retomar:
+                cur.execute(
+                    "SELECT assinatura, tamanho_lote, concluida_em FROM importacao_arquivos WHERE arquivo = %s;",
+                    (arquivo,),
+                )
+                registro = cur.fetchone()
+                if registro is None:
+                    raise RuntimeError(f"Não há importação em lotes de '{arquivo}' para retomar; rode sem --retomar.")
+                assinatura, tamanho_lote, concluida_em = registro
+                registrada = True
+                if concluida_em is not None:
+                    print(f"✅ A importação de '{arquivo}' já foi concluída em {concluida_em}; nada a retomar.")
+                    return
+                if assinatura != _assinatura_do_arquivo(arquivo_avaliacoes):
+                    raise RuntimeError(f"'{arquivo}' mudou desde a importação interrompida; use --recriar.")
+                cur.execute("SELECT lote FROM importacao_lotes WHERE arquivo = %s;", (arquivo,))
+                concluidos = {linha[0] for linha in cur.fetchall()}
+                print(f"Retomando '{arquivo}': {len(concluidos)} lotes de {tamanho_lote} linhas já gravados.")
+            else:
+                _limpar_tabelas(cur)
+                _importar_usuarios_copy(cur, arquivo_usuarios)
+                _importar_filmes_copy(cur, arquivo_filmes)
+                cur.execute("DELETE FROM importacao_arquivos WHERE arquivo = %s;", (arquivo,))
+                cur.execute(
+                    "INSERT INTO importacao_arquivos (arquivo, assinatura, tamanho_lote) VALUES (%s, %s, %s);",
+                    (arquivo, _assinatura_do_arquivo(arquivo_avaliacoes), tamanho_lote),
+                )
+                concluidos = set()
+        # Usuários e filmes ficam gravados antes de os processos começarem
+        conn.commit()
+        registrada = True
+
+        print(f"Importando dados para 'avaliacoes' em lotes de {tamanho_lote} linhas...")
+        inicio = time.perf_counter()
+        inseridas = _gravar_lotes_em_paralelo(arquivo_avaliacoes, tamanho_lote, concluidos, processos)
+        _relatar_vazao('avaliacoes', inseridas, inicio)
+
+        with conn.cursor() as cur:
+            cur.execute("UPDATE importacao_arquivos SET concluida_em = now() WHERE arquivo = %s;", (arquivo,))
+        conn.commit()
+        print("\n🎉 Todas as importações foram concluídas e salvas no banco de dados.")
+
+    except (Exception, KeyboardInterrupt) as e:
+        conn.rollback()
+        print(f"❌ ERRO GERAL durante a importação: {e!r}")
+        if registrada:
+            print("Os lotes já gravados foram mantidos; rode de novo com --retomar para continuar.")
+    finally:
+        if conn and not conn.closed:
+            print("Fechando conexão com o banco de dados.")
+            conn.close()
+
+# --- IMPORTAÇÃO INCREMENTAL ---
+
+def _aplicar_delta(cur, tabela, consulta_delta, comando):
+    """
+    Materializa em 'delta_<tabela>' as linhas que precisam ser gravadas e
+    só executa 'comando' (que lê de 'delta_<tabela>') se houver alguma.
+    Assim uma tabela sem mudanças não recebe nenhum comando e não tem sua
+    versão (e as ETags da API) alterada. Devolve o número de linhas.
+    """
+    nome = sql.Identifier(f"delta_{tabela}")
+    if not isinstance(consulta_delta, sql.Composable):
+        consulta_delta = sql.SQL(consulta_delta)
+    cur.execute(sql.SQL("CREATE TEMP TABLE {} ON COMMIT DROP AS ").format(nome) + consulta_delta)
+    linhas = cur.rowcount
+    if linhas:
+        cur.execute(sql.SQL(comando).format(nome))
+    return linhas
+
+def importar_dados_incremental(conn, arquivo_filmes, arquivo_usuarios, arquivo_avaliacoes):
+    """
+    Atualiza o banco a partir dos CSVs sem apagar nada:
+
+    - usuários e filmes novos são inseridos e os que mudaram (comparando a
+      linha inteira com a do arquivo) são atualizados; os que não estão no
+      arquivo são mantidos;
+    - avaliações não têm chave, então cada arquivo é tratado como um
+      multiconjunto de (usuário, filme, nota): são inseridas só as
+      ocorrências além das que já existem na tabela. Rodar de novo com o
+      mesmo arquivo não insere nada.
+
+    Tudo acontece em uma transação: enquanto ela não termina, a API continua
+    vendo os dados anteriores, e os resumos são atualizados pelos gatilhos
+    só com o delta.
+    """
+    print("\nIniciando importação incremental...")
+    try:
+        with conn.cursor() as cur:
+            # Impede que duas importações incrementais calculem o mesmo delta
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext('importacao_incremental'));")
+            inicio = time.perf_counter()
+            _copiar_csv(cur, 'staging_usuarios', arquivo_usuarios)
+            _copiar_csv(cur, 'staging_filmes', arquivo_filmes)
+            colunas_avaliacoes = _copiar_csv(cur, 'staging_avaliacoes', arquivo_avaliacoes)
+
+            # Chaves repetidas no arquivo: vale a primeira, como nos outros modos
+            usuarios = _aplicar_delta(cur, 'usuarios', """
+                SELECT s.*
+                FROM (
+                    SELECT DISTINCT ON (nome_de_usuario)
+                        linha, nome_de_usuario, nome, senha, pais, data_de_nascimento::date AS data_de_nascimento
+                    FROM staging_usuarios
+                    ORDER BY nome_de_usuario, linha
+                ) AS s
+                LEFT JOIN usuarios AS u USING (nome_de_usuario)
+                WHERE u.id IS NULL
+                   OR (u.nome, u.senha, u.pais, u.data_de_nascimento)
+                      IS DISTINCT FROM (s.nome, s.senha, s.pais, s.data_de_nascimento)
+            """, """
+                INSERT INTO usuarios AS u (nome_de_usuario, nome, senha, pais, data_de_nascimento)
+                SELECT nome_de_usuario, nome, senha, pais, data_de_nascimento
+                FROM {}
+                ORDER BY linha
+                ON CONFLICT (nome_de_usuario) DO UPDATE SET
+                    nome = EXCLUDED.nome,
+                    senha = EXCLUDED.senha,
+                    pais = EXCLUDED.pais,
+                    data_de_nascimento = EXCLUDED.data_de_nascimento;
+            """)
+            print(f"✅ {usuarios} usuários novos ou alterados.")
+
+            filmes = _aplicar_delta(cur, 'filmes', """
+                SELECT s.*
+                FROM (
+                    SELECT DISTINCT ON (titulo) linha, titulo, genero, ano::int AS ano
+                    FROM staging_filmes
+                    ORDER BY titulo, linha
+                ) AS s
+                LEFT JOIN filmes AS f USING (titulo)
+                WHERE f.id IS NULL OR (f.genero, f.ano) IS DISTINCT FROM (s.genero, s.ano)
+            """, """
+                INSERT INTO filmes AS f (titulo, genero, ano)
+                SELECT titulo, genero, ano
+                FROM {}
+                ORDER BY linha
+                ON CONFLICT (titulo) DO UPDATE SET
+                    genero = EXCLUDED.genero,
+                    ano = EXCLUDED.ano;
+            """)
+            print(f"✅ {filmes} filmes novos ou alterados.")
+
+            # 'ocorrencia' numera as repetições de cada (usuário, filme, nota)
+            # no arquivo; entram as que passam da contagem já gravada.
+            # COALESCE(nota, -1) deixa as notas nulas entrarem na junção.
+            # A data de criação não entra na comparação.
+            avaliacoes = _aplicar_delta(cur, 'avaliacoes', sql.SQL("""
+                SELECT n.linha, n.usuario_id, n.filme_id, n.nota, n.criado_em
+                FROM (
+                    SELECT s.linha, u.id AS usuario_id, f.id AS filme_id, s.nota::numeric(3, 1) AS nota,
+                           {criado_em} AS criado_em,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY u.id, f.id, COALESCE(s.nota::numeric(3, 1), -1) ORDER BY s.linha
+                           ) AS ocorrencia
+                    FROM staging_avaliacoes AS s
+                    JOIN usuarios AS u ON u.nome_de_usuario = s.nome_de_usuario
+                    JOIN filmes AS f ON f.titulo = s.titulo
+                ) AS n
+                LEFT JOIN (
+                    SELECT usuario_id, filme_id, COALESCE(nota, -1) AS nota, COUNT(*) AS existentes
+                    FROM avaliacoes
+                    GROUP BY 1, 2, 3
+                ) AS e ON e.usuario_id = n.usuario_id
+                      AND e.filme_id = n.filme_id
+                      AND e.nota = COALESCE(n.nota, -1)
+                WHERE n.ocorrencia > COALESCE(e.existentes, 0)
+            """).format(criado_em=_criado_em(colunas_avaliacoes)), """
+                INSERT INTO avaliacoes (usuario_id, filme_id, nota, criado_em)
+                SELECT usuario_id, filme_id, nota, criado_em
+                FROM {}
+                ORDER BY linha;
+            """)
+            print(f"✅ {avaliacoes} avaliações novas.")
+
+            cur.execute("DROP TABLE staging_usuarios, staging_filmes, staging_avaliacoes;")
+
+        conn.commit()
+        duracao = time.perf_counter() - inicio
+        print(f"\n🎉 Importação incremental concluída em {duracao:.2f}s.")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ ERRO GERAL durante a importação incremental: {e}")
+        print("Nenhuma alteração foi gravada.")
+    finally:
+        if conn and not conn.closed:
+            print("Fechando conexão com o banco de dados.")
+            conn.close()
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cria o esquema do MovieFlix e importa os CSVs.")
+    parser.add_argument(
+        '--modo', choices=['linhas', 'copy', 'paralelo', 'incremental'],
+        default=os.environ.get("MODO_IMPORTACAO", "linhas"),
+        help="'linhas' insere linha a linha a partir do pandas; 'copy' usa COPY FROM STDIN (indicado para arquivos grandes); "
+             "'paralelo' lê as avaliações em lotes e as grava com vários processos, podendo ser retomado; "
+             "'incremental' grava só o que mudou em relação ao banco, sem apagar dados.",
+    )
+    parser.add_argument(
+        '--processos', type=int,
+        default=int(os.environ.get("PROCESSOS_IMPORTACAO", min(4, os.cpu_count() or 1))),
+        help="Número de processos (e conexões) que gravam os lotes no modo 'paralelo'.",
+    )
+    parser.add_argument(
+        '--tamanho-lote', type=int,
+        default=int(os.environ.get("TAMANHO_LOTE_IMPORTACAO", "50000")),
+        help="Linhas de avaliacoes.csv por lote no modo 'paralelo'.",
+    )
+    parser.add_argument(
+        '--retomar', action='store_true',
+        help="No modo 'paralelo', continua a importação interrompida a partir dos lotes que faltam, sem apagar dados.",
+    )
+    parser.add_argument(
+        '--reconstruir-resumos', action='store_true',
+        help="Apenas recalcula as tabelas de resumo dos relatórios, sem recriar o esquema nem importar dados.",
+    )
+    parser.add_argument(
+        '--migrar', action='store_true',
+        help="Apenas aplica as migrações pendentes do esquema, sem importar dados.",
+    )
+    parser.add_argument(
+        '--recriar', action='store_true',
+        default=os.environ.get("RECRIAR_ESQUEMA", "0") == "1",
+        help="Apaga todas as tabelas, recria o esquema e importa os CSVs de novo.",
+    )
+    parser.add_argument(
+        '--manter-particoes', action='store_true',
+        help="Apenas cria as partições mensais de 'avaliacoes' que faltam e esvazia a partição padrão.",
+    )
+    parser.add_argument(
+        '--desanexar-antes', type=datetime.date.fromisoformat, metavar='AAAA-MM-DD',
+        help="Apenas desanexa (arquiva) as partições de 'avaliacoes' dos meses anteriores a esta data.",
+    )
+    parser.add_argument(
+        '--ate-versao', type=int,
+        help="Aplica as migrações apenas até esta versão.",
+    )
+    args = parser.parse_args()
+    if args.retomar and (args.modo != 'paralelo' or args.recriar):
+        parser.error("--retomar só vale com --modo paralelo e sem --recriar.")
+    if args.processos < 1 or args.tamanho_lote < 1:
+        parser.error("--processos e --tamanho-lote devem ser maiores que zero.")
+
     conn = get_db_connection()
     if conn:
         try:
-            # Carrega os arquivos CSV usando a lógica original
-            print("\nCarregando arquivos CSV para a memória...")
-            df_filmes = pd.read_csv('filmes.csv')
-            df_usuarios = pd.read_csv('usuarios.csv')
-            df_avaliacoes = pd.read_csv('avaliacoes.csv')
-            print("✅ Arquivos CSV carregados.")
+            if args.reconstruir_resumos:
+                reconstruir_resumos(conn)
+                conn.close()
+            elif args.migrar:
+                aplicar_migracoes(conn, args.ate_versao)
+                conn.close()
+            elif args.manter_particoes:
+                manter_particoes(conn)
+                conn.close()
+            elif args.desanexar_antes:
+                desanexar_particoes(conn, args.desanexar_antes)
+                conn.close()
+            else:
+                if args.recriar:
+                    criar_esquema(conn, args.ate_versao)
+                else:
+                    aplicar_migracoes(conn, args.ate_versao)
+
+                if args.retomar:
+                    importar_dados_paralelo(
+                        conn, 'filmes.csv', 'usuarios.csv', 'avaliacoes.csv',
+                        args.processos, args.tamanho_lote, retomar=True,
+                    )
+                elif args.modo == 'incremental':
+                    for arquivo in ('filmes.csv', 'usuarios.csv', 'avaliacoes.csv'):
+                        if not os.path.exists(arquivo):
+                            raise FileNotFoundError(arquivo)
+                    importar_dados_incremental(conn, 'filmes.csv', 'usuarios.csv', 'avaliacoes.csv')
+                elif not args.recriar and banco_tem_dados(conn):
+                    print("\nO banco já contém dados; a importação foi ignorada. Use --recriar para apagar e importar de novo.")
+                    conn.close()
+                    conn = None
+                elif args.modo in ('copy', 'paralelo'):
+                    for arquivo in ('filmes.csv', 'usuarios.csv', 'avaliacoes.csv'):
+                        if not os.path.exists(arquivo):
+                            raise FileNotFoundError(arquivo)
+                    if args.modo == 'copy':
+                        importar_dados_copy(conn, 'filmes.csv', 'usuarios.csv', 'avaliacoes.csv')
+                    else:
+                        importar_dados_paralelo(
+                            conn, 'filmes.csv', 'usuarios.csv', 'avaliacoes.csv',
+                            args.processos, args.tamanho_lote,
+                        )
+                else:
+                    # Carrega os arquivos CSV usando a lógica original
+                    print("\nCarregando arquivos CSV para a memória...")
+                    df_filmes = pd.read_csv('filmes.csv')
+                    df_usuarios = pd.read_csv('usuarios.csv')
+                    df_avaliacoes = pd.read_csv('avaliacoes.csv')
+                    print("✅ Arquivos CSV carregados.")
+
+                    importar_dados(conn, df_filmes, df_usuarios, df_avaliacoes)
 
-            criar_esquema(conn)
-            importar_dados(conn, df_filmes, df_usuarios, df_avaliacoes)
+                if conn is not None:
+                    # As funções de importação fecham a conexão. Avaliações com
+                    # datas de meses sem partição ficaram na partição padrão.
+                    conn = get_db_connection()
+                    if conn:
+                        manter_particoes(conn)
+                        conn.close()
 
         except FileNotFoundError as e:
             print(f"❌ ERRO: Arquivo CSV não encontrado. Verifique o caminho. Erro: {e}")
         except Exception as e:
-            print(f"O processo foi interrompido devido a um erro: {e}")
-
+            print(f"O processo foi interrompido devido a um erro: {e}")
\ No newline at end of file